@@ -0,0 +1,91 @@
+"""
+Measure the throughput of the parallel executor against sequential evaluation.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_executor [--input <input file>]
+                                        [--function <name>] [--rows <n>]
+                                        [--width <n>] [--workers <n> ...]
+                                        [--chunk-rows <n>]
+                                        [--sequential-rows <n>]
+
+A function of the input file (by default, every function of the mtlr example)
+is computed on <rows> random rows of <width> columns:
+    - sequential: its definition is evaluated on each prefix in turn, as an
+      unlifted program would, on the first <sequential-rows> rows only;
+    - vectorized: every row at once, followed by a tree reduction with the
+      join, in a single process;
+    - parallel: the same, over chunks of <chunk-rows> rows on each number of
+      worker processes in <workers>.
+Throughput is reported in rows per second, and the results of the three
+methods are checked against each other.
+"""
+import argparse
+import time
+from typing import List, Callable, Any, Tuple
+
+import numpy as np
+
+from src.executor import DEFAULT_CHUNK_ROWS, compile_function, \
+    evaluate_sequential
+from src.program_loader import load_functions
+
+
+def timed(to_call: Callable[[], Any]) -> Tuple[Any, float]:
+    """Return the result of calling <to_call>, and its wall time in
+    seconds."""
+    start = time.perf_counter()
+    result = to_call()
+    return result, time.perf_counter() - start
+
+
+def bench(funcs: List, name: str, data: np.ndarray, workers: List[int],
+          chunk_rows: int, sequential_rows: int) -> None:
+    """Print the throughput of each method for the function <name>."""
+    func = next(func for func in funcs if func.name == name)
+    if func.param_types[0] != "seq2D":
+        data = data[:, 0]
+    rows = data.shape[0]
+
+    expected, seconds = timed(
+        lambda: evaluate_sequential(func, data[:sequential_rows], funcs))
+    print(f"{name:>8} sequential      {sequential_rows:>9} rows "
+          f"{sequential_rows / seconds:>14,.0f} rows/s")
+    with compile_function(func, funcs, 1, chunk_rows) as single:
+        check, _ = timed(lambda: single.lifted(data[:sequential_rows]))
+        assert str(check) == str(expected), f"{name}: results differ"
+        result, seconds = timed(lambda: single.lifted(data))
+    print(f"{name:>8} vectorized      {rows:>9} rows "
+          f"{rows / seconds:>14,.0f} rows/s")
+    for count in workers:
+        with compile_function(func, funcs, count, chunk_rows) as parallel:
+            # The first call starts the worker processes
+            parallel.lifted(data[:2 * chunk_rows])
+            value, seconds = timed(lambda: parallel.lifted(data))
+        assert str(value) == str(result), f"{name}: results differ"
+        print(f"{name:>8} {count:>2} workers      {rows:>9} rows "
+              f"{rows / seconds:>14,.0f} rows/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--input",
+                        default="examples/mtlr_example/example_input.txt")
+    parser.add_argument("--function", action="append",
+                        help="a function to measure (default: all)")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--width", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--sequential-rows", type=int, default=20_000)
+    args = parser.parse_args()
+
+    funcs = load_functions(args.input)
+    data = np.random.default_rng(0).integers(-100, 101,
+                                             size=(args.rows, args.width))
+    for name in args.function or [func.name for func in funcs]:
+        bench(funcs, name, data, args.workers, args.chunk_rows,
+              args.sequential_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark Function.flatten_data and pp_assoc_requires on synthetic aux DAGs.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_flatten [--depth <n>] [--width <n>]
+
+Two kinds of DAG are built:
+    - deep: a chain of <depth> levels, where each function has two aux
+      functions that both use the function of the previous level, so that
+      aux functions are shared at every level;
+    - wide: a single function with <width> aux functions that all use the
+      same aux function.
+The results are checked against the original implementation, which compared
+every pair of components and emitted a quadratic number of equalities.
+"""
+import argparse
+import time
+from typing import List, Callable
+
+from src.dafny import Dafny, Function, Type
+from src.format import pp_assoc_requires
+
+
+def make_function(name: str, aux: List[Function]) -> Function:
+    """Return a synthetic Function named <name> with the aux functions
+    <aux>."""
+    return Function(name, ["s"], [Dafny.SEQ2D], Type([Type([], Dafny.SEQ)]),
+                    [], [], [], aux, f"{name}Body(s)", ["a", "b"],
+                    f"{name}JoinBody(a, b)")
+
+
+def deep_dag(depth: int) -> Function:
+    """Return the top Function of a chain of <depth> levels, where each level
+    uses the previous level twice, through two different functions."""
+    cur = make_function("F0", [])
+    for i in range(1, depth + 1):
+        left = make_function(f"L{i}", [cur])
+        right = make_function(f"R{i}", [cur])
+        cur = make_function(f"F{i}", [left, right])
+    return cur
+
+
+def wide_dag(width: int) -> Function:
+    """Return a Function with <width> aux functions, which all use the same
+    shared aux function."""
+    shared = make_function("Shared", [])
+    leaf = make_function("Leaf", [shared])
+    return make_function("Top", [make_function(f"A{i}", [leaf])
+                                 for i in range(width)])
+
+
+def reference_flatten(func: Function, prefixes: List[str]) -> dict:
+    """The original, unmemoized implementation of Function.flatten_data."""
+    cur_unlifted = 0
+    data = {f"{'.'.join(prefixes + [str(cur_unlifted)])}": func.name}
+    for i, aux in enumerate(func.aux):
+        cur_unlifted += 1
+        if not aux.aux:
+            data[f"{'.'.join(prefixes + [str(cur_unlifted)])}"] = aux.name
+        else:
+            data.update(reference_flatten(aux, prefixes + [str(i + 1)]))
+    return data
+
+
+def reference_assoc_requires(func: Function) -> str:
+    """The original, quadratic implementation of pp_assoc_requires."""
+    equalities = []
+    data = reference_flatten(func, [])
+    for index_i, name_i in data.items():
+        for index_j, name_j in data.items():
+            if index_i != index_j and index_i < index_j and name_i == name_j:
+                equalities.append(f"a.{index_i} == a.{index_j}")
+    if not equalities:
+        return ""
+    full = f" {Dafny.AND} {(' ' + Dafny.AND + ' ').join(equalities)}"
+    return full + "".join(full.replace("a", name) for name in ["b", "c"])
+
+
+def equal_classes(requires: str) -> set:
+    """Return the set of classes of indices of "a" that the equalities in
+    <requires> say are equal."""
+    classes = {}
+    for equality in requires.split(f" {Dafny.AND} "):
+        if equality.startswith("a."):
+            left, right = equality.split(" == ")
+            merged = classes.get(left, {left}) | classes.get(right, {right})
+            for index in merged:
+                classes[index] = merged
+    return {frozenset(c) for c in classes.values()}
+
+
+def best_time(to_call: Callable, repeat: int = 3) -> float:
+    """Return the best wall time of <repeat> calls to <to_call>, in
+    seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        to_call()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(label: str, func: Function) -> None:
+    """Time the current and original implementations on <func>, check that
+    they agree, and print the results."""
+    components = len(func.flatten_data([]))
+    assert func.flatten_data(["x"]) == reference_flatten(func, ["x"])
+    assert equal_classes(pp_assoc_requires(func)) == \
+        equal_classes(reference_assoc_requires(func))
+    new = best_time(lambda: pp_assoc_requires(func))
+    old = best_time(lambda: reference_assoc_requires(func))
+    print(f"{label:<12} {components:>8} components   "
+          f"current {new * 1000:9.2f} ms   original {old * 1000:9.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depth", type=int, default=9)
+    parser.add_argument("--width", type=int, default=400)
+    args = parser.parse_args()
+    for depth in range(2, args.depth + 1):
+        bench(f"deep {depth}", deep_dag(depth))
+    for width in [args.width // 8, args.width // 4, args.width // 2,
+                  args.width]:
+        bench(f"wide {width}", wide_dag(width))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Compare the verification time of each lemma between the transparent and the
+opaque proof modes.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_hom_modes [<input file> ...]
+                                         [--prelude <file>]
+                                         [--command <command>]
+                                         [--timeout <seconds>]
+                                         [--output <file>]
+
+The proofs of each input file (by default, the examples) are generated in both
+modes, and every lemma is verified separately, as by src/verifier.py. If the
+verifier is not installed, only the size of each lemma and of the declarations
+it depends on is reported.
+"""
+import argparse
+import glob
+import json
+import shlex
+import shutil
+import sys
+from typing import Dict, List, Any, Optional
+
+from src.dafny import Dafny
+from src.declarations import Declaration, get_declarations, \
+    dependency_closure
+from src.program_loader import load_functions
+from src.verifier import DEFAULT_COMMAND, verify_declarations
+
+MODES = {"transparent": False, "opaque": True}
+
+
+def job_bytes(decl: Declaration, by_name: Dict[str, Declaration]) -> int:
+    """Return the size of <decl> and of the declarations it depends on, which
+    are sent to the verifier together."""
+    closure = dependency_closure(decl, by_name)
+    return len(decl.text.encode()) + sum(len(by_name[name].text.encode())
+                                         for name in closure)
+
+
+def bench_input(input_name: str, command: Optional[List[str]], prelude: str,
+                timeout: Optional[float]) -> Dict[str, Any]:
+    """Return the measurements of every lemma generated for <input_name>, in
+    each mode. Lemmas are only verified if <command> is given."""
+    funcs = load_functions(input_name)
+    lemmas: Dict[str, Dict[str, Any]] = {}
+    for mode, opaque in MODES.items():
+        decls = get_declarations(funcs, opaque=opaque)
+        by_name = {decl.name: decl for decl in decls}
+        verdicts = {}
+        if command:
+            verdicts = verify_declarations(decls, None, command, prelude,
+                                           timeout)
+        for decl in decls:
+            if not decl.text.startswith(Dafny.LEM) or not decl.function:
+                continue
+            result = {"job_bytes": job_bytes(decl, by_name)}
+            if decl.name in verdicts:
+                result["status"] = verdicts[decl.name].status
+                result["seconds"] = verdicts[decl.name].elapsed
+            lemmas.setdefault(decl.name, {})[mode] = result
+    return {"input": input_name, "lemmas": lemmas}
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    """Print a table comparing the two modes for every lemma."""
+    columns = list(MODES)
+    print(f"{'lemma':<32}" + "".join(f"{mode:>24}" for mode in columns))
+    for result in results:
+        print(result["input"])
+        for name, modes in result["lemmas"].items():
+            cells = []
+            for mode in columns:
+                values = modes.get(mode, {})
+                if "seconds" in values:
+                    cells.append(f"{values['seconds']:.2f}s "
+                                 f"{values['status']}")
+                else:
+                    cells.append(f"{values.get('job_bytes', 0)} bytes")
+            print(f"  {name:<30}" + "".join(f"{cell:>24}" for cell in cells))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("inputs", nargs="*",
+                        default=sorted(glob.glob(
+                            "examples/*/example_input.txt")))
+    parser.add_argument("--prelude", help="a file with the definitions the "
+                                          "generated code relies on")
+    parser.add_argument("--command", default=" ".join(DEFAULT_COMMAND),
+                        help="the verifier command")
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--output", help="also write the JSON results to "
+                                         "this file")
+    args = parser.parse_args(argv)
+
+    command = shlex.split(args.command)
+    if not shutil.which(command[0]):
+        print(f"{command[0]} was not found; only lemma sizes are reported",
+              file=sys.stderr)
+        command = None
+    prelude = ""
+    if args.prelude:
+        with open(args.prelude, "r") as f:
+            prelude = f.read()
+
+    results = [bench_input(input_name, command, prelude, args.timeout)
+               for input_name in args.inputs]
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"verified": command is not None, "results": results},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Measure how proof generation scales with the shape of the input.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_scaling [--depths <n> ...] [--fanouts <n> ...]
+                                       [--breadths <n> ...] [--repeat <n>]
+                                       [--output <file>] [--compare <file>]
+
+For every combination of depth, fan-out and breadth, a synthetic input file is
+generated (see benchmarks/synthetic.py), and the following are measured
+separately: parsing, construction of the Functions, and each proof component.
+For each stage, the best wall time over <repeat> runs and the peak memory
+allocated are recorded, along with the number of bytes each component
+renders. The results are written as JSON, so that the results of two commits
+can be compared with --compare.
+"""
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Any, Tuple, Optional
+
+from benchmarks.synthetic import generate_spec
+from src.parser import parse_spec
+from src.program_loader import build_functions
+from src.proof_print import all_components
+
+
+def measure(to_call: Callable, repeat: int) -> Tuple[Any, float, int]:
+    """Call <to_call> <repeat> times, and return its result, its best wall
+    time in seconds, and the peak memory it allocated in bytes (measured on a
+    separate call)."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = to_call()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    to_call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def bench_shape(depth: int, fanout: int, breadth: int,
+                repeat: int) -> Dict[str, Any]:
+    """Return the measurements for a synthetic input of the given shape."""
+    text = generate_spec(depth, fanout, breadth)
+    items, parse_time, parse_peak = measure(
+        lambda: list(parse_spec(io.StringIO(text))), repeat)
+    funcs, build_time, build_peak = measure(
+        lambda: build_functions(items, "<synthetic>"), repeat)
+    stages = {"parse": {"seconds": parse_time, "peak_bytes": parse_peak},
+              "build": {"seconds": build_time, "peak_bytes": build_peak}}
+    for component in all_components:
+        results, seconds, peak = measure(
+            lambda: [component(func) for func in funcs], repeat)
+        stages[component.__name__] = {
+            "seconds": seconds, "peak_bytes": peak,
+            "output_bytes": sum(len(result.encode()) for result in results)}
+    return {"depth": depth, "fanout": fanout, "breadth": breadth,
+            "definitions": len(funcs), "input_bytes": len(text.encode()),
+            "max_components": max(len(func.flatten_data([]))
+                                  for func in funcs),
+            "stages": stages}
+
+
+def git_commit() -> str:
+    """Return the current git commit, or the empty string if unknown."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    """Print the relative change in time of every stage of every shape
+    measured in both <old> and <new>."""
+    def key(result: Dict[str, Any]) -> Tuple[int, int, int]:
+        return result["depth"], result["fanout"], result["breadth"]
+
+    old_results = {key(result): result for result in old["results"]}
+    for result in new["results"]:
+        if key(result) not in old_results:
+            continue
+        old_stages = old_results[key(result)]["stages"]
+        changes = []
+        for stage, values in result["stages"].items():
+            if stage in old_stages and old_stages[stage]["seconds"] > 0:
+                ratio = values["seconds"] / old_stages[stage]["seconds"]
+                changes.append(f"{stage} {ratio:.2f}x")
+        print(f"depth {result['depth']} fanout {result['fanout']} "
+              f"breadth {result['breadth']}: {', '.join(changes)}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 2, 4, 6])
+    parser.add_argument("--fanouts", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--breadths", type=int, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the JSON results to this file "
+                                         "instead of standard output")
+    parser.add_argument("--compare", help="compare the results with those of "
+                                          "a previous run")
+    args = parser.parse_args(argv)
+
+    results = []
+    for depth in args.depths:
+        for fanout in args.fanouts:
+            for breadth in args.breadths:
+                results.append(bench_shape(depth, fanout, breadth,
+                                           args.repeat))
+                print(f"depth {depth} fanout {fanout} breadth {breadth} done",
+                      file=sys.stderr)
+    report = {"commit": git_commit(), "python": platform.python_version(),
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Generate synthetic input files with a controllable shape.
+
+A synthetic input has <depth> + 1 levels of <breadth> definitions each. Every
+definition above level 0 has <fanout> aux functions, chosen from the level
+below it, so that aux functions are shared between definitions and the lifted
+tuples grow with both the depth and the fan-out (each tuple has 1 + <fanout>
+elements). Return types alternate between seq<int> and int.
+
+Usage (from the repository root):
+    python -m benchmarks.synthetic [--depth <n>] [--fanout <n>]
+                                   [--breadth <n>] > <input file>
+"""
+import argparse
+from typing import List
+
+
+def function_name(level: int, index: int) -> str:
+    """Return the name of the synthetic function at <index> of <level>."""
+    return f"F{level}x{index}"
+
+
+def aux_names(level: int, index: int, fanout: int, breadth: int) -> List[str]:
+    """Return the names of the aux functions of the synthetic function at
+    <index> of <level>."""
+    if level == 0:
+        return []
+    count = min(fanout, breadth)
+    return [function_name(level - 1, (index + k) % breadth)
+            for k in range(count)]
+
+
+def definition(level: int, index: int, fanout: int, breadth: int) -> str:
+    """Return the text of the definition of the synthetic function at <index>
+    of <level>."""
+    name = function_name(level, index)
+    aux = aux_names(level, index, fanout, breadth)
+    is_seq = (level + index) % 2 == 0
+    return_type = "Dafny.SEQ" if is_seq else "Dafny.INT"
+    own = f"{name}(s[..|s|-1])" + (".0" if aux else "")
+    last = "preSum(s[|s|-1])"
+    if is_seq:
+        body = f"if s == [] then [] else if |s| == 1 then {last} " \
+               f"else vAdd({own}, {last})"
+        join = "vAdd(a.0, b.0)" if aux else "vAdd(a, b)"
+        ensures = f"{{|{name}(s)" + (".0" if aux else "") + "| == width(s)}"
+    else:
+        body = f"if s == [] then 0 else Max({own}, Sum({last}))"
+        join = "Max(a.0, b.0)" if aux else "Max(a, b)"
+        ensures = ""
+    return f"""(definition {name}
+    (type (Dafny.SEQ2D) {return_type})
+    (body (function (s) {{{body}}}))
+    (join (function (a b) {{{join}}}))
+    (decreases ({{|s|}}))
+    (requires ())
+    (ensures ({ensures}))
+    (aux ({' '.join(aux)})))"""
+
+
+def generate_spec(depth: int, fanout: int, breadth: int) -> str:
+    """Return the text of a synthetic input file with <depth> + 1 levels of
+    <breadth> definitions, each with <fanout> aux functions."""
+    names = [function_name(level, index) for level in range(depth + 1)
+             for index in range(breadth)]
+    parts = [f"(functions {' '.join(names)})"]
+    for level in range(depth + 1):
+        for index in range(breadth):
+            parts.append(definition(level, index, fanout, breadth))
+    return "\n".join(parts) + "\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=2)
+    parser.add_argument("--breadth", type=int, default=3)
+    args = parser.parse_args()
+    print(generate_spec(args.depth, args.fanout, args.breadth), end="")
+
+
+if __name__ == "__main__":
+    main()
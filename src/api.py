@@ -0,0 +1,91 @@
+"""
+Generate proofs in memory, without reading or writing files.
+
+    for function, component, text in generate(spec):
+        print(function, component, len(text))
+    proof = generate_text(spec, opaque=True)
+
+The input is either the text of an input file or a list of Functions. The
+fragments of the proof are generated lazily, in the order in which they are
+printed, so callers can stream them, stop early, or ask only for some
+functions or components.
+"""
+from __future__ import annotations
+
+import io
+from typing import List, Callable, Iterator, Optional, Union, Tuple, \
+    TYPE_CHECKING
+
+from src.dafny import Function, NESTED
+from src.format import pp_hom_helpers
+from src.parser import parse_spec
+from src.program_loader import build_functions
+from src.proof_print import get_components, get_preamble
+
+if TYPE_CHECKING:
+    from src.incremental import FragmentCache
+
+# A fragment of a proof: the name of the function it belongs to (empty for
+# the declarations shared by all functions), the name of the component that
+# rendered it, and its text
+Fragment = Tuple[str, str, str]
+
+
+def parse_functions(spec: str, file_name: str = "<spec>",
+                    lifting: str = NESTED) -> List[Function]:
+    """Return the functions defined by <spec>, the text of an input file,
+    lifted with the strategy <lifting>. Raise a ParseError, reported against
+    <file_name>, if <spec> is not valid."""
+    return build_functions(parse_spec(io.StringIO(spec), file_name),
+                           file_name, lifting)
+
+
+def generate(source: Union[str, List[Function]],
+             components: Optional[List[Union[str, Callable]]] = None,
+             functions: Optional[List[str]] = None,
+             predicates: bool = False, opaque: bool = False,
+             lifting: str = NESTED,
+             cache: Optional[FragmentCache] = None) -> Iterator[Fragment]:
+    """Yield the fragments of the proof of <source>, which is either the text
+    of an input file or a list of Functions, in the order in which they are
+    printed. Empty fragments are skipped.
+    <predicates> and <opaque> select the proof components as in
+    get_components, and <lifting> is the lifting strategy used if <source> is
+    text. If <components> is given, only the components in it (given as
+    functions or names) are rendered, and a ValueError is raised if one of
+    them is not a proof component; if <functions> is given, only the
+    functions named in it are rendered. If <cache> is given, fragments are
+    looked up in it instead of being rendered again."""
+    funcs = parse_functions(source, lifting=lifting) \
+        if isinstance(source, str) else source
+    selected = get_components(predicates, opaque)
+    preamble = get_preamble(opaque)
+    if components is not None:
+        names = {component if isinstance(component, str)
+                 else component.__name__ for component in components}
+        known = {component.__name__ for component in selected}
+        known.add(pp_hom_helpers.__name__)
+        if names - known:
+            raise ValueError(f"unknown components: "
+                             f"{', '.join(sorted(names - known))}")
+        selected = [component for component in selected
+                    if component.__name__ in names]
+        if pp_hom_helpers.__name__ not in names:
+            preamble = ""
+    if functions is not None:
+        funcs = [func for func in funcs if func.name in functions]
+
+    if preamble:
+        yield "", pp_hom_helpers.__name__, preamble
+    for component in selected:
+        for func in funcs:
+            text = cache.render(func, component) if cache is not None \
+                else component(func)
+            if text:
+                yield func.name, component.__name__, text
+
+
+def generate_text(source: Union[str, List[Function]], **options) -> str:
+    """Return the proof of <source>, exactly as it would be written to an
+    output file. <options> are passed on to generate."""
+    return "".join(text + "\n\n" for _, _, text in generate(source, **options))
@@ -0,0 +1,222 @@
+"""
+Generate the homomorphism proofs for many input files at once.
+
+Usage:
+    python -m src.batch <directory or manifest> [--manifest <manifest>]
+                        [--workers <n>] [--pattern <input name>]
+                        [--output-name <output name>]
+
+If a directory is given, every file named <pattern> below it is used as an
+input file, and its proof is written to <output name> in the same directory.
+If a manifest (a .json file written by a previous run) is given, every input
+file that has not yet been completed is regenerated, so that an interrupted run
+can be resumed.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Optional, Tuple
+
+from src.program_loader import generate_proof
+
+INPUT_NAME = "example_input.txt"
+OUTPUT_NAME = "output.dfy"
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class BatchResult:
+    """The result of generating the proof for a single input file.
+
+    === Public Attributes ===
+    input_name:
+        The name of the input file.
+    output_name:
+        The name of the output file.
+    error:
+        A description of the error raised while generating the proof, or the
+        empty string if the proof was generated successfully.
+    elapsed:
+        The wall time taken to generate the proof, in seconds.
+    """
+    input_name: str
+    output_name: str
+    error: str
+    elapsed: float
+
+    def __init__(self, input_name: str, output_name: str, error: str,
+                 elapsed: float) -> None:
+        """Initialize this BatchResult with the given information."""
+        self.input_name = input_name
+        self.output_name = output_name
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        """Return whether the proof was generated successfully."""
+        return not self.error
+
+    def __str__(self) -> str:
+        """Return a one-line summary of this BatchResult."""
+        if self.ok:
+            return f"ok      {self.input_name} -> {self.output_name} " \
+                   f"({self.elapsed:.2f}s)"
+        return f"FAILED  {self.input_name}: {self.error}"
+
+
+def find_inputs(directory: str, pattern: str = INPUT_NAME) -> List[str]:
+    """Return the sorted names of all files named <pattern> in <directory>
+    and its subdirectories."""
+    inputs = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        if pattern in files:
+            inputs.append(os.path.join(root, pattern))
+    return sorted(inputs)
+
+
+def make_jobs(inputs: List[str], output_name: str = OUTPUT_NAME) \
+        -> List[Tuple[str, str]]:
+    """Return a list of (<input>, <output>) pairs, where each output file is
+    named <output_name> and placed in the same directory as its input."""
+    return [(name, os.path.join(os.path.dirname(name), output_name))
+            for name in inputs]
+
+
+def read_manifest(manifest_name: str) -> List[Dict[str, str]]:
+    """Return the list of job entries recorded in the manifest
+    <manifest_name>. Each entry has the keys "input", "output", "status"
+    and "error"; an entry without a status (e.g. from an older or hand-edited
+    manifest) is PENDING."""
+    with open(manifest_name, "r") as f:
+        entries = json.load(f)["jobs"]
+    for entry in entries:
+        entry.setdefault("status", PENDING)
+        entry.setdefault("error", "")
+    return entries
+
+
+def write_manifest(manifest_name: str, entries: List[Dict[str, str]]) -> None:
+    """Write <entries> to the manifest <manifest_name>, replacing it
+    atomically so that an interrupted write never corrupts it."""
+    temp_name = f"{manifest_name}.tmp"
+    with open(temp_name, "w") as f:
+        json.dump({"jobs": entries}, f, indent=2)
+        f.write("\n")
+    os.replace(temp_name, manifest_name)
+
+
+def _run_job(input_name: str, output_name: str) -> BatchResult:
+    """Generate the proof for <input_name>, and return the result. Any error
+    is recorded in the result instead of being raised."""
+    start = time.perf_counter()
+    try:
+        generate_proof(input_name, output_name)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    else:
+        error = ""
+    return BatchResult(input_name, output_name, error,
+                       time.perf_counter() - start)
+
+
+def generate_batch(jobs: List[Tuple[str, str]],
+                   manifest_name: Optional[str] = None,
+                   workers: Optional[int] = None) -> List[BatchResult]:
+    """Generate the proof for every (<input>, <output>) pair in <jobs>, using
+    a pool of <workers> processes (by default, one per core), and return the
+    results in the order of <jobs>.
+    If <manifest_name> is given, the status of each job is recorded in that
+    manifest as soon as the job finishes."""
+    entries = [{"input": i, "output": o, "status": PENDING, "error": ""}
+               for i, o in jobs]
+    if manifest_name:
+        write_manifest(manifest_name, entries)
+    return _run_entries(entries, manifest_name, workers)
+
+
+def resume_batch(manifest_name: str, workers: Optional[int] = None) \
+        -> List[BatchResult]:
+    """Generate the proof for every job in the manifest <manifest_name> that
+    has not been completed, and return the results of those jobs."""
+    entries = read_manifest(manifest_name)
+    return _run_entries(entries, manifest_name, workers)
+
+
+def _run_entries(entries: List[Dict[str, str]], manifest_name: Optional[str],
+                 workers: Optional[int]) -> List[BatchResult]:
+    """Run every job in <entries> whose status is not DONE, updating the
+    entries (and the manifest <manifest_name>, if given) as jobs finish."""
+    todo = [i for i, entry in enumerate(entries) if entry.get("status") != DONE]
+    results = {}
+    if not todo:
+        return []
+    workers = min(workers or os.cpu_count() or 1, len(todo))
+
+    def record(index: int, result: BatchResult) -> None:
+        results[index] = result
+        entries[index]["status"] = DONE if result.ok else FAILED
+        entries[index]["error"] = result.error
+        if manifest_name:
+            write_manifest(manifest_name, entries)
+
+    if workers == 1:
+        for i in todo:
+            record(i, _run_job(entries[i]["input"], entries[i]["output"]))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_run_job, entries[i]["input"],
+                                   entries[i]["output"]): i for i in todo}
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+    return [results[i] for i in todo]
+
+
+def print_summary(results: List[BatchResult]) -> None:
+    """Print a line for each result in <results>, followed by the number of
+    successes and failures."""
+    for result in results:
+        print(result)
+    failed = sum(not result.ok for result in results)
+    print(f"{len(results) - failed} succeeded, {failed} failed.")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the batch generator from the command line, and return the exit
+    status."""
+    parser = argparse.ArgumentParser(
+        description="Generate homomorphism proofs for many input files.")
+    parser.add_argument("path", help="a directory of input files, or a "
+                                     "manifest of a previous run to resume")
+    parser.add_argument("--manifest", help="record the progress of the run "
+                                           "in this manifest")
+    parser.add_argument("--workers", type=int, help="number of processes "
+                                                    "(default: one per core)")
+    parser.add_argument("--pattern", default=INPUT_NAME,
+                        help=f"name of the input files "
+                             f"(default: {INPUT_NAME})")
+    parser.add_argument("--output-name", default=OUTPUT_NAME,
+                        help=f"name of the output files "
+                             f"(default: {OUTPUT_NAME})")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.path):
+        jobs = make_jobs(find_inputs(args.path, args.pattern),
+                         args.output_name)
+        results = generate_batch(jobs, args.manifest, args.workers)
+    else:
+        results = resume_batch(args.path, args.workers)
+    print_summary(results)
+    return 1 if any(not result.ok for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Estimate how expensive the proof of each function will be to verify, without
+running the verifier.
+
+Usage:
+    python -m src.cost <input file> [--predicates] [--opaque]
+                       [--lifting nested|flat] [--max-width <n>]
+                       [--max-depth <n>] [--max-sequences <n>]
+                       [--max-equalities <n>] [--max-chain <n>]
+                       [--max-lemma-bytes <n>] [--json <file>]
+
+For each function, the following are reported:
+    - width: the number of ints and sequences in its lifted type;
+    - depth: the nesting depth of its lifted type;
+    - sequences: the number of sequences in its lifted type (the components
+      of get_seq_indices), each of which is sliced by the associativity proof;
+    - equalities: the number of equalities between elements computed by the
+      same aux function that the associativity lemma requires of a, b and c,
+      counted in the clauses rendered by pp_assoc_requires;
+    - chain: the number of lengths the associativity lemma requires to be
+      equal, counted in the clause rendered by pp_seq_requires;
+    - lemma_bytes: the size in bytes of the largest rendered declaration;
+    - the total size in bytes of the declarations rendered by each proof
+      component (Function, Join, JoinAssoc, Hom, ...).
+
+The verification time of the associativity lemma grows quickly with the
+equalities and the length chain, so a function exceeding a limit is likely to
+time out. The command exits with status 1 if any limit is exceeded, and
+generate_proof(cost_limits=...) raises a ProofCostError before any proof is
+written.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import List, Dict, Optional, Any
+
+from src.dafny import Dafny, Function, NESTED, LIFTINGS
+from src.declarations import split_declarations
+from src.format import pp_all_sequences, pp_assoc_requires, pp_seq_requires
+from src.proof_print import component_kind, get_components
+
+# The metrics that can be limited, in the order in which they are reported
+METRICS = ["width", "depth", "sequences", "equalities", "chain",
+           "lemma_bytes"]
+
+# The parameters of the associativity lemma
+_ASSOC_PARAMS = ["a", "b", "c"]
+
+
+class ProofCost:
+    """The estimated cost of the proof of a function.
+
+    === Public Attributes ===
+    name:
+        The name of the function.
+    width:
+        The number of ints and sequences in the lifted type of the function.
+    depth:
+        The nesting depth of the lifted type of the function.
+    sequences:
+        The number of sequences in the lifted type of the function.
+    equalities:
+        The number of equalities required by the associativity lemma.
+    chain:
+        The number of lengths the associativity lemma requires to be equal.
+    declarations:
+        A dictionary mapping the name of each declaration rendered for the
+        function to its size in bytes.
+    rendered:
+        A dictionary mapping each kind of declaration rendered for the
+        function (as in src.proof_print.KINDS) to the total size in bytes of
+        the declarations of that kind.
+    """
+    name: str
+    width: int
+    depth: int
+    sequences: int
+    equalities: int
+    chain: int
+    declarations: Dict[str, int]
+    rendered: Dict[str, int]
+
+    def __init__(self, name: str, width: int, depth: int, sequences: int,
+                 equalities: int, chain: int, declarations: Dict[str, int],
+                 rendered: Dict[str, int]) -> None:
+        """Initialize this ProofCost with the given information."""
+        self.name = name
+        self.width = width
+        self.depth = depth
+        self.sequences = sequences
+        self.equalities = equalities
+        self.chain = chain
+        self.declarations = declarations
+        self.rendered = rendered
+
+    @property
+    def lemma_bytes(self) -> int:
+        """Return the size of the largest rendered declaration, in bytes."""
+        return max(self.declarations.values(), default=0)
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return this ProofCost as a JSON object."""
+        result: Dict[str, Any] = {"name": self.name}
+        result.update((metric, getattr(self, metric)) for metric in METRICS)
+        result["declarations"] = self.declarations
+        result["rendered"] = self.rendered
+        return result
+
+
+class CostLimits:
+    """The largest value of each metric of a ProofCost that is accepted, or
+    None for no limit.
+
+    === Public Attributes ===
+    max_width, max_depth, max_sequences, max_equalities, max_chain,
+    max_lemma_bytes:
+        The limit of each metric in METRICS.
+    """
+    max_width: Optional[int]
+    max_depth: Optional[int]
+    max_sequences: Optional[int]
+    max_equalities: Optional[int]
+    max_chain: Optional[int]
+    max_lemma_bytes: Optional[int]
+
+    def __init__(self, max_width: Optional[int] = None,
+                 max_depth: Optional[int] = None,
+                 max_sequences: Optional[int] = None,
+                 max_equalities: Optional[int] = None,
+                 max_chain: Optional[int] = None,
+                 max_lemma_bytes: Optional[int] = None) -> None:
+        """Initialize these CostLimits with the given information."""
+        self.max_width = max_width
+        self.max_depth = max_depth
+        self.max_sequences = max_sequences
+        self.max_equalities = max_equalities
+        self.max_chain = max_chain
+        self.max_lemma_bytes = max_lemma_bytes
+
+    def violations(self, cost: ProofCost) -> List[str]:
+        """Return a description of each limit exceeded by <cost>."""
+        violations = []
+        for metric in METRICS:
+            limit = getattr(self, f"max_{metric}")
+            value = getattr(cost, metric)
+            if limit is not None and value > limit:
+                violations.append(f"{cost.name}: {metric} {value} exceeds "
+                                  f"{limit}")
+        return violations
+
+
+class ProofCostError(Exception):
+    """The proof of a function is likely to time out.
+
+    === Public Attributes ===
+    violations:
+        A description of each limit exceeded.
+    """
+
+    def __init__(self, violations: List[str]) -> None:
+        """Initialize this ProofCostError with the given information."""
+        super().__init__("\n".join(violations))
+        self.violations = violations
+
+
+def _width(func: Function) -> int:
+    """Return the number of ints and sequences in the lifted type of
+    <func>."""
+    _type = func.lifted_type
+    if _type.is_seq or _type.is_int:
+        return 1
+    return len(_type.get_seq_indices()) + len(_type.get_int_indices())
+
+
+def estimate(func: Function, predicates: bool = False,
+             opaque: bool = False) -> ProofCost:
+    """Return the estimated cost of the proof of <func>, rendered with the
+    components selected by <predicates> and <opaque> (as in
+    get_components)."""
+    declarations: Dict[str, int] = {}
+    rendered: Dict[str, int] = {}
+    for component in get_components(predicates, opaque):
+        kind = component_kind(component.__name__)
+        for decl in split_declarations(component(func)):
+            size = len(decl.text.encode())
+            declarations[decl.name] = size
+            rendered[kind] = rendered.get(kind, 0) + size
+    equalities = [clause for clause in
+                  pp_assoc_requires(func).split(Dafny.AND) if clause.strip()]
+    chain = pp_seq_requires(func, _ASSOC_PARAMS)
+    return ProofCost(func.name, _width(func), func.lifted_type.depth,
+                     len(pp_all_sequences(func, "a")), len(equalities),
+                     len(chain.split(" == ")) if chain else 0, declarations,
+                     rendered)
+
+
+def estimate_costs(funcs: List[Function], predicates: bool = False,
+                   opaque: bool = False) -> List[ProofCost]:
+    """Return the estimated cost of the proof of each function of <funcs>."""
+    return [estimate(func, predicates, opaque) for func in funcs]
+
+
+def require_within_limits(funcs: List[Function], limits: CostLimits,
+                          predicates: bool = False,
+                          opaque: bool = False) -> None:
+    """Raise a ProofCostError if the estimated cost of the proof of a
+    function of <funcs> exceeds one of <limits>."""
+    violations = []
+    for cost in estimate_costs(funcs, predicates, opaque):
+        violations.extend(limits.violations(cost))
+    if violations:
+        raise ProofCostError(violations)
+
+
+def format_report(costs: List[ProofCost]) -> str:
+    """Return a table of <costs>, one function per line, most expensive
+    first (by associativity obligations, then by rendered size)."""
+    kinds = sorted({kind for cost in costs for kind in cost.rendered})
+    lines = [f"{'function':<20}" + "".join(f"{metric:>12}"
+                                           for metric in METRICS)
+             + "".join(f"{kind:>11}" for kind in kinds)]
+    ranked = sorted(costs, key=lambda c: (-c.equalities, -c.chain,
+                                          -sum(c.rendered.values()), c.name))
+    for cost in ranked:
+        lines.append(f"{cost.name:<20}"
+                     + "".join(f"{getattr(cost, metric):>12}"
+                               for metric in METRICS)
+                     + "".join(f"{cost.rendered.get(kind, 0):>11}"
+                               for kind in kinds))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Estimate the cost of the proofs of an input file from the command
+    line, and return the exit status: 1 if a limit is exceeded."""
+    from src.program_loader import load_functions
+
+    parser = argparse.ArgumentParser(
+        description="Estimate the cost of verifying the proof of each "
+                    "function of an input file.")
+    parser.add_argument("input", help="the input file")
+    parser.add_argument("--predicates", action="store_true")
+    parser.add_argument("--opaque", action="store_true")
+    parser.add_argument("--lifting", choices=LIFTINGS, default=NESTED)
+    for metric in METRICS:
+        parser.add_argument(f"--max-{metric.replace('_', '-')}", type=int,
+                            help=f"the largest {metric.replace('_', ' ')} "
+                                 f"accepted")
+    parser.add_argument("--json", help="write the estimates to this file")
+    args = parser.parse_args(argv)
+
+    funcs = load_functions(args.input, args.lifting)
+    costs = estimate_costs(funcs, args.predicates, args.opaque)
+    print(format_report(costs))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([cost.to_json() for cost in costs], f, indent=1)
+            f.write("\n")
+    limits = CostLimits(*(getattr(args, f"max_{metric}")
+                          for metric in METRICS))
+    violations = [violation for cost in costs
+                  for violation in limits.violations(cost)]
+    for violation in violations:
+        print(violation, file=sys.stderr)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,10 @@ Represent a Dafny program in Python.
 """
 from __future__ import annotations
 
-from typing import List, Dict
+import hashlib
+import weakref
+from typing import List, Dict, Optional, Tuple, MutableMapping, Callable, \
+    Collection
 
 
 class Dafny:
@@ -22,6 +25,18 @@ class Dafny:
     AND = "&&"
     ASRT = "assert"
     LEM = "lemma"
+    PRED = "predicate"
+    OPAQUE = "{:opaque}"
+    REVEAL = "reveal"
+
+
+# Lifting strategies: a nested lifted type holds the lifted result of each aux
+# function, so an aux function shared by several aux functions is repeated,
+# while a flat lifted type holds the result of each distinct (transitive) aux
+# function exactly once
+NESTED = "nested"
+FLAT = "flat"
+LIFTINGS = [NESTED, FLAT]
 
 
 class Function:
@@ -46,12 +61,29 @@ class Function:
         A list of the "ensures" statements of the function.
     aux:
         A list of Dafny functions needed for the join of this function.
+    calls:
+        The other functions of the program called by the definition of this
+        function (its body, join, decreases, requires or ensures), which may
+        include aux functions. They are set once every function of the
+        program has been constructed.
     body:
         The body of the (unlifted) Dafny function.
     join_param_names:
         A list of two strings, the names of the join parameters.
     join_body:
         The body of the (unlifted) join for the function.
+    lifting:
+        The lifting strategy of the function, NESTED or FLAT.
+
+    === Private Attributes ===
+    _digest:
+        The cached result of digest(), or None if it has not been computed.
+    _layout:
+        The cached list of (<indexing>, <name>) pairs returned by
+        flatten_data([]), or None if it has not been computed.
+    _lifted_aux:
+        The cached result of get_lifted_aux(), or None if it has not been
+        computed.
     """
     name: str
     param_names: List[str]
@@ -62,15 +94,20 @@ class Function:
     requires: List[str]
     ensures: List[str]
     aux: List[Function]
+    calls: List[Function]
     body: str
     join_param_names: List[str]
     join_body: str
+    lifting: str
+    _digest: Optional[str]
+    _layout: Optional[List[Tuple[str, str]]]
+    _lifted_aux: Optional[List[Function]]
 
     def __init__(self, name: str, param_names: List[str],
                  param_types: List[Type], return_type: Type,
                  decreases: List[str], requires: List[str], ensures: List[str],
                  aux: List[Function], body: str, join_param_names: List[str],
-                 join_body: str) -> None:
+                 join_body: str, lifting: str = NESTED) -> None:
         """Initialize this Function with the given information."""
         self.name = name
         self.param_names = param_names
@@ -80,9 +117,14 @@ class Function:
         self.requires = requires
         self.ensures = ensures
         self.aux = aux
+        self.calls = []
         self.body = body
         self.join_param_names = join_param_names
         self.join_body = join_body
+        self.lifting = lifting
+        self._digest = None
+        self._layout = None
+        self._lifted_aux = None
         self.__set_lifted__type()
 
     def __set_lifted__type(self) -> None:
@@ -90,33 +132,121 @@ class Function:
         # If the function does not need to be lifted
         if not self.aux:
             self.lifted_type = self.return_type
+        elif self.lifting == FLAT:
+            aux_types = [func.return_type for func in self.get_lifted_aux()]
+            self.lifted_type = Type([self.return_type] + aux_types)
         else:
             aux_types = [func.lifted_type for func in self.aux]
             self.lifted_type = Type([self.return_type] + aux_types)
 
+    def get_lifted_aux(self) -> List[Function]:
+        """Return the aux functions whose results follow the result of this
+        Function in its lifted type, in order. With the NESTED strategy, these
+        are the aux functions of this Function; with the FLAT strategy, these
+        are its distinct transitive aux functions, in depth-first order."""
+        if self.lifting != FLAT:
+            return self.aux
+        if self._lifted_aux is None:
+            self._lifted_aux = reachable(self.aux, lambda func: func.aux,
+                                         {self.name})
+        return self._lifted_aux
+
+    def set_calls(self, calls: List[Function]) -> None:
+        """Set the functions called by the definition of this Function to
+        <calls>."""
+        self.calls = calls
+        self._digest = None
+
+    def references(self) -> List[Function]:
+        """Return the aux functions of this Function, followed by the other
+        functions it calls, each once."""
+        return self.aux + [func for func in self.calls
+                           if all(func is not aux for aux in self.aux)]
+
     def flatten_data(self, prefixes: List[str]) -> Dict[str, str]:
         """Return a dictionary of pairs (<indexing>, <name>), where <indexing>
         represents the index into an object of type <self.lifted_type>, and
         <name> is the name of the function computing the corresponding datum.
         <prefixes> are prepended to index properly."""
-        cur_unlifted = 0
-        data = {f"{'.'.join(prefixes + [str(cur_unlifted)])}": self.name}
-        for i, aux in enumerate(self.aux):
-            cur_unlifted += 1
-            # If this aux is not lifted:
-            if not aux.aux:
-                data[f"{'.'.join(prefixes + [str(cur_unlifted)])}"] = aux.name
+        if not prefixes:
+            return dict(self._get_layout())
+        prefix = ".".join(prefixes) + "."
+        return {prefix + index: name for index, name in self._get_layout()}
+
+    def _get_layout(self) -> List[Tuple[str, str]]:
+        """Return the list of (<indexing>, <name>) pairs of flatten_data([]).
+        The list is computed once, reusing the lists of the aux functions."""
+        if self._layout is None:
+            layout = [("0", self.name)]
+            if self.lifting == FLAT:
+                layout.extend((str(i + 1), aux.name)
+                              for i, aux in enumerate(self.get_lifted_aux()))
             else:
-                data.update(aux.flatten_data(prefixes + [str(i + 1)]))
-        return data
+                for i, aux in enumerate(self.aux):
+                    # If this aux is not lifted:
+                    if not aux.aux:
+                        layout.append((str(i + 1), aux.name))
+                    else:
+                        layout.extend((f"{i + 1}.{index}", name)
+                                      for index, name in aux._get_layout())
+            self._layout = layout
+        return self._layout
+
+    def digest(self) -> str:
+        """Return a hash of the definition of this Function, together with
+        the definitions of all of the functions it refers to, directly or
+        not, through aux functions and calls."""
+        if self._digest is None:
+            h = hashlib.sha256()
+            referenced = reachable(self.references(), Function.references,
+                                   {self.name})
+            for func in [self] + sorted(referenced, key=lambda f: f.name):
+                for part in func._definition():
+                    # Prefix each part with its length, so that parts cannot
+                    # run into each other
+                    encoded = part.encode()
+                    h.update(f"{len(encoded)}:".encode() + encoded)
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def _definition(self) -> List[str]:
+        """Return the parts of the definition of this Function, with the
+        names of the functions it refers to."""
+        return [self.name, *self.param_names, *map(str, self.param_types),
+                str(self.return_type), *self.decreases, *self.requires,
+                *self.ensures, self.body, *self.join_param_names,
+                self.join_body, self.lifting, str(len(self.aux)),
+                *(aux.name for aux in self.aux),
+                *(func.name for func in self.calls)]
 
     def __str__(self) -> str:
         """Return a string representation of this Function."""
         if not self.aux:
             return self.name
+        if self.lifting == FLAT:
+            names = [aux.name for aux in self.get_lifted_aux()]
+            return f"({self.name}, {', '.join(names)})"
         return f"({self.name}, {', '.join(str(aux) for aux in self.aux)})"
 
 
+def reachable(roots: List[Function],
+              children: Callable[[Function], List[Function]],
+              exclude: Collection[str] = ()) -> List[Function]:
+    """Return the distinct functions reachable from <roots> (including
+    <roots>) by following <children>, in depth-first preorder, except those
+    named in <exclude>. Functions are distinguished by name."""
+    seen = set(exclude)
+    result = []
+    stack = list(reversed(roots))
+    while stack:
+        func = stack.pop()
+        if func.name not in seen:
+            seen.add(func.name)
+            result.append(func)
+            stack.extend(reversed(children(func)))
+    return result
+
+
 class Variable:
     """A Dafny variable or input parameter.
 
@@ -138,50 +268,113 @@ class Variable:
 class Type:
     """A Dafny type.
 
+    Types are immutable and hash-consed: constructing a Type with the same
+    structure as an existing Type returns the existing instance, so equal
+    Types are identical, and the results of the queries below are computed
+    once per structure.
+
     === Public Attributes ===
-    type:
-        A list of Types, representing a tuple of Dafny types.
+    tuple_type:
+        A tuple of Types, representing a tuple of Dafny types.
     simple_type:
         If this Type is not a tuple of types, this is its type.
     is_seq:
         Indicates whether this Type is a seq<int> or (seq<int>) type
     is_int:
         Indicates whether this Type is an int or (int) type
+    depth:
+        The nesting depth of tuples in this Type; 0 for a simple type or a
+        tuple with a single element of simple type.
+
+    === Private Attributes ===
+    _str:
+        The string representation of this Type.
+    _seq_indices:
+        The result of get_seq_indices().
+    _int_indices:
+        The result of get_int_indices().
+    _interned:
+        A dictionary mapping the structure of each Type in use to its unique
+        instance. It only holds weak references, so a Type that is no longer
+        used is dropped from it.
+
     === Representation Invariants ===
         - tuple_type is empty if and only if simple_type is not empty.
         - is_seq is True if and only if simple_type is equal to "seq<int>"
     """
-    tuple_type: List[Type]
+    __slots__ = ("tuple_type", "simple_type", "is_seq", "is_int", "depth",
+                 "_str", "_seq_indices", "_int_indices", "__weakref__")
+    tuple_type: Tuple[Type, ...]
     simple_type: str
     is_seq: bool
     is_int: bool
+    depth: int
+    _str: str
+    _seq_indices: Tuple[str, ...]
+    _int_indices: Tuple[str, ...]
+    _interned: MutableMapping[Tuple[Tuple[Type, ...], str], Type] = \
+        weakref.WeakValueDictionary()
 
-    def __init__(self, tuple_type: List[Type], simple_type="") -> None:
-        self.tuple_type = tuple_type
+    def __new__(cls, tuple_type: List[Type], simple_type="") -> Type:
+        """Return the unique Type with the given structure."""
+        key = (tuple(tuple_type), simple_type)
+        self = cls._interned.get(key)
+        if self is not None:
+            return self
+        self = super().__new__(cls)
+        self.tuple_type = key[0]
         self.simple_type = simple_type
         self.is_seq = simple_type == Dafny.SEQ or \
                       (len(tuple_type) == 1 and tuple_type[0].is_seq)
         self.is_int = simple_type == Dafny.INT or \
                       (len(tuple_type) == 1 and tuple_type[0].is_int)
+        if len(tuple_type) == 1:
+            self.depth = tuple_type[0].depth
+        else:
+            self.depth = 1 + max((t.depth for t in tuple_type), default=-1)
+        self._str = self._compute_str()
+        self._seq_indices = self._compute_indices(seq=True)
+        self._int_indices = self._compute_indices(seq=False)
+        cls._interned[key] = self
+        return self
+
+    def __reduce__(self) -> Tuple:
+        """Return the arguments needed to reconstruct (and intern) this Type
+        when unpickling."""
+        return Type, (self.tuple_type, self.simple_type)
 
     def __str__(self) -> str:
         """Return the string representation of this Type."""
+        return self._str
+
+    def _compute_str(self) -> str:
+        """Compute the string representation of this Type."""
         if self.simple_type:
             return f"{self.simple_type}"
         elif len(self.tuple_type) == 1:
             return f"{self.tuple_type[0]}"
         return f"({', '.join(map(str, self.tuple_type))})"
 
-    def get_seq_indices(self) -> List[str]:
-        """If <tuple_type> is nonempty, return a list of strings indexing
-        into every sequence in this Type. Otherwise, return an empty list."""
+    def get_seq_indices(self) -> Tuple[str, ...]:
+        """If <tuple_type> is nonempty, return a tuple of strings indexing
+        into every sequence in this Type. Otherwise, return an empty tuple."""
+        return self._seq_indices
+
+    def get_int_indices(self) -> Tuple[str, ...]:
+        """If <tuple_type> is nonempty, return a tuple of strings indexing
+        into every integer in this Type. Otherwise, return an empty tuple."""
+        return self._int_indices
+
+    def _compute_indices(self, seq: bool) -> Tuple[str, ...]:
+        """Compute the strings indexing into every sequence in this Type if
+        <seq> is True, and into every integer otherwise."""
         indices = []
         for i, _type in enumerate(self.tuple_type):
-            # If this Type is a seq<int> type:
-            if _type.is_seq:
+            # If this Type is a leaf of the wanted kind:
+            if _type.is_seq if seq else _type.is_int:
                 indices.append(str(i))
-            # Otherwise, recursively get the indices:
-            elif not _type.is_int:
-                cur_indices = [f"{i}.{idx}" for idx in _type.get_seq_indices()]
-                indices.extend(cur_indices)
-        return indices
+            # Otherwise, reuse the indices of the (already interned) Type:
+            elif not (_type.is_seq or _type.is_int):
+                nested = _type._seq_indices if seq else _type._int_indices
+                indices.extend(f"{i}.{idx}" for idx in nested)
+        return tuple(indices)
@@ -0,0 +1,158 @@
+"""
+Split a generated Dafny program into its top-level declarations.
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Dict, Set
+
+from src.dafny import Function, Dafny
+from src.format import CONCAT_EMPTY, CONCAT_SPLIT
+from src.graph import referenced_names
+from src.proof_print import get_components, get_preamble
+
+# Keywords that begin a top-level declaration
+DECL_KEYWORDS = [Dafny.FUNCTION, Dafny.LEM, Dafny.PRED, "method", "type",
+                 "datatype", "const", "module", "include", "import"]
+
+_DECL_START = re.compile(rf"^(?:{'|'.join(DECL_KEYWORDS)})\b")
+_DECL_NAME = re.compile(r"^\w+\s+(?:\{[^}]*\}\s*)*([\w']+)")
+
+# The component that generates declarations of each form
+_COMPONENT_PATTERNS = [
+    (re.compile(rf"^{Dafny.LEM} Hom(\w+)$"), "pp_hom_proof"),
+    (re.compile(rf"^{Dafny.LEM} (\w+)JoinAssoc$"), "pp_assoc_proof"),
+    (re.compile(rf"^{Dafny.PRED} WellFormed(\w+)$"), "pp_well_formed"),
+    # The helper lemmas are not specific to a function
+    (re.compile(rf"^{Dafny.LEM} ()(?:{CONCAT_EMPTY}|{CONCAT_SPLIT})$"),
+     "pp_hom_helpers"),
+    (re.compile(rf"^{Dafny.FUNCTION} (\w+)Join$"), "pp_lifted_join"),
+    (re.compile(rf"^{Dafny.FUNCTION} (\w+)$"), "pp_lifted_function"),
+]
+
+
+class Declaration:
+    """A top-level declaration of a Dafny program.
+
+    === Public Attributes ===
+    name:
+        The name of the declaration.
+    text:
+        The text of the declaration.
+    function:
+        The name of the function whose proof contains this declaration, or the
+        empty string if the declaration was not generated.
+    component:
+        The name of the proof component that generated this declaration, or
+        the empty string if the declaration was not generated.
+    dependencies:
+        The names of the other declarations referred to by this declaration.
+    """
+    name: str
+    text: str
+    function: str
+    component: str
+    dependencies: List[str]
+
+    def __init__(self, name: str, text: str, function: str = "",
+                 component: str = "") -> None:
+        """Initialize this Declaration with the given information."""
+        self.name = name
+        self.text = text
+        self.function = function
+        self.component = component
+        self.dependencies = []
+
+    def __str__(self) -> str:
+        """Return the name of this Declaration."""
+        return self.name
+
+
+def declaration_name(text: str) -> str:
+    """Return the name of the declaration <text>, or the empty string if it
+    does not have one."""
+    match = _DECL_NAME.match(text)
+    return match.group(1) if match else ""
+
+
+def get_declarations(funcs: List[Function], predicates: bool = False,
+                     opaque: bool = False) -> List[Declaration]:
+    """Return the declarations generated for the functions in <funcs>, in the
+    order in which they are printed, with their dependencies set. <predicates>
+    and <opaque> select the proof components, as in get_components."""
+    decls = []
+    preamble = get_preamble(opaque)
+    if preamble:
+        decls.extend(_classify(Declaration(declaration_name(text), text))
+                     for text in preamble.split("\n\n"))
+    for component in get_components(predicates, opaque):
+        for func in funcs:
+            text = component(func)
+            if text:
+                decls.append(Declaration(declaration_name(text), text,
+                                         func.name, component.__name__))
+    set_dependencies(decls)
+    return decls
+
+
+def split_declarations(text: str) -> List[Declaration]:
+    """Return the top-level declarations of the Dafny program <text>, with
+    their dependencies set. A declaration starts at a line that begins with a
+    declaration keyword, and lasts until the next such line. Comments and
+    blank lines at the end of a declaration are not part of it."""
+    chunks = []
+    cur = []
+    for line in text.split("\n"):
+        if _DECL_START.match(line) and cur:
+            chunks.append(cur)
+            cur = []
+        cur.append(line)
+    chunks.append(cur)
+
+    decls = []
+    for chunk in chunks:
+        while chunk and (not chunk[-1].strip() or
+                         chunk[-1].lstrip().startswith("//")):
+            chunk.pop()
+        if chunk and _DECL_START.match(chunk[0]):
+            decl_text = "\n".join(chunk)
+            decls.append(_classify(Declaration(declaration_name(decl_text),
+                                               decl_text)))
+    set_dependencies(decls)
+    return decls
+
+
+def _classify(decl: Declaration) -> Declaration:
+    """Set the function and component of <decl> from the form of its name, if
+    it has the form of a generated declaration, and return <decl>."""
+    header = f"{decl.text.split(' ', 1)[0]} {decl.name}"
+    for pattern, component in _COMPONENT_PATTERNS:
+        match = pattern.match(header)
+        if match:
+            decl.function = match.group(1)
+            decl.component = component
+            break
+    return decl
+
+
+def set_dependencies(decls: List[Declaration]) -> None:
+    """Set the dependencies of each declaration in <decls> to the other
+    declarations in <decls> whose names appear in its text."""
+    names = {decl.name for decl in decls}
+    for decl in decls:
+        decl.dependencies.extend(name for name in referenced_names(
+            [decl.text], names) if name != decl.name)
+
+
+def dependency_closure(decl: Declaration,
+                       by_name: Dict[str, Declaration]) -> Set[str]:
+    """Return the names of all declarations that <decl> depends on, directly
+    or transitively. <by_name> maps the name of each declaration to it."""
+    closure = set()
+    stack = list(decl.dependencies)
+    while stack:
+        name = stack.pop()
+        if name not in closure and name != decl.name:
+            closure.add(name)
+            stack.extend(by_name[name].dependencies)
+    return closure
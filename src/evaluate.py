@@ -0,0 +1,675 @@
+"""
+Evaluate the functions and joins of input files on batches of inputs.
+
+The bodies and joins of definitions are Dafny expressions. The subset used by
+input files (integer arithmetic and comparisons, if-then-else, tuples and
+their elements, sequence length, indexing, slicing, displays and
+concatenation, and calls) is compiled into Python closures that evaluate an
+expression on a whole batch of inputs at once, with NumPy.
+
+All inputs of a batch have the same shape, so that structural conditions such
+as s == [] or |s| == 1 have the same value for the whole batch, and only one
+branch is evaluated. Conditions on data are evaluated element-wise.
+
+Values are represented as follows, where B is the size of the batch:
+    int:      a Python int (the same for the whole batch), or an array of
+              shape (B,)
+    seq<int>: an array of shape (B, n)
+    seq2D:    an array of shape (B, n, w)
+    tuple:    a Python tuple of values
+    []:       EMPTY, until it is used as a sequence of a known type
+
+Functions that are not defined in the input file, such as vAdd, are looked up
+in HELPERS, which holds NumPy versions of the definitions the examples rely
+on, and can be extended.
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Dict, Callable, Any, Optional, Tuple
+
+import numpy as np
+
+from src.dafny import Function, Dafny
+
+# A value of an expression, as described above
+Value = Any
+# A compiled expression: takes an environment and returns a value
+Compiled = Callable[["_Env"], Value]
+
+
+class EvalError(Exception):
+    """An expression that cannot be evaluated: it uses syntax or a function
+    that is not supported, or violates a precondition."""
+
+
+class _Empty:
+    """The empty sequence display [], whose element type is not known."""
+
+    def __repr__(self) -> str:
+        return "[]"
+
+
+EMPTY = _Empty()
+
+
+def is_sequence(value: Value) -> bool:
+    """Return whether <value> is a sequence."""
+    return value is EMPTY or (isinstance(value, np.ndarray) and value.ndim > 1)
+
+
+def as_sequence(value: Value, size: int, ndim: int = 2) -> np.ndarray:
+    """Return <value>, a sequence, as an array of a batch of <size>, where
+    EMPTY is a sequence of <ndim> - 1 dimensions."""
+    if value is EMPTY:
+        return np.zeros((size, 0) + (0,) * (ndim - 2), dtype=np.int64)
+    if not isinstance(value, np.ndarray) or value.ndim < 2:
+        raise EvalError("expected a sequence")
+    return value
+
+
+def as_batch(value: Value, size: int) -> Value:
+    """Return <value>, with integers and booleans that are the same for the
+    whole batch expanded to arrays of a batch of <size>, and EMPTY to empty
+    sequences of integers."""
+    if isinstance(value, tuple):
+        return tuple(as_batch(element, size) for element in value)
+    if value is EMPTY:
+        return as_sequence(value, size)
+    if isinstance(value, (bool, int, np.integer, np.bool_)):
+        return np.full(size, value)
+    return value
+
+
+def equal(a: Value, b: Value) -> Value:
+    """Return whether <a> and <b> are equal, as a bool if it is the same for
+    the whole batch, or as an array of shape (B,) otherwise."""
+    if isinstance(a, tuple) or isinstance(b, tuple):
+        if not (isinstance(a, tuple) and isinstance(b, tuple)) or \
+                len(a) != len(b):
+            return False
+        result = True
+        for x, y in zip(a, b):
+            result = np.logical_and(result, equal(x, y))
+        return result
+    if a is EMPTY or b is EMPTY:
+        return length(a) == 0 and length(b) == 0
+    if is_sequence(a) or is_sequence(b):
+        if not (is_sequence(a) and is_sequence(b)) or \
+                a.shape[1:] != b.shape[1:]:
+            return False
+        return np.all(a == b, axis=tuple(range(1, a.ndim)))
+    return a == b
+
+
+def length(value: Value) -> int:
+    """Return the length of the sequence <value>."""
+    if value is EMPTY:
+        return 0
+    return as_sequence(value, 0).shape[1]
+
+
+def concat(a: Value, b: Value) -> Value:
+    """Return the concatenation of the sequences <a> and <b>."""
+    if a is EMPTY:
+        return as_sequence(b, 0) if b is not EMPTY else EMPTY
+    if b is EMPTY:
+        return as_sequence(a, 0)
+    a, b = as_sequence(a, 0), as_sequence(b, 0)
+    if a.ndim != b.ndim or a.shape[2:] != b.shape[2:]:
+        raise EvalError("concatenation of sequences of different types")
+    return np.concatenate([a, b], axis=1)
+
+
+def where(condition: np.ndarray, a: Value, b: Value) -> Value:
+    """Return <a> where <condition> holds, and <b> elsewhere."""
+    if isinstance(a, tuple) or isinstance(b, tuple):
+        if not (isinstance(a, tuple) and isinstance(b, tuple)) or \
+                len(a) != len(b):
+            raise EvalError("branches of an if have different types")
+        return tuple(where(condition, x, y) for x, y in zip(a, b))
+    if is_sequence(a) or is_sequence(b):
+        size = condition.shape[0]
+        a, b = as_sequence(a, size), as_sequence(b, size)
+        if a.shape[1:] != b.shape[1:]:
+            raise EvalError("branches of an if have sequences of different "
+                            "lengths")
+        return np.where(condition.reshape((-1,) + (1,) * (a.ndim - 1)), a, b)
+    return np.where(condition, a, b)
+
+
+def _uniform(condition: Value) -> Optional[bool]:
+    """Return <condition> as a bool if it is the same for the whole batch, or
+    None otherwise."""
+    if isinstance(condition, np.ndarray):
+        if condition.all():
+            return True
+        if not condition.any():
+            return False
+        return None
+    return bool(condition)
+
+
+def _index(value: Value) -> int:
+    """Return <value>, which is used as an index, as an int."""
+    if isinstance(value, np.ndarray):
+        if value.size == 0 or not (value == value.flat[0]).all():
+            raise EvalError("indices must be the same for the whole batch")
+        value = value.flat[0]
+    return int(value)
+
+
+def _seq_arguments(size: int, *values: Value) -> List[np.ndarray]:
+    """Return <values>, sequences of integers of the same length, as arrays
+    of a batch of <size>."""
+    arrays = [as_sequence(value, size) for value in values]
+    if any(array.shape[1:] != arrays[0].shape[1:] for array in arrays):
+        raise EvalError("sequences of different lengths")
+    return np.broadcast_arrays(*arrays)
+
+
+def _width(size: int, s: Value) -> int:
+    return 0 if length(s) == 0 else as_sequence(s, size, 3).shape[2]
+
+
+def _zero_seq(size: int, w: Value) -> np.ndarray:
+    w = _index(w)
+    if w < 0:
+        raise EvalError("zeroSeq of a negative length")
+    return np.zeros((size, w), dtype=np.int64)
+
+
+def _max(size: int, x: Value, y: Value) -> Value:
+    return np.maximum(x, y)
+
+
+def _sum(size: int, s: Value) -> np.ndarray:
+    return as_sequence(s, size).sum(axis=1)
+
+
+def _seq_max(size: int, s: Value) -> np.ndarray:
+    return as_sequence(s, size).max(axis=1, initial=0)
+
+
+def _pre_sum(size: int, s: Value) -> np.ndarray:
+    return np.cumsum(as_sequence(s, size), axis=1)
+
+
+def _v_add(size: int, s: Value, t: Value) -> np.ndarray:
+    s, t = _seq_arguments(size, s, t)
+    return s + t
+
+
+def _v_max(size: int, s: Value, r: Value) -> np.ndarray:
+    s, r = _seq_arguments(size, s, r)
+    return (s + r).max(axis=1, initial=0)
+
+
+def _p_max(size: int, s: Value, mc: Value) -> np.ndarray:
+    s, mc = _seq_arguments(size, s, mc)
+    return np.maximum(s, mc)
+
+
+# NumPy versions of the functions the examples define outside of input files.
+# Each is called with the size of the batch, followed by its arguments.
+HELPERS: Dict[str, Callable[..., Value]] = {
+    "width": _width,
+    "zeroSeq": _zero_seq,
+    "Max": _max,
+    "Sum": _sum,
+    "SeqMax": _seq_max,
+    "preSum": _pre_sum,
+    "vAdd": _v_add,
+    "vMax": _v_max,
+    "pMax": _p_max,
+}
+
+
+class _Env:
+    """The environment an expression is evaluated in.
+
+    === Public Attributes ===
+    evaluator:
+        The Evaluator evaluating the expression.
+    size:
+        The size of the batch.
+    names:
+        The values of the variables, by name.
+    """
+    evaluator: Evaluator
+    size: int
+    names: Dict[str, Value]
+
+    def __init__(self, evaluator: Evaluator, size: int,
+                 names: Dict[str, Value]) -> None:
+        """Initialize this _Env with the given information."""
+        self.evaluator = evaluator
+        self.size = size
+        self.names = names
+
+
+# The tokens of expressions: integers, names, tuple element accesses and
+# operators
+_TOKEN = re.compile(r"\s*(?:(\d+)|([A-Za-z_][\w']*)|(\.\d+)|"
+                    r"(\.\.|==|!=|<=|>=|&&|\|\||[-+*<>!|()\[\],]))")
+_KEYWORDS = {"if", "then", "else", "true", "false"}
+_COMPARISONS = {
+    "==": equal,
+    "!=": lambda a, b: np.logical_not(equal(a, b)),
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    """Return the tokens of the expression <text>."""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match:
+            raise EvalError(f"unsupported syntax at '{text[pos:].strip()}'")
+        tokens.append(match.group(match.lastindex))
+        pos = match.end()
+    return tokens
+
+
+class _Compiler:
+    """A recursive descent compiler of expressions into closures.
+
+    === Private Attributes ===
+    _tokens:
+        The tokens of the expression.
+    _pos:
+        The index of the next token in <_tokens>.
+    """
+    _tokens: List[str]
+    _pos: int
+
+    def __init__(self, text: str) -> None:
+        """Initialize this _Compiler for the expression <text>."""
+        self._tokens = _tokenize(text)
+        self._pos = 0
+
+    def compile(self) -> Compiled:
+        """Return the compiled expression."""
+        result = self._expr()
+        if self._peek() is not None:
+            raise EvalError(f"unexpected '{self._peek()}'")
+        return result
+
+    def _peek(self) -> Optional[str]:
+        return self._tokens[self._pos] if self._pos < len(self._tokens) \
+            else None
+
+    def _next(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise EvalError("unexpected end of expression")
+        self._pos += 1
+        return token
+
+    def _expect(self, token: str) -> None:
+        if self._next() != token:
+            raise EvalError(f"expected '{token}'")
+
+    def _expr(self) -> Compiled:
+        if self._peek() != "if":
+            return self._or()
+        self._next()
+        condition = self._expr()
+        self._expect("then")
+        then = self._expr()
+        self._expect("else")
+        otherwise = self._expr()
+
+        def run(env: _Env) -> Value:
+            value = condition(env)
+            uniform = _uniform(value)
+            if uniform is not None:
+                return then(env) if uniform else otherwise(env)
+            return where(value, then(env), otherwise(env))
+        return run
+
+    def _or(self) -> Compiled:
+        return self._logical("||", self._and, True)
+
+    def _and(self) -> Compiled:
+        return self._logical("&&", self._comparison, False)
+
+    def _logical(self, operator: str, operand: Callable[[], Compiled],
+                 short: bool) -> Compiled:
+        """Compile a chain of <operator>, whose value is <short> as soon as
+        one of its operands is."""
+        result = operand()
+        while self._peek() == operator:
+            self._next()
+            left, right = result, operand()
+
+            def run(env: _Env, left=left, right=right) -> Value:
+                a = left(env)
+                if _uniform(a) is short:
+                    return short
+                b = right(env)
+                return np.logical_or(a, b) if short \
+                    else np.logical_and(a, b)
+            result = run
+        return result
+
+    def _comparison(self) -> Compiled:
+        left = self._additive()
+        if self._peek() not in _COMPARISONS:
+            return left
+        compare = _COMPARISONS[self._next()]
+        right = self._additive()
+        return lambda env: compare(left(env), right(env))
+
+    def _additive(self) -> Compiled:
+        result = self._multiplicative()
+        while self._peek() in ("+", "-"):
+            operator = self._next()
+            left, right = result, self._multiplicative()
+            if operator == "+":
+                def run(env: _Env, left=left, right=right) -> Value:
+                    a, b = left(env), right(env)
+                    if is_sequence(a) or is_sequence(b):
+                        return concat(a, b)
+                    return a + b
+            else:
+                def run(env: _Env, left=left, right=right) -> Value:
+                    return left(env) - right(env)
+            result = run
+        return result
+
+    def _multiplicative(self) -> Compiled:
+        result = self._unary()
+        while self._peek() == "*":
+            self._next()
+            left, right = result, self._unary()
+            result = lambda env, left=left, right=right: \
+                left(env) * right(env)
+        return result
+
+    def _unary(self) -> Compiled:
+        if self._peek() == "-":
+            self._next()
+            operand = self._unary()
+            return lambda env: -operand(env)
+        if self._peek() == "!":
+            self._next()
+            operand = self._unary()
+            return lambda env: np.logical_not(operand(env))
+        return self._postfix()
+
+    def _postfix(self) -> Compiled:
+        result = self._primary()
+        while True:
+            token = self._peek()
+            if token is not None and token.startswith("."):
+                element = int(self._next()[1:])
+                result = self._element(result, element)
+            elif token == "[":
+                self._next()
+                result = self._subscript(result)
+            else:
+                return result
+
+    @staticmethod
+    def _element(tuple_value: Compiled, element: int) -> Compiled:
+        def run(env: _Env) -> Value:
+            value = tuple_value(env)
+            if not isinstance(value, tuple) or element >= len(value):
+                raise EvalError(f"no element {element} in a value that is "
+                                f"not a tuple of that size")
+            return value[element]
+        return run
+
+    def _subscript(self, sequence: Compiled) -> Compiled:
+        """Compile an index or a slice of <sequence>, after the '['."""
+        low = None if self._peek() == ".." else self._expr()
+        if self._peek() != "..":
+            self._expect("]")
+
+            def index(env: _Env) -> Value:
+                value = as_sequence(sequence(env), env.size)
+                i = _index(low(env))
+                if not 0 <= i < value.shape[1]:
+                    raise EvalError("index out of range")
+                return value[:, i]
+            return index
+        self._next()
+        high = None if self._peek() == "]" else self._expr()
+        self._expect("]")
+
+        def run(env: _Env) -> Value:
+            value = sequence(env)
+            n = length(value)
+            lo = _index(low(env)) if low else 0
+            hi = _index(high(env)) if high else n
+            if not 0 <= lo <= hi <= n:
+                raise EvalError("slice out of range")
+            return value if value is EMPTY else value[:, lo:hi]
+        return run
+
+    def _primary(self) -> Compiled:
+        token = self._next()
+        if token.isdigit():
+            number = int(token)
+            return lambda env: number
+        if token in ("true", "false"):
+            truth = token == "true"
+            return lambda env: truth
+        if token == "|":
+            operand = self._expr()
+            self._expect("|")
+            return lambda env: length(operand(env))
+        if token == "(":
+            elements = self._list(")")
+            if len(elements) == 1:
+                return elements[0]
+            return lambda env: tuple(element(env) for element in elements)
+        if token == "[":
+            elements = self._list("]")
+            if not elements:
+                return lambda env: EMPTY
+            return lambda env: _display([element(env)
+                                         for element in elements], env.size)
+        if token[0].isalpha() or token[0] == "_":
+            if token in _KEYWORDS:
+                raise EvalError(f"unexpected '{token}'")
+            if self._peek() == "(":
+                self._next()
+                return self._call(token, self._list(")"))
+            return lambda env: _lookup(env, token)
+        raise EvalError(f"unexpected '{token}'")
+
+    def _list(self, close: str) -> List[Compiled]:
+        """Compile a comma-separated list of expressions, up to and
+        including <close>."""
+        elements = []
+        if self._peek() == close:
+            self._next()
+            return elements
+        while True:
+            elements.append(self._expr())
+            token = self._next()
+            if token == close:
+                return elements
+            if token != ",":
+                raise EvalError(f"expected ',' or '{close}'")
+
+    @staticmethod
+    def _call(name: str, arguments: List[Compiled]) -> Compiled:
+        return lambda env: env.evaluator.call(
+            name, [argument(env) for argument in arguments], env.size)
+
+
+def _lookup(env: _Env, name: str) -> Value:
+    """Return the value of the variable <name> in <env>."""
+    if name not in env.names:
+        raise EvalError(f"unknown variable {name}")
+    return env.names[name]
+
+
+def _display(elements: List[Value], size: int) -> np.ndarray:
+    """Return the sequence display of <elements>."""
+    if any(isinstance(element, tuple) for element in elements):
+        raise EvalError("sequences of tuples are not supported")
+    if any(is_sequence(element) for element in elements):
+        elements = [as_sequence(element, size) for element in elements]
+    arrays = np.broadcast_arrays(*(as_batch(element, size)
+                                   for element in elements))
+    return np.stack(arrays, axis=1).astype(np.int64)
+
+
+def compile_expression(text: str) -> Compiled:
+    """Return the expression <text>, compiled. Raise an EvalError if it uses
+    syntax that is not supported."""
+    return _Compiler(text).compile()
+
+
+class Evaluator:
+    """Evaluates the lifted functions and joins of an input file on batches.
+
+    A call to a function of the input file evaluates its lifted version, as
+    in the generated proof: the value of a function with aux functions is the
+    tuple of its own value and the lifted values of its aux functions. Lifted
+    values are always nested, whatever the lifting strategy of the functions.
+
+    === Public Attributes ===
+    functions:
+        The functions of the input file, by name.
+    helpers:
+        The functions defined outside of the input file, as in HELPERS.
+
+    === Private Attributes ===
+    _compiled:
+        The compiled body and join of each function, by name.
+    _memo:
+        The lifted values of the calls of the current evaluation, by function
+        name and argument memory, with the argument (to keep its memory from
+        being reused).
+    """
+    functions: Dict[str, Function]
+    helpers: Dict[str, Callable[..., Value]]
+    _compiled: Dict[str, Tuple[Compiled, Compiled]]
+    _memo: Dict[Tuple, Tuple[np.ndarray, Value]]
+
+    def __init__(self, funcs: List[Function],
+                 helpers: Optional[Dict[str, Callable[..., Value]]] = None) \
+            -> None:
+        """Initialize this Evaluator for <funcs> and their aux functions. The
+        expressions are compiled when they are first evaluated."""
+        self.functions = {}
+        stack = list(funcs)
+        while stack:
+            func = stack.pop()
+            if func.name not in self.functions:
+                self.functions[func.name] = func
+                stack.extend(func.aux)
+        self.helpers = HELPERS if helpers is None else helpers
+        self._compiled = {}
+        self._memo = {}
+
+    def compiled(self, func: Function) -> Tuple[Compiled, Compiled]:
+        """Return the compiled body and join of <func>. Raise an EvalError if
+        one of them uses syntax that is not supported."""
+        if func.name not in self._compiled:
+            if len(func.param_names) != 1 or \
+                    len(func.join_param_names) != 2:
+                raise EvalError(f"{func.name} must have one parameter and a "
+                                f"join of two")
+            self._compiled[func.name] = (compile_expression(func.body),
+                                         compile_expression(func.join_body))
+        return self._compiled[func.name]
+
+    def lifted(self, func: Function, argument: np.ndarray) -> Value:
+        """Return the lifted value of <func> on each input of the batch
+        <argument>."""
+        self._memo = {}
+        try:
+            return self._lifted(func, argument, argument.shape[0])
+        finally:
+            self._memo = {}
+
+    def lifted_by_prefix(self, func: Function, argument: np.ndarray) -> Value:
+        """Return the same value as lifted, evaluating <func> on every prefix
+        of <argument> in turn, shortest first, so that recursive calls on
+        prefixes are always found among the values of earlier calls instead
+        of recursing once per element."""
+        self._memo = {}
+        try:
+            value = None
+            for n in range(argument.shape[1] + 1):
+                value = self._lifted(func, argument[:, :n],
+                                     argument.shape[0])
+            return value
+        finally:
+            self._memo = {}
+
+    def join(self, func: Function, a: Value, b: Value, size: int) -> Value:
+        """Return the lifted join of <func> on each pair of lifted values of
+        the batches <a> and <b>, of <size> inputs."""
+        _, join_body = self.compiled(func)
+        names = dict(zip(func.join_param_names, (a, b)))
+        own = join_body(_Env(self, size, names))
+        if not func.aux:
+            return own
+        if not isinstance(a, tuple) or not isinstance(b, tuple) or \
+                len(a) != len(b) or len(a) != len(func.aux) + 1:
+            raise EvalError(f"the lifted values of {func.name} must be tuples "
+                            f"of {len(func.aux) + 1} values")
+        return (own,) + tuple(self.join(aux, a[i + 1], b[i + 1], size)
+                              for i, aux in enumerate(func.aux))
+
+    def call(self, name: str, arguments: List[Value], size: int) -> Value:
+        """Return the value of the call of the function <name> on
+        <arguments>, in a batch of <size>."""
+        if name in self.functions:
+            if len(arguments) != 1:
+                raise EvalError(f"{name} takes one argument")
+            return self._lifted(self.functions[name], arguments[0], size)
+        if name in self.helpers:
+            return self.helpers[name](size, *arguments)
+        raise EvalError(f"unknown function {name}")
+
+    def _lifted(self, func: Function, argument: Value, size: int) -> Value:
+        """Return the lifted value of <func> on <argument>, using the values
+        of earlier calls on the same argument."""
+        argument = as_sequence(argument, size,
+                               3 if func.param_types[0] == Dafny.SEQ2D else 2)
+        key = (func.name, argument.__array_interface__["data"][0],
+               argument.shape, argument.strides)
+        if key not in self._memo:
+            body, _ = self.compiled(func)
+            own = body(_Env(self, size, {func.param_names[0]: argument}))
+            value = own if not func.aux else \
+                (own,) + tuple(self._lifted(aux, argument, size)
+                               for aux in func.aux)
+            self._memo[key] = (argument, value)
+        return self._memo[key][1]
+
+
+def to_text(value: Value, index: int = 0) -> str:
+    """Return the value of the input at <index> of the batch value <value>,
+    written as a Dafny value."""
+    if isinstance(value, tuple):
+        return f"({', '.join(to_text(element, index) for element in value)})"
+    if value is EMPTY:
+        return "[]"
+    if isinstance(value, np.ndarray):
+        return _item_text(value[index])
+    return _item_text(np.asarray(value))
+
+
+def _item_text(item: np.ndarray) -> str:
+    """Return the value of a single input <item>, written as a Dafny
+    value."""
+    if item.ndim:
+        return f"[{', '.join(_item_text(element) for element in item)}]"
+    if item.dtype == np.bool_:
+        return str(bool(item)).lower()
+    return str(int(item))
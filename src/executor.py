@@ -0,0 +1,301 @@
+"""
+Compute the functions of an input file on large inputs, in parallel.
+
+A function F with a homomorphism proof satisfies F(s + t) == FJoin(F(s), F(t))
+for its lifted version, so F can be computed in any grouping of the rows of
+its input:
+
+    1. the lifted value of every row is computed at once, as a batch of
+       one-row inputs (src.evaluate);
+    2. adjacent values are joined pairwise, each round as a single batch,
+       until one value is left (a tree reduction of log2(rows) rounds);
+    3. large inputs are split into chunks of rows, which are reduced on a
+       pool of worker processes, and the results of the chunks are reduced
+       in the same way.
+
+    with compile_functions(funcs, workers=8) as compiled:
+        value = compiled["Mts"](data)
+
+The functions compiled together share one pool of worker processes, which is
+shut down when the `with` block ends (or by close()).
+
+This relies on the homomorphism: it computes the wrong value for a function
+whose join is wrong, so check the joins first (src.checker).
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Iterator, Mapping
+
+import numpy as np
+
+from src.dafny import Function, Dafny
+from src.evaluate import Evaluator, Value, as_batch
+
+DEFAULT_CHUNK_ROWS = 1 << 18
+# The number of Evaluators kept by each process
+EVALUATOR_CACHE_SIZE = 8
+
+# The most recently used Evaluators of this process, by the digests of their
+# functions, so that worker processes compile each function once
+_evaluators: OrderedDict = OrderedDict()
+
+
+def _evaluator(funcs: List[Function]) -> Evaluator:
+    """Return the Evaluator of <funcs> in this process. Only the
+    EVALUATOR_CACHE_SIZE most recently used Evaluators are kept."""
+    key = tuple(func.digest() for func in funcs)
+    if key in _evaluators:
+        _evaluators.move_to_end(key)
+    else:
+        _evaluators[key] = Evaluator(funcs)
+        if len(_evaluators) > EVALUATOR_CACHE_SIZE:
+            _evaluators.popitem(last=False)
+    return _evaluators[key]
+
+
+def _batch_input(func: Function, data: np.ndarray) -> np.ndarray:
+    """Return <data>, an input of <func> (an array of rows), as a batch of
+    one-row inputs."""
+    if func.param_types[0] == Dafny.SEQ2D:
+        return data.reshape((data.shape[0], 1, data.shape[1]))
+    return data.reshape((data.shape[0], 1))
+
+
+def _slice(value: Value, start: int, stop: int, step: int = 1) -> Value:
+    """Return the inputs from <start> to <stop> of the batch value
+    <value>."""
+    if isinstance(value, tuple):
+        return tuple(_slice(element, start, stop, step) for element in value)
+    return value[start:stop:step]
+
+
+def _concat(a: Value, b: Value) -> Value:
+    """Return the batch values <a> and <b>, one after the other."""
+    if isinstance(a, tuple):
+        return tuple(_concat(x, y) for x, y in zip(a, b))
+    return np.concatenate([a, b])
+
+
+def _unbatch(value: Value) -> Value:
+    """Return the only input of the batch value <value>."""
+    if isinstance(value, tuple):
+        return tuple(_unbatch(element) for element in value)
+    return value[0]
+
+
+def tree_reduce(func: Function, values: Value, size: int,
+                evaluator: Evaluator) -> Value:
+    """Return the join of the <size> lifted values of <func> in the batch
+    <values>, in order, as a batch of size 1, joined with <evaluator>. Each
+    round joins adjacent values as a single batch."""
+    values = as_batch(values, size)
+    while size > 1:
+        half = size // 2
+        joined = as_batch(evaluator.join(func, _slice(values, 0, 2 * half, 2),
+                                         _slice(values, 1, 2 * half, 2),
+                                         half), half)
+        if size % 2:
+            joined = _concat(joined, _slice(values, size - 1, size))
+        values, size = joined, half + size % 2
+    return values
+
+
+def evaluate_chunk(func: Function, data: np.ndarray,
+                   funcs: Optional[List[Function]] = None) -> Value:
+    """Return the lifted value of <func> on <data>, an array of rows, as a
+    batch of size 1, with one batch evaluation of the rows followed by a tree
+    reduction. <funcs> are the functions the body of <func> may call (by
+    default, its aux functions)."""
+    evaluator = _evaluator(funcs or [func])
+    if data.shape[0] == 0:
+        return as_batch(evaluator.lifted(func, data[np.newaxis]), 1)
+    return tree_reduce(func, evaluator.lifted(func, _batch_input(func, data)),
+                       data.shape[0], evaluator)
+
+
+def evaluate_sequential(func: Function, data: np.ndarray,
+                        funcs: Optional[List[Function]] = None) -> Value:
+    """Return the lifted value of <func> on <data>, an array of rows, by
+    evaluating its definition on each prefix of <data> in turn, as an
+    unlifted program would. <funcs> are as in evaluate_chunk."""
+    evaluator = _evaluator(funcs or [func])
+    return _unbatch(as_batch(evaluator.lifted_by_prefix(func,
+                                                        data[np.newaxis]), 1))
+
+
+class WorkerPool:
+    """A pool of worker processes, started on first use.
+
+    === Private Attributes ===
+    _workers:
+        The number of worker processes, or None for one per CPU.
+    _executor:
+        The pool of worker processes, once started.
+    """
+    _workers: Optional[int]
+    _executor: Optional[ProcessPoolExecutor]
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        """Initialize this WorkerPool of <workers> processes (by default, one
+        per CPU), without starting them."""
+        self._workers = workers
+        self._executor = None
+
+    @property
+    def single(self) -> bool:
+        """Return whether this WorkerPool has a single worker, so that work is
+        better done in this process."""
+        return self._workers == 1
+
+    def executor(self) -> ProcessPoolExecutor:
+        """Return the pool of worker processes, starting it if needed."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self._workers)
+        return self._executor
+
+    def close(self) -> None:
+        """Shut down the worker processes, if they were started."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class ParallelFunction:
+    """A function of an input file, computed in parallel over chunks of its
+    input.
+
+    === Public Attributes ===
+    func:
+        The function.
+    functions:
+        The functions the body of <func> may call.
+    chunk_rows:
+        The number of rows of each chunk.
+
+    === Private Attributes ===
+    _pool:
+        The pool of worker processes the chunks are computed on.
+    _owns_pool:
+        Whether <_pool> belongs to this ParallelFunction, rather than being
+        shared with other functions, so that close() shuts it down.
+    """
+    func: Function
+    functions: List[Function]
+    chunk_rows: int
+    _pool: WorkerPool
+    _owns_pool: bool
+
+    def __init__(self, func: Function,
+                 functions: Optional[List[Function]] = None,
+                 workers: Optional[int] = None,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                 pool: Optional[WorkerPool] = None) -> None:
+        """Initialize this ParallelFunction for <func>, which may call
+        <functions> (by default, its aux functions), on the shared <pool>,
+        or, if it is not given, on a pool of its own of <workers> processes
+        (by default, one per CPU)."""
+        self.func = func
+        self.functions = functions or [func]
+        self.chunk_rows = chunk_rows
+        self._owns_pool = pool is None
+        self._pool = pool or WorkerPool(workers)
+
+    def lifted(self, data: np.ndarray) -> Value:
+        """Return the lifted value of the function on <data>, an array of
+        rows. Inputs of at most one chunk are computed in this process."""
+        chunks = [data[start:start + self.chunk_rows]
+                  for start in range(0, data.shape[0], self.chunk_rows)]
+        if len(chunks) <= 1 or self._pool.single:
+            results = [evaluate_chunk(self.func, chunk, self.functions)
+                       for chunk in chunks or [data]]
+        else:
+            results = list(self._pool.executor().map(
+                evaluate_chunk, [self.func] * len(chunks), chunks,
+                [self.functions] * len(chunks)))
+        values = results[0]
+        for result in results[1:]:
+            values = _concat(values, result)
+        return _unbatch(tree_reduce(self.func, values, len(results),
+                                    _evaluator(self.functions)))
+
+    def __call__(self, data: np.ndarray) -> Value:
+        """Return the value of the function on <data>, an array of rows."""
+        value = self.lifted(data)
+        return value[0] if self.func.aux else value
+
+    def close(self) -> None:
+        """Shut down the worker processes, unless the pool is shared."""
+        if self._owns_pool:
+            self._pool.close()
+
+    def __enter__(self) -> ParallelFunction:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class CompiledFunctions(Mapping):
+    """The functions of an input file compiled together, by name, sharing one
+    pool of worker processes.
+
+    === Private Attributes ===
+    _functions:
+        A dictionary mapping the name of each function to it.
+    _pool:
+        The pool of worker processes shared by the functions.
+    """
+    _functions: Dict[str, ParallelFunction]
+    _pool: WorkerPool
+
+    def __init__(self, funcs: List[Function], workers: Optional[int] = None,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS) -> None:
+        """Initialize these CompiledFunctions of <funcs>, each of which may
+        call the others, on a pool of <workers> processes (by default, one per
+        CPU), over chunks of <chunk_rows> rows."""
+        self._pool = WorkerPool(workers)
+        self._functions = {func.name: ParallelFunction(func, funcs,
+                                                       chunk_rows=chunk_rows,
+                                                       pool=self._pool)
+                           for func in funcs}
+
+    def __getitem__(self, name: str) -> ParallelFunction:
+        return self._functions[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._functions)
+
+    def __len__(self) -> int:
+        return len(self._functions)
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        self._pool.close()
+
+    def __enter__(self) -> CompiledFunctions:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def compile_function(func: Function,
+                     functions: Optional[List[Function]] = None,
+                     workers: Optional[int] = None,
+                     chunk_rows: int = DEFAULT_CHUNK_ROWS) -> ParallelFunction:
+    """Return <func>, which may call <functions>, as a callable that
+    computes it in parallel, on a pool of its own of <workers> processes,
+    over chunks of <chunk_rows> rows."""
+    return ParallelFunction(func, functions, workers, chunk_rows)
+
+
+def compile_functions(funcs: List[Function], workers: Optional[int] = None,
+                      chunk_rows: int = DEFAULT_CHUNK_ROWS) \
+        -> CompiledFunctions:
+    """Return each function of <funcs> compiled as with compile_function, by
+    name, sharing one pool of <workers> processes. The pool is shut down
+    when the returned CompiledFunctions are closed, or used as a context
+    manager."""
+    return CompiledFunctions(funcs, workers, chunk_rows)
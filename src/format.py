@@ -3,95 +3,181 @@ Functions to format a homomorphism proof for a given Dafny function.
 """
 from __future__ import annotations
 
-import textwrap
-from typing import List
+import re
+from typing import List, Tuple, Dict, Optional
 
-from src.dafny import Dafny, Function, Type
-
-INDENT_AMOUNT = 4
-
-
-# Line indenting
-def indent(s: str) -> str:
-    return textwrap.indent(s, INDENT_AMOUNT * " ")
+from src.dafny import Dafny, Function, Type, FLAT, reachable
+from src.syntax import Node, Line, Blank, VarDecl, Assert, Call, Block, If, \
+    Declaration, Reveal, render
 
 
 # Function formatting
-def pp_lifted_function(func: Function) -> str:
-    """Return a string corresponding to the lifted version of <func>."""
-    signature = pp_function_signature(func)
-    full = signature
+def pp_lifted_function(func: Function, opaque: bool = False) -> str:
+    """Return a string corresponding to the lifted version of <func>. If
+    <opaque> is True, its definition is hidden from the verifier unless it is
+    revealed."""
+    clauses = []
     if func.decreases:
-        decreases = indent(f"{Dafny.DEC} " + ", ".join(func.decreases))
-        full += f"\n{decreases}"
+        clauses.append(f"{Dafny.DEC} " + ", ".join(func.decreases))
     if func.ensures:
-        ensures = indent(f"{Dafny.ENS} " + ", ".join(func.ensures))
-        full += f"\n{ensures}"
+        clauses.append(f"{Dafny.ENS} " + ", ".join(func.ensures))
     if func.requires:
-        requires = indent(f"{Dafny.REQ} " + ", ".join(func.requires))
-        full += f"\n{requires}"
-    body = indent(pp_function_body(func))
-    return_line = indent(pp_return(func))
-    full += f"\n{{\n{body}\n{return_line}\n}}"
-    return full
+        clauses.append(f"{Dafny.REQ} " + ", ".join(func.requires))
+    body = pp_function_body(func) + [Line(pp_return(func))]
+    return render(Declaration(pp_function_signature(func, opaque), clauses,
+                              Block(body)))
 
 
 def pp_return(func: Function) -> str:
     """Return a string representing the return line of the lifted <func>."""
-    var_list = [f"{func.name}Res"] + [f"{aux.name}Res" for aux in func.aux]
+    var_list = [f"{func.name}Res"] + [f"{aux.name}Res"
+                                      for aux in func.get_lifted_aux()]
     return f"({', '.join(var_list)})"
 
 
-def pp_function_body(func: Function) -> str:
-    """Return a string representing the body of the lifted <func>."""
-    body = f"{Dafny.VAR} {func.name}Res := {func.body};"
+def pp_function_body(func: Function) -> List[Node]:
+    """Return the statements of the body of the lifted <func>, except for the
+    return line."""
+    result = pp_flat_calls(func, func.body) if func.lifting == FLAT \
+        else func.body
+    body = [VarDecl(f"{func.name}Res", result)]
     inputs = pp_function_inputs(func, print_type=False)
-    for aux in func.aux:
-        body += f"\n{Dafny.VAR} {aux.name}Res := {aux.name}({inputs});"
+    for aux in func.get_lifted_aux():
+        # A flat lifted type only holds the result of the aux itself
+        own = ".0" if func.lifting == FLAT and aux.aux else ""
+        body.append(VarDecl(f"{aux.name}Res", f"{aux.name}({inputs}){own}"))
     return body
 
 
+# A call to a function, up to its opening parenthesis
+_CALL = re.compile(r"(?<![\w.'])([A-Za-z_][\w']*)\(")
+# The indices following a call, such as .1.0
+_PATH = re.compile(r"(?:\.\d+)+(?![\w'])")
+
+
+def pp_flat_calls(func: Function, text: str) -> str:
+    """Return the expression <text> of <func>, which has a flat lifted type,
+    with each access to the result of a call to a lifted function rewritten.
+    Like join bodies, bodies index the results of lifted functions as nested
+    lifted types, so each access is resolved to the function whose result it
+    refers to, and replaced by the index of that function in the flat lifted
+    type of the called function."""
+    callees = {cur.name: cur for cur in [func] + func.references()
+               if cur.lifting == FLAT and cur.aux}
+    result = []
+    pos = 0
+    for match in _CALL.finditer(text):
+        if match.start() < pos or match.group(1) not in callees:
+            continue
+        end = _closing_paren(text, match.end())
+        if end is None:
+            break
+        callee = callees[match.group(1)]
+        call = f"{callee.name}(" \
+               f"{pp_flat_calls(func, text[match.end():end])})"
+        path = _PATH.match(text, end + 1)
+        result.append(text[pos:match.start()])
+        if path is None:
+            result.append(call)
+            pos = end + 1
+            continue
+        indices = [int(index) for index in path.group(0).split(".")[1:]]
+        access = _flat_access(callee, callee, call, indices,
+                              _flat_slots(callee))
+        result.append(access or f"{call}{path.group(0)}")
+        pos = path.end()
+    result.append(text[pos:])
+    return "".join(result)
+
+
+def _closing_paren(text: str, start: int) -> Optional[int]:
+    """Return the index of the parenthesis of <text> closing the one opened
+    just before <start>, or None if it is not closed."""
+    depth = 1
+    for i in range(start, len(text)):
+        if text[i] == "(":
+            depth += 1
+        elif text[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def _flat_slots(func: Function) -> Dict[str, int]:
+    """Return a dictionary mapping the name of each function in the flat
+    lifted type of <func> to its index."""
+    return {cur.name: i
+            for i, cur in enumerate([func] + func.get_lifted_aux())}
+
+
+def _flat_access(func: Function, cur: Function, value: str,
+                 indices: List[int], slots: Dict[str, int]) -> Optional[str]:
+    """Return the access at <indices> to a nested lifted value of <cur>,
+    rewritten as an access to <value>, the flat lifted value of <func>, in
+    which <cur> is. <slots> maps the name of each function in the flat lifted
+    type of <func> to its index. Return None if <indices> is out of range."""
+    if cur.aux:
+        target, whole, rest = _resolve_access(cur, indices)
+    else:
+        # The results of an unlifted function are not in a tuple
+        target, whole, rest = cur, False, indices
+    if target is None:
+        return None
+    suffix = "".join(f".{index}" for index in rest)
+    if not whole:
+        return f"{value}.{slots[target.name]}{suffix}"
+    if target is func:
+        return f"{value}{suffix}"
+    # Rebuild the flat lifted value of <target> from its elements
+    elements = [f"{value}.{slots[each.name]}"
+                for each in [target] + target.get_lifted_aux()]
+    return f"({', '.join(elements)}){suffix}"
+
+
 def pp_function_inputs(func: Function, print_type=True) -> str:
     """Return a string representing the inputs to <func>, as they would appear
     in the function's signature. If <print_type> is False, the input types
     are not printed."""
-    input_params = ""
-    for name, _type in zip(func.param_names, func.param_types):
-        if print_type:
-            input_params += f"{name}: {_type}, "
-        else:
-            input_params += f"{name}, "
-    input_params = input_params[:-2]
-    return input_params
+    params = zip(func.param_names, func.param_types)
+    if print_type:
+        return ", ".join(f"{name}: {_type}" for name, _type in params)
+    return ", ".join(name for name, _type in params)
 
 
-def pp_function_signature(func: Function) -> str:
-    """Return a string corresponding to the signature of the lifted <func>."""
+def pp_function_signature(func: Function, opaque: bool = False) -> str:
+    """Return a string corresponding to the signature of the lifted <func>,
+    which is marked opaque if <opaque> is True."""
     input_params = pp_function_inputs(func)
-    signature = f"{Dafny.FUNCTION} {func.name}({input_params}): " \
+    signature = f"{pp_function_keyword(opaque)} {func.name}({input_params}): " \
                 f"{func.lifted_type}"
     return signature
 
 
+def pp_function_keyword(opaque: bool) -> str:
+    """Return the keyword that starts a function declaration, followed by the
+    opaque attribute if <opaque> is True."""
+    return f"{Dafny.FUNCTION} {Dafny.OPAQUE}" if opaque else Dafny.FUNCTION
+
+
 # Join formatting
-def pp_lifted_join(func: Function) -> str:
-    """Return a string corresponding to the lifted join of <func>."""
-    signature = pp_join_signature(func)
+def pp_lifted_join(func: Function, opaque: bool = False) -> str:
+    """Return a string corresponding to the lifted join of <func>. If <opaque>
+    is True, its definition is hidden from the verifier unless it is
+    revealed."""
     requires = pp_seq_requires(func, ["a", "b"])
-    body = indent(pp_join_body(func))
-    full = signature
-    return_line = indent(pp_return(func))
-    if requires:
-        full += indent(f"\n{Dafny.REQ} {requires}")
-    full += f"\n{{\n{body}\n{return_line}\n}}"
-    return full
+    clauses = [f"{Dafny.REQ} {requires}"] if requires else []
+    body = pp_join_body(func) + [Line(pp_return(func))]
+    return render(Declaration(pp_join_signature(func, opaque), clauses,
+                              Block(body)))
 
 
-def pp_join_signature(func: Function) -> str:
-    """Return the join signature for <func>."""
+def pp_join_signature(func: Function, opaque: bool = False) -> str:
+    """Return the join signature for <func>, which is marked opaque if
+    <opaque> is True."""
     _type = func.lifted_type
     a, b = func.join_param_names
-    return f"{Dafny.FUNCTION} {func.name}Join({a}: {_type}, " \
+    return f"{pp_function_keyword(opaque)} {func.name}Join({a}: {_type}, " \
            f"{b}: {_type}): {_type}"
 
 
@@ -112,42 +198,129 @@ def pp_all_sequences(func: Function, name: str) -> List[str]:
 def pp_seq_requires(func: Function, names: List[str]) -> str:
     """Return a string representing the preconditions for the join/associativity
     lemma of <func>, for the parameter names in <names>"""
-    requires = ""
     sequences = []
     for name in names:
         sequences.extend(pp_all_sequences(func, name))
-    requires += " == ".join(f"|{seq}|" for seq in sequences)
-    return requires
+    return " == ".join(f"|{seq}|" for seq in sequences)
 
 
-def pp_join_body(func: Function) -> str:
-    """Return a string representing the join body for <func>."""
-    body = f"{Dafny.VAR} {func.name}Res := {func.join_body};"
+def pp_join_body(func: Function) -> List[Node]:
+    """Return the statements of the join body for <func>, except for the
+    return line."""
+    if func.lifting == FLAT and func.aux:
+        return pp_flat_join_body(func)
+    body = [VarDecl(f"{func.name}Res", func.join_body)]
     a, b = func.join_param_names
     for i, aux in enumerate(func.aux):
-        body += f"\n{Dafny.VAR} {aux.name}Res := " \
-                f"{aux.name}Join({a}.{i + 1}, {b}.{i + 1});"
+        body.append(VarDecl(f"{aux.name}Res",
+                            f"{aux.name}Join({a}.{i + 1}, {b}.{i + 1})"))
     return body
 
 
+def pp_flat_join_body(func: Function) -> List[Node]:
+    """Return the statements of the join body for <func>, which has a flat
+    lifted type, except for the return line. The join of each lifted aux is
+    inlined, as it has no tuple of its own to be called on."""
+    slots = _flat_slots(func)
+    return [VarDecl(f"{cur.name}Res",
+                    pp_flat_join_expr(func, cur, slots))
+            for cur in [func] + func.get_lifted_aux()]
+
+
+# An access to the elements of a join parameter, such as a.1.0
+_ACCESS = re.compile(r"(?<![\w.'])([A-Za-z_][\w']*)((?:\.\d+)*)(?![\w'])")
+
+
+def pp_flat_join_expr(func: Function, cur: Function,
+                      slots: Dict[str, int]) -> str:
+    """Return the join body of <cur>, rewritten as an expression on the join
+    parameters of <func>, which has a flat lifted type. <slots> maps the name
+    of each function in the lifted type of <func> to its index.
+    Join bodies index their parameters as nested lifted types, so each access
+    is resolved to the function whose result it refers to, and replaced by
+    the index of that function in the flat lifted type."""
+    params = dict(zip(cur.join_param_names, func.join_param_names))
+
+    def replace(match: re.Match) -> str:
+        name, path = match.group(1), match.group(2)
+        if name not in params:
+            return match.group(0)
+        indices = [int(index) for index in path.split(".")[1:]]
+        access = _flat_access(func, cur, params[name], indices, slots)
+        return access or match.group(0)
+
+    return _ACCESS.sub(replace, cur.join_body)
+
+
+def _resolve_access(func: Function, indices: List[int]) \
+        -> Tuple[Optional[Function], bool, List[int]]:
+    """Return the function whose result is at <indices> in a nested lifted
+    value of <func>, whether the whole lifted value of that function is
+    meant (rather than only its own result), and the remaining indices.
+    Return None as the function if <indices> is out of range."""
+    while indices:
+        index, indices = indices[0], indices[1:]
+        if index == 0:
+            return func, False, indices
+        if index > len(func.aux):
+            return None, False, indices
+        func = func.aux[index - 1]
+        if not func.aux:
+            return func, False, indices
+    return func, bool(func.aux), indices
+
+
 # Associativity formatting
+def pp_assoc_equalities(func: Function, name: str) -> List[str]:
+    """Return a list of strings representing that two elements of the
+    parameter <name> are identically equal, as required by the associativity
+    proof of <func>. Elements computed by the same function are chained
+    together, so that the number of equalities is linear in the number of
+    elements."""
+    equalities = []
+    data = func.flatten_data([])
+    # Map each index to the next index computed by the same function
+    last = {}
+    following = {}
+    for index, aux_name in data.items():
+        if aux_name in last:
+            following[last[aux_name]] = index
+        last[aux_name] = index
+    for index_i in data:
+        if index_i in following:
+            equalities.append(f"{name}.{index_i} == "
+                              f"{name}.{following[index_i]}")
+    return equalities
+
+
 def pp_assoc_requires(func: Function) -> str:
     """Return a string representation of the part of the precondition that is
-    specific to the associativity proof; namely, a list of strings representing
-    that two elements of an argument are identically equal, all joined by
-    conjunction."""
+    specific to the associativity proof; namely, the equalities of
+    pp_assoc_equalities for each parameter, all joined by conjunction."""
     equalities = []
-    data = func.flatten_data([])
-    for index_i, name_i in data.items():
-        for index_j, name_j in data.items():
-            if index_i != index_j and index_i < index_j and name_i == name_j:
-                equalities.append(f"a.{index_i} == a.{index_j}")
+    for name in ["a", "b", "c"]:
+        equalities.extend(pp_assoc_equalities(func, name))
     if not equalities:
         return ""
-    else:
-        full = f" {Dafny.AND} {(' ' + Dafny.AND + ' ').join(equalities)}"
-        # The preconditions are symmetric with respect to parameter name
-        return full + "".join(full.replace("a", name) for name in ["b", "c"])
+    return f" {Dafny.AND} " + f" {Dafny.AND} ".join(equalities)
+
+
+def pp_well_formed_name(func: Function) -> str:
+    """Return the name of the predicate stating that a value of the lifted
+    type of <func> satisfies the equalities of pp_assoc_equalities."""
+    return f"WellFormed{func.name}"
+
+
+def pp_well_formed(func: Function) -> str:
+    """Return a string corresponding to the predicate named by
+    pp_well_formed_name, or the empty string if <func> does not need one."""
+    equalities = pp_assoc_equalities(func, "x")
+    if not func.lifted_type.get_seq_indices() or not equalities:
+        return ""
+    signature = f"{Dafny.PRED} {pp_well_formed_name(func)}" \
+                f"(x: {func.lifted_type})"
+    body = Line(f" {Dafny.AND} ".join(equalities))
+    return render(Declaration(signature, [], Block([body])))
 
 
 def pp_assoc_ensures(func: Function) -> str:
@@ -162,12 +335,10 @@ def pp_assoc_ensures(func: Function) -> str:
 def pp_assoc_decreases(func: Function) -> str:
     """Return a string representation of the "decreases" measure of the
     associativity lemma for <func>."""
-    decreases = f"{Dafny.DEC} "
     sequences = []
     for name in ['a', 'b', 'c']:
         sequences.extend(pp_all_sequences(func, name))
-    decreases += ", ".join(f"|{seq}|" for seq in sequences)
-    return decreases
+    return f"{Dafny.DEC} " + ", ".join(f"|{seq}|" for seq in sequences)
 
 
 def pp_assoc_signature(func: Function) -> str:
@@ -178,34 +349,31 @@ def pp_assoc_signature(func: Function) -> str:
            f"(a: {_type}, b: {_type}, c: {_type})"
 
 
-def pp_assoc_base_case() -> str:
-    """Return a string representation of the base case of the associativity
-    lemma."""
-    return f"{Dafny.IF} n == 0 {{}}\n" \
-           f"{Dafny.ELSEIF} n == 1 {{}}"
+def pp_assoc_base_case() -> List[Tuple[str, Block]]:
+    """Return the branches of the base case of the associativity lemma."""
+    return [("n == 0", Block([], inline=True)),
+            ("n == 1", Block([], inline=True))]
 
 
-def pp_assoc_slices(func: Function, name: str) -> str:
-    """Return a string representation of variable declarations corresponding
-    to slices of all sequences in the parameter <name>."""
-    sequences = pp_all_sequences(func, name)
-    slices = ""
-    for seq in sequences:
+def pp_assoc_slices(func: Function, name: str) -> List[Node]:
+    """Return the variable declarations corresponding to slices of all
+    sequences in the parameter <name>."""
+    slices = []
+    for seq in pp_all_sequences(func, name):
         # Remove all periods from the slice name
         slice_name = seq.replace(".", "") + "'"
-        slices += f"{Dafny.VAR} {slice_name} := {seq}[..n-1];\n"
+        slices.append(VarDecl(slice_name, f"{seq}[..n-1]"))
     return slices
 
 
-def pp_assoc_finals(func: Function, name: str) -> str:
-    """Return a string representation of variable declarations corresponding
-    to the final element of all sequences in the parameter <name>."""
-    sequences = pp_all_sequences(func, name)
-    finals = ""
-    for seq in sequences:
+def pp_assoc_finals(func: Function, name: str) -> List[Node]:
+    """Return the variable declarations corresponding to the final element of
+    all sequences in the parameter <name>."""
+    finals = []
+    for seq in pp_all_sequences(func, name):
         # Remove all periods from the slice name
         final_name = seq.replace(".", "") + "f"
-        finals += f"{Dafny.VAR} {final_name} := [{seq}[n-1]];\n"
+        finals.append(VarDecl(final_name, f"[{seq}[n-1]]"))
     return finals
 
 
@@ -232,60 +400,91 @@ def pp_assoc_construct(_type: Type, name: str, prefixes: List[str],
         return f"({', '.join(results)})"
 
 
-def pp_assoc_recursive_call(func: Function, suffix: str) -> str:
-    """Return a string representation of the recursive call used in the
-    induction step of the associativity proof. <suffix> is "'" if we recurse on
-    sequence slices, and "f" if we recurse on final elements of sequences."""
+def pp_assoc_recursive_call(func: Function, suffix: str) -> Call:
+    """Return the recursive call used in the induction step of the
+    associativity proof. <suffix> is "'" if we recurse on sequence slices, and
+    "f" if we recurse on final elements of sequences."""
     result = f"({pp_assoc_construct(func.lifted_type, 'a', ['a'], suffix)})"
     # The construction is symmetric with respect to parameter name
     results = [result] + [result.replace("a", name) for name in ["b", "c"]]
-    return f"{func.name}JoinAssoc({', '.join(results)});\n"
+    return Call(f"{func.name}JoinAssoc", results)
 
 
-def pp_assoc_induction(func: Function) -> str:
-    """Return a string representation of the induction step of the associativity
-    lemma for <func>."""
-    induct = f"{Dafny.ELSE}\n{{\n"
+def pp_assoc_induction(func: Function) -> Block:
+    """Return the block of the induction step of the associativity lemma for
+    <func>."""
+    induct = []
     # Declare slices
     for name in ["a", "b", "c"]:
-        induct += indent(pp_assoc_slices(func, name))
-    induct += indent(pp_assoc_recursive_call(func, "'") + "\n")
+        induct.extend(pp_assoc_slices(func, name))
+    induct.extend([pp_assoc_recursive_call(func, "'"), Blank()])
     for name in ["a", "b", "c"]:
-        induct += indent(pp_assoc_finals(func, name))
-    induct += indent(pp_assoc_recursive_call(func, "f"))
-    return induct + "}\n"
-
-
-def pp_assoc_proof(func: Function) -> str:
-    """Return a string representation of the associativity lemma for <func>."""
+        induct.extend(pp_assoc_finals(func, name))
+    induct.append(pp_assoc_recursive_call(func, "f"))
+    return Block(induct)
+
+
+def pp_assoc_proof(func: Function, predicates: bool = False,
+                   opaque: bool = False) -> str:
+    """Return a string representation of the associativity lemma for <func>.
+    If <predicates> is True, the equalities between elements of the arguments
+    are required through the predicate of pp_well_formed instead of being
+    inlined. If <opaque> is True, the joins are opaque, and the lemma reveals
+    the joins it needs."""
     signature = pp_assoc_signature(func)
-    ensures = indent(pp_assoc_ensures(func))
+    ensures = pp_assoc_ensures(func)
+    reveal = [Reveal(pp_reveal_names(func, functions=False))] if opaque else []
     # If the function does not return any sequence:
     if not func.lifted_type.get_seq_indices():
-        return f"{signature}\n{ensures}\n{{\n}}"
-    decreases = indent(pp_assoc_decreases(func))
-    requires = indent(f"{Dafny.REQ} {pp_seq_requires(func, ['a', 'b', 'c'])}"
-                      f" {pp_assoc_requires(func)}")
-    base = indent(pp_assoc_base_case())
-    induct = indent(pp_assoc_induction(func))
+        return render(Declaration(signature, [ensures], Block(reveal)))
+    requires = f"{Dafny.REQ} {pp_seq_requires(func, ['a', 'b', 'c'])}"
+    if not predicates:
+        requires += f" {pp_assoc_requires(func)}"
+    elif pp_assoc_equalities(func, "a"):
+        well_formed = pp_well_formed_name(func)
+        requires += "".join(f" {Dafny.AND} {well_formed}({name})"
+                            for name in ["a", "b", "c"])
     sequences = pp_all_sequences(func, "a")
-    n_declaration = indent(f"{Dafny.VAR} n := |{sequences[0]}|;")
-    return f"{signature}\n{decreases}\n{requires}\n{ensures}\n" \
-           f"{{\n{n_declaration}\n{base}\n{induct}}}"
+    body = reveal + [VarDecl("n", f"|{sequences[0]}|"),
+                     If(pp_assoc_base_case(), pp_assoc_induction(func))]
+    return render(Declaration(signature,
+                              [pp_assoc_decreases(func), requires, ensures],
+                              Block(body)))
+
+
+def pp_reveal_names(func: Function, functions: bool = True) -> List[str]:
+    """Return the names of the opaque declarations the proofs of <func>
+    unfold: the join of <func> and of its aux functions, directly or not,
+    which are the only joins its join refers to, and if <functions> is True,
+    the lifted functions <func> refers to, directly or not, through aux
+    functions and calls in its body and join. The join of a function that is
+    only called is never unfolded, so it is not revealed."""
+    joined = {cur.name for cur in reachable([func], lambda cur: cur.aux)}
+    names = []
+    for cur in reachable([func], Function.references):
+        if functions:
+            names.append(cur.name)
+        if cur.name in joined:
+            names.append(f"{cur.name}Join")
+    return names
 
 
 # Homomorphism proof formatting
-def pp_hom_proof(func: Function) -> str:
+def pp_hom_proof(func: Function, opaque: bool = False) -> str:
     """Return a string corresponding to the homomorphism proof of the
-    Dafny function <func>."""
-    signature = pp_hom_signature(func)
-    requires = indent(pp_hom_requires(func))
-    ensures = indent(pp_hom_ensures(func))
-    base = indent(pp_hom_base_cases())
-    induct = indent(pp_hom_induction(func))
-    if requires:
-        return f"{signature}\n{requires}\n{ensures}\n{{\n{base}\n{induct}\n}}"
-    return f"{signature}\n{ensures}\n{{\n{base}\n{induct}\n}}"
+    Dafny function <func>. If <opaque> is True, the lifted functions and joins
+    are opaque: the proof reveals the ones it needs, and proves the facts
+    about sequence concatenation it relies on with the lemmas of
+    pp_hom_helpers."""
+    requires = pp_hom_requires(func)
+    clauses = [requires] if requires else []
+    clauses.append(pp_hom_ensures(func))
+    if opaque:
+        body = [Reveal(pp_reveal_names(func)),
+                If(pp_hom_helper_base_cases(), pp_hom_induction(func, True))]
+    else:
+        body = [If(pp_hom_base_cases(), pp_hom_induction(func))]
+    return render(Declaration(pp_hom_signature(func), clauses, Block(body)))
 
 
 def pp_hom_signature(func: Function) -> str:
@@ -310,24 +509,51 @@ def pp_hom_ensures(func: Function) -> str:
            f"{func.name}Join({func.name}(s), {func.name}(t))"
 
 
-def pp_hom_base_cases() -> str:
-    """Return a string corresponding to the empty and singleton base cases
-    of a homomorphism proof."""
-    base = f"{Dafny.IF} t == [] \n{{\n"
-    base += indent(f"{Dafny.ASRT} s + t == s;\n")
-    base += f"}}\n{Dafny.ELSEIF} |t| == 1 \n{{\n}}"
-    return base
+def pp_hom_base_cases() -> List[Tuple[str, Block]]:
+    """Return the branches of the empty and singleton base cases of a
+    homomorphism proof."""
+    return [("t == []", Block([Assert("s + t == s")])),
+            ("|t| == 1", Block([]))]
 
 
-def pp_hom_induction(func: Function) -> str:
-    """Return a string corresponding to the induction step of the homomorphism
-    proof of <func>."""
-    induct = f"{Dafny.ELSE}\n{{\n"
-    induct += indent(f"{Dafny.VAR} t1 := t[..|t|-1];\n")
-    induct += indent(f"{Dafny.VAR} t2 := [t[|t|-1]];\n")
-    induct += indent(f"{Dafny.ASRT} (s + t1) + t2 == s + t;\n")
+def pp_hom_helper_base_cases() -> List[Tuple[str, Block]]:
+    """Return the branches of the empty and singleton base cases of a
+    homomorphism proof, which use the lemmas of pp_hom_helpers."""
+    return [("t == []", Block([Call(CONCAT_EMPTY, ["s", "t"])])),
+            ("|t| == 1", Block([]))]
+
+
+def pp_hom_induction(func: Function, helpers: bool = False) -> Block:
+    """Return the block of the induction step of the homomorphism proof of
+    <func>. If <helpers> is True, the split of s + t is proved with the lemma
+    of pp_hom_helpers instead of an assertion."""
     name = func.name
-    induct += indent(f"Hom{name}(s, t1);\n")
-    induct += indent(f"{name}JoinAssoc({name}(s), {name}(t1), {name}(t2));\n")
-    induct += "}"
-    return induct
+    if helpers:
+        split = Call(CONCAT_SPLIT, ["s", "t"])
+    else:
+        split = Assert("(s + t1) + t2 == s + t")
+    return Block([VarDecl("t1", "t[..|t|-1]"),
+                  VarDecl("t2", "[t[|t|-1]]"),
+                  split,
+                  Call(f"Hom{name}", ["s", "t1"]),
+                  Call(f"{name}JoinAssoc",
+                       [f"{name}(s)", f"{name}(t1)", f"{name}(t2)"])])
+
+
+# Names of the lemmas of pp_hom_helpers
+CONCAT_EMPTY = "ConcatEmpty"
+CONCAT_SPLIT = "ConcatSplit"
+
+
+def pp_hom_helpers() -> str:
+    """Return a string corresponding to the lemmas about sequence
+    concatenation used by the opaque homomorphism proofs of pp_hom_proof.
+    They are shared by all functions, so they are printed once per file."""
+    empty = Declaration(f"{Dafny.LEM} {CONCAT_EMPTY}<T>(s: seq<T>, t: seq<T>)",
+                        [f"{Dafny.REQ} t == []", f"{Dafny.ENS} s + t == s"],
+                        Block([]))
+    split = Declaration(f"{Dafny.LEM} {CONCAT_SPLIT}<T>(s: seq<T>, t: seq<T>)",
+                        [f"{Dafny.REQ} |t| > 0",
+                         f"{Dafny.ENS} (s + t[..|t|-1]) + [t[|t|-1]] == s + t"],
+                        Block([Assert("t == t[..|t|-1] + [t[|t|-1]]")]))
+    return f"{render(empty)}\n\n{render(split)}"
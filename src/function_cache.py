@@ -0,0 +1,321 @@
+"""
+A compact binary cache of the Functions defined in an input file.
+
+The cache of an input file is written next to it, as <input file>.fgc, and
+records the Functions loaded from the file, with the hash of the contents of
+the file and of each file it imports. As long as none of these files change,
+the Functions are loaded from the cache instead of being parsed and built
+again.
+
+Format (all integers are little-endian and unsigned, unless noted):
+
+    magic "PAFG", format version (u16), lifting strategy (u8),
+    SHA-256 of the input file (32 bytes),
+    number of dependencies, strings, types, functions and definitions
+    (5 x u32),
+    dependencies: the path of each imported file, relative to the directory
+           of the input file (length (u32) and UTF-8 bytes), and the SHA-256
+           of its contents (32 bytes)
+    strings: length (u32) and UTF-8 bytes, each
+    types: simple type (string index, i32, -1 for tuples), number of
+           elements (u32), and the type index of each element
+    functions: string indices of the name, body and join body, then the
+           string lists of the parameter names, parameter types, decreases,
+           requires, ensures and join parameter names (each a count and
+           string indices), the type index of the return type, and the list
+           of function indices of the aux functions
+    definitions: the function index of each function, in the order in which
+           the functions are defined
+    calls: for each function, in order, the list of function indices of the
+           functions it calls (which may refer to later functions)
+
+Elements of a type, and aux functions, always come before the types and
+functions that refer to them. Each function is stored once, however many
+functions it is an aux function of, so shared aux functions are still shared
+once loaded.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import struct
+from typing import List, Dict, Optional, Tuple
+
+from src.dafny import Function, Type, LIFTINGS
+
+MAGIC = b"PAFG"
+FORMAT_VERSION = 3
+SUFFIX = ".fgc"
+
+_HEADER = struct.Struct("<4sHB32s5I")
+_U32 = struct.Struct("<I")
+_I32 = struct.Struct("<i")
+
+
+def cache_name(input_name: str) -> str:
+    """Return the name of the cache file of the input file <input_name>."""
+    return input_name + SUFFIX
+
+
+def file_digest(file_name: str) -> bytes:
+    """Return the SHA-256 hash of the contents of the file <file_name>."""
+    h = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+class _Encoder:
+    """Encodes Functions into the cache format.
+
+    === Private Attributes ===
+    _strings:
+        A dictionary mapping each string encoded so far to its index.
+    _types:
+        A dictionary mapping each Type encoded so far to its index.
+    _functions:
+        A dictionary mapping the id of each Function encoded so far to its
+        index.
+    _type_records:
+        The encoded types, in order.
+    _function_records:
+        The encoded functions, in order.
+    _encoded:
+        The Functions encoded so far, in order.
+    """
+    _strings: Dict[str, int]
+    _types: Dict[Type, int]
+    _functions: Dict[int, int]
+    _type_records: List[bytes]
+    _function_records: List[bytes]
+    _encoded: List[Function]
+
+    def __init__(self) -> None:
+        """Initialize this _Encoder with nothing encoded."""
+        self._strings = {}
+        self._types = {}
+        self._functions = {}
+        self._type_records = []
+        self._function_records = []
+        self._encoded = []
+
+    def string(self, text: str) -> int:
+        """Return the index of <text>, adding it to the string table."""
+        if text not in self._strings:
+            self._strings[text] = len(self._strings)
+        return self._strings[text]
+
+    def strings(self, texts: List[str]) -> bytes:
+        """Return the encoding of the list of strings <texts>."""
+        return struct.pack(f"<I{len(texts)}I", len(texts),
+                           *(self.string(text) for text in texts))
+
+    def type(self, _type: Type) -> int:
+        """Return the index of <_type>, encoding it and its elements if they
+        have not been encoded yet."""
+        if _type not in self._types:
+            elements = [self.type(element) for element in _type.tuple_type]
+            simple = self.string(_type.simple_type) if not elements else -1
+            self._types[_type] = len(self._type_records)
+            self._type_records.append(
+                _I32.pack(simple) +
+                struct.pack(f"<I{len(elements)}I", len(elements), *elements))
+        return self._types[_type]
+
+    def function(self, func: Function) -> int:
+        """Return the index of <func>, encoding it and its aux functions if
+        they have not been encoded yet."""
+        if id(func) not in self._functions:
+            aux = [self.function(each) for each in func.aux]
+            record = struct.pack("<3I", self.string(func.name),
+                                 self.string(func.body),
+                                 self.string(func.join_body))
+            for texts in [func.param_names, [str(t) for t in func.param_types],
+                          func.decreases, func.requires, func.ensures,
+                          func.join_param_names]:
+                record += self.strings(texts)
+            record += _U32.pack(self.type(func.return_type))
+            record += struct.pack(f"<I{len(aux)}I", len(aux), *aux)
+            self._functions[id(func)] = len(self._function_records)
+            self._function_records.append(record)
+            self._encoded.append(func)
+        return self._functions[id(func)]
+
+    def encode(self, funcs: List[Function], lifting: str, digest: bytes,
+               dependencies: List[Tuple[str, bytes]]) -> bytes:
+        """Return the encoding of <funcs>, built with the lifting strategy
+        <lifting> from an input file whose hash is <digest>, and which
+        imports the files in <dependencies>, given as (path, hash) pairs."""
+        order = [self.function(func) for func in funcs]
+        # Calls may form cycles, so they are encoded once the functions are,
+        # which may encode more functions
+        calls = []
+        while len(calls) < len(self._encoded):
+            calls.append([self.function(callee)
+                          for callee in self._encoded[len(calls)].calls])
+        parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, LIFTINGS.index(lifting),
+                              digest, len(dependencies), len(self._strings),
+                              len(self._type_records),
+                              len(self._function_records), len(order))]
+        for path, dependency_digest in dependencies:
+            parts.append(_encode_string(path) + dependency_digest)
+        parts.extend(_encode_string(text) for text in self._strings)
+        parts.extend(self._type_records)
+        parts.extend(self._function_records)
+        parts.append(struct.pack(f"<{len(order)}I", *order))
+        parts.extend(struct.pack(f"<I{len(each)}I", len(each), *each)
+                     for each in calls)
+        return b"".join(parts)
+
+
+def _encode_string(text: str) -> bytes:
+    """Return the length-prefixed UTF-8 encoding of <text>."""
+    encoded = text.encode()
+    return _U32.pack(len(encoded)) + encoded
+
+
+class _Decoder:
+    """Decodes Functions from the cache format.
+
+    === Private Attributes ===
+    _data:
+        The encoded cache.
+    _offset:
+        The position of the next value to decode in <_data>.
+    """
+    _data: bytes
+    _offset: int
+
+    def __init__(self, data: bytes, offset: int) -> None:
+        """Initialize this _Decoder to decode <data> from <offset>."""
+        self._data = data
+        self._offset = offset
+
+    def u32(self) -> int:
+        """Decode an unsigned 32-bit integer."""
+        value = _U32.unpack_from(self._data, self._offset)[0]
+        self._offset += 4
+        return value
+
+    def u32s(self) -> Tuple[int, ...]:
+        """Decode a count followed by that many unsigned 32-bit integers."""
+        count = self.u32()
+        values = struct.unpack_from(f"<{count}I", self._data, self._offset)
+        self._offset += 4 * count
+        return values
+
+    def i32(self) -> int:
+        """Decode a signed 32-bit integer."""
+        value = _I32.unpack_from(self._data, self._offset)[0]
+        self._offset += 4
+        return value
+
+    def string(self) -> str:
+        """Decode a length-prefixed UTF-8 string."""
+        length = self.u32()
+        start = self._offset
+        self._offset += length
+        return self._data[start:self._offset].decode()
+
+    def digest(self) -> bytes:
+        """Decode a SHA-256 hash."""
+        start = self._offset
+        self._offset += 32
+        return self._data[start:self._offset]
+
+    def dependencies_match(self, input_name: str, count: int) -> bool:
+        """Decode the <count> dependencies of the cache of <input_name>, and
+        return whether each still exists and has the recorded hash."""
+        directory = os.path.dirname(input_name)
+        for _ in range(count):
+            path = os.path.join(directory, self.string())
+            if not os.path.isfile(path) or file_digest(path) != self.digest():
+                return False
+        return True
+
+    def decode(self, lifting: str, counts: Tuple[int, int, int, int]) \
+            -> List[Function]:
+        """Decode the tables of a cache, whose sizes are <counts>, and return
+        its functions in the order in which they are defined."""
+        n_strings, n_types, n_functions, n_order = counts
+        strings = [self.string() for _ in range(n_strings)]
+        types = []
+        for _ in range(n_types):
+            simple = self.i32()
+            elements = [types[index] for index in self.u32s()]
+            types.append(Type(elements, strings[simple] if simple >= 0
+                              else ""))
+        functions = []
+        for _ in range(n_functions):
+            name, body, join_body = (strings[self.u32()] for _ in range(3))
+            lists = [[strings[index] for index in self.u32s()]
+                     for _ in range(6)]
+            param_names, param_types, decreases, requires, ensures, \
+                join_param_names = lists
+            return_type = types[self.u32()]
+            aux = [functions[index] for index in self.u32s()]
+            functions.append(Function(name, param_names, param_types,
+                                      return_type, decreases, requires,
+                                      ensures, aux, body, join_param_names,
+                                      join_body, lifting))
+        order = struct.unpack_from(f"<{n_order}I", self._data, self._offset)
+        self._offset += 4 * n_order
+        for func in functions:
+            func.set_calls([functions[index] for index in self.u32s()])
+        return [functions[index] for index in order]
+
+
+def write_function_cache(input_name: str, funcs: List[Function],
+                         lifting: str, digest: Optional[bytes] = None,
+                         dependencies: Optional[List[str]] = None) -> None:
+    """Write the cache of the input file <input_name>, from which <funcs>
+    were loaded with the lifting strategy <lifting>. <digest> is the hash of
+    the input file, if it is already known, and <dependencies> are the names
+    of the files it imports, directly or not."""
+    digest = digest or file_digest(input_name)
+    directory = os.path.dirname(input_name) or "."
+    recorded = [(os.path.relpath(name, directory), file_digest(name))
+                for name in dependencies or []]
+    data = _Encoder().encode(funcs, lifting, digest, recorded)
+    name = cache_name(input_name)
+    temp_name = f"{name}.{os.getpid()}.tmp"
+    try:
+        with open(temp_name, "wb") as f:
+            f.write(data)
+        os.replace(temp_name, name)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+
+def read_function_cache(input_name: str, lifting: str,
+                        digest: Optional[bytes] = None) \
+        -> Optional[List[Function]]:
+    """Return the functions recorded in the cache of the input file
+    <input_name>, or None if there is no valid cache for the current contents
+    of the file and the files it imports, and the lifting strategy
+    <lifting>. <digest> is the hash of the input file, if it is already
+    known. Only the header is checked before the tables are decoded; every
+    table is needed to build the functions, so they are decoded at once."""
+    digest = digest or file_digest(input_name)
+    try:
+        with open(cache_name(input_name), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, lifting_index, cached_digest, n_dependencies, \
+        *counts = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT_VERSION or \
+            lifting_index != LIFTINGS.index(lifting) or \
+            cached_digest != digest:
+        return None
+    try:
+        decoder = _Decoder(data, _HEADER.size)
+        if not decoder.dependencies_match(input_name, n_dependencies):
+            return None
+        return decoder.decode(lifting, tuple(counts))
+    except (struct.error, IndexError, UnicodeDecodeError):
+        return None
@@ -0,0 +1,150 @@
+"""
+Resolve the aux functions of the definitions in an input file.
+
+The aux functions of the definitions form a directed graph, which must be
+acyclic. Definitions may appear in any order in the input file: they are
+grouped into levels, where the definitions of level 0 have no aux functions,
+and every aux function of a definition of level k + 1 is at a level of at most
+k. Definitions in the same level do not depend on each other.
+
+Definitions may also call other functions of the program in their body or
+join without listing them as aux functions; these calls are found by scanning
+the code for identifiers (referenced_names), and may form cycles.
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Dict, Optional, Collection, Iterable
+
+from src.dafny import Function
+from src.parser import Definition, ParseError
+
+# An identifier in Dafny code
+IDENTIFIER = re.compile(r"[A-Za-z_][\w']*")
+
+
+def aux_graph(definitions: List[Definition], file_name: str,
+              external: Collection[str] = ()) -> Dict[str, List[str]]:
+    """Return a dictionary mapping the name of each definition in
+    <definitions> to the names of its aux functions. Aux functions named in
+    <external> are defined elsewhere (e.g. imported), and are left out of the
+    graph. Raise a ParseError if a function is defined twice, or an aux
+    function is not defined."""
+    graph = {}
+    for definition in definitions:
+        if definition.name in graph or definition.name in external:
+            raise ParseError(f"function {definition.name} is defined twice",
+                             file_name, definition.line, definition.column)
+        graph[definition.name] = [aux for aux in definition.aux
+                                  if aux not in external]
+    for definition in definitions:
+        for aux in definition.aux:
+            if aux not in graph and aux not in external:
+                raise ParseError(f"aux function {aux} of {definition.name} "
+                                 f"is not defined", file_name,
+                                 definition.line, definition.column)
+    return graph
+
+
+def find_cycle(graph: Dict[str, List[str]]) -> Optional[List[str]]:
+    """Return a cycle of <graph>, as the list of names along it (starting and
+    ending with the same name), or None if <graph> is acyclic."""
+    # 0: not visited, 1: on the current path, 2: done
+    state = {name: 0 for name in graph}
+    for root in graph:
+        if state[root]:
+            continue
+        path = [root]
+        stack = [iter(graph[root])]
+        state[root] = 1
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                state[path.pop()] = 2
+                stack.pop()
+            elif state[child] == 1:
+                return path[path.index(child):] + [child]
+            elif state[child] == 0:
+                state[child] = 1
+                path.append(child)
+                stack.append(iter(graph[child]))
+    return None
+
+
+def topological_levels(graph: Dict[str, List[str]]) -> List[List[str]]:
+    """Return the names in <graph> grouped into levels, where every name
+    depends only on names in earlier levels. Within a level, names keep the
+    order of <graph>. <graph> must be acyclic."""
+    level = {}
+    for root in graph:
+        stack = [root]
+        while stack:
+            name = stack[-1]
+            if name in level:
+                stack.pop()
+                continue
+            pending = [aux for aux in graph[name] if aux not in level]
+            if pending:
+                stack.extend(pending)
+            else:
+                level[name] = 1 + max((level[aux] for aux in graph[name]),
+                                      default=-1)
+                stack.pop()
+    levels = [[] for _ in range(1 + max(level.values(), default=-1))]
+    for name in graph:
+        levels[level[name]].append(name)
+    return levels
+
+
+def order_definitions(definitions: List[Definition], file_name: str,
+                      external: Collection[str] = ()) \
+        -> List[List[Definition]]:
+    """Return <definitions> grouped into topological levels, where the aux
+    functions named in <external> are defined elsewhere. Raise a ParseError
+    if a function is defined twice, an aux function is not defined, or the aux
+    functions form a cycle."""
+    graph = aux_graph(definitions, file_name, external)
+    by_name = {definition.name: definition for definition in definitions}
+    cycle = find_cycle(graph)
+    if cycle is not None:
+        start = by_name[cycle[0]]
+        raise ParseError(f"cyclic aux functions: {' -> '.join(cycle)}",
+                         file_name, start.line, start.column)
+    return [[by_name[name] for name in level]
+            for level in topological_levels(graph)]
+
+
+def function_levels(funcs: List[Function]) -> List[List[Function]]:
+    """Return <funcs> grouped into topological levels of their aux
+    functions. Aux functions that are not in <funcs> are ignored."""
+    by_name = {func.name: func for func in funcs}
+    graph = {func.name: [aux.name for aux in func.aux if aux.name in by_name]
+             for func in funcs}
+    return [[by_name[name] for name in level]
+            for level in topological_levels(graph)]
+
+
+def referenced_names(texts: Iterable[str],
+                     names: Collection[str]) -> List[str]:
+    """Return the names in <names> that occur as identifiers in the code
+    <texts>, each once, in the order of their first occurrence."""
+    found = []
+    seen = set()
+    for text in texts:
+        for identifier in IDENTIFIER.findall(text):
+            if identifier in names and identifier not in seen:
+                seen.add(identifier)
+                found.append(identifier)
+    return found
+
+
+def resolve_calls(funcs: Iterable[Function],
+                  available: Dict[str, Function]) -> None:
+    """Set the calls of each function in <funcs> to the other functions in
+    <available>, by name, that its definition refers to."""
+    for func in funcs:
+        texts = [func.body, func.join_body, *func.decreases, *func.requires,
+                 *func.ensures]
+        func.set_calls([available[name]
+                        for name in referenced_names(texts, available)
+                        if name != func.name])
@@ -0,0 +1,103 @@
+"""
+A cache of rendered proof fragments, used to regenerate a proof incrementally.
+
+Each fragment is keyed by the digest of a Function (which covers its definition
+and the definitions of its transitive aux functions) and the key of the proof
+component that rendered it (its name and rendering options). Only functions
+whose digest has changed since the previous run are rendered again.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Callable, Dict, Optional, Set
+
+from src import dafny, format, syntax
+from src.dafny import Function
+
+
+def renderer_version() -> str:
+    """Return a hash of the source code of the proof renderer, so that cached
+    fragments are discarded whenever the renderer changes."""
+    h = hashlib.sha256()
+    for module in [dafny, format, syntax]:
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class FragmentCache:
+    """A cache of rendered proof fragments.
+
+    === Public Attributes ===
+    file_name:
+        The name of the file the cache is stored in, or None if the cache is
+        only kept in memory.
+    hits:
+        The number of fragments found in the cache.
+    misses:
+        The number of fragments that had to be rendered.
+
+    === Private Attributes ===
+    _version:
+        The renderer version the cached fragments were rendered with.
+    _fragments:
+        A dictionary mapping each function digest to a dictionary of
+        (<component key>, <fragment>) pairs.
+    _used:
+        The digests looked up since the cache was loaded or last saved.
+    """
+    file_name: Optional[str]
+    hits: int
+    misses: int
+    _version: str
+    _fragments: Dict[str, Dict[str, str]]
+    _used: Set[str]
+
+    def __init__(self, file_name: Optional[str] = None) -> None:
+        """Initialize this FragmentCache, loading the fragments stored in
+        <file_name> if it exists and was written by the current renderer."""
+        self.file_name = file_name
+        self.hits = 0
+        self.misses = 0
+        self._version = renderer_version()
+        self._fragments = {}
+        self._used = set()
+        if file_name and os.path.exists(file_name):
+            try:
+                with open(file_name, "r") as f:
+                    stored = json.load(f)
+            except (OSError, ValueError):
+                stored = {}
+            if stored.get("version") == self._version:
+                self._fragments = stored.get("fragments", {})
+
+    def render(self, func: Function, component: Callable) -> str:
+        """Return the result of calling <component> on <func>, reusing the
+        cached result if <func> has not changed."""
+        key = func.digest()
+        self._used.add(key)
+        fragments = self._fragments.setdefault(key, {})
+        # Components rendered with different options have different keys
+        name = getattr(component, "key", component.__name__)
+        if name in fragments:
+            self.hits += 1
+        else:
+            self.misses += 1
+            fragments[name] = component(func)
+        return fragments[name]
+
+    def save(self) -> None:
+        """Discard the fragments of functions that were not looked up since
+        the last save, and write the remaining fragments to <file_name>."""
+        self._fragments = {key: value for key, value in self._fragments.items()
+                           if key in self._used}
+        self._used = set()
+        if not self.file_name:
+            return
+        temp_name = f"{self.file_name}.{os.getpid()}.tmp"
+        with open(temp_name, "w") as f:
+            json.dump({"version": self._version, "fragments": self._fragments},
+                      f)
+        os.replace(temp_name, self.file_name)
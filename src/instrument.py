@@ -0,0 +1,225 @@
+"""
+Opt-in timing and size instrumentation of proof generation.
+
+Usage:
+    python -m src.instrument <input file> <output file> [--json <file>]
+                             [--trace <file>] [--collapsed <file>]
+
+Instrumentation is disabled by default; while disabled, each hook costs a
+single check of ENABLED. While enabled, the hooks in generate_proof,
+_load_function and the rendering of each proof component record, per stage,
+function and component: the number of calls, the wall time, the number of
+bytes rendered and the number of flattened components of the function.
+
+The results can be exported as JSON, as a Chrome trace (which can be opened
+in chrome://tracing, Perfetto or speedscope), or as collapsed stacks for
+flamegraph.pl.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple, Any
+
+# Whether instrumentation is enabled. Hooks check this before doing any work
+ENABLED = False
+
+_recorder: Optional[Recorder] = None
+
+
+class Stat:
+    """Aggregated measurements of a stage, for one function and component.
+
+    === Public Attributes ===
+    calls:
+        The number of calls.
+    seconds:
+        The total wall time of the calls, in seconds.
+    output_bytes:
+        The total number of bytes rendered by the calls.
+    components:
+        The number of flattened components of the function.
+    """
+    calls: int
+    seconds: float
+    output_bytes: int
+    components: int
+
+    def __init__(self) -> None:
+        """Initialize this Stat with no calls."""
+        self.calls = 0
+        self.seconds = 0.0
+        self.output_bytes = 0
+        self.components = 0
+
+
+class Recorder:
+    """Records the measurements taken while instrumentation is enabled.
+
+    === Public Attributes ===
+    stats:
+        A dictionary mapping each (<stage>, <function>, <component>) triple to
+        its aggregated measurements. <function> and <component> are empty
+        when they do not apply to the stage.
+
+    === Private Attributes ===
+    _events:
+        The recorded regions, as (<label>, <start>, <duration>, <args>)
+        tuples, with times in seconds since <_origin>.
+    _stack:
+        The regions currently open, as [<label>, <nested>, <start>] lists,
+        where <nested> is the total time of the regions nested in it.
+    _collapsed:
+        A dictionary mapping each stack of labels, joined by ";", to the time
+        spent in its innermost region outside of nested regions.
+    _origin:
+        The time at which recording started.
+    """
+    stats: Dict[Tuple[str, str, str], Stat]
+    _events: List[Tuple[str, float, float, Dict[str, Any]]]
+    _stack: List[List]
+    _collapsed: Dict[str, float]
+    _origin: float
+
+    def __init__(self) -> None:
+        """Initialize this Recorder with no measurements."""
+        self.stats = {}
+        self._events = []
+        self._stack = []
+        self._collapsed = {}
+        self._origin = time.perf_counter()
+
+    def begin(self, label: str) -> float:
+        """Open a region named <label>, and return its start time."""
+        start = time.perf_counter()
+        self._stack.append([label, 0.0, start])
+        return start
+
+    def end(self, start: float, stage: str, function: str = "",
+            component: str = "", output_bytes: int = 0,
+            components: int = 0) -> None:
+        """Close the innermost region, which started at <start>, and record
+        its measurements."""
+        duration = time.perf_counter() - start
+        # Discard the regions left open by an exception
+        while self._stack and self._stack[-1][2] != start:
+            self._stack.pop()
+        if not self._stack:
+            return
+        stack = ";".join(frame[0] for frame in self._stack)
+        label, nested, _ = self._stack.pop()
+        if self._stack:
+            self._stack[-1][1] += duration
+        self._collapsed[stack] = self._collapsed.get(stack, 0.0) + \
+            duration - nested
+        stat = self.stats.setdefault((stage, function, component), Stat())
+        stat.calls += 1
+        stat.seconds += duration
+        stat.output_bytes += output_bytes
+        stat.components = components
+        self._events.append((label, start - self._origin, duration,
+                             {"output_bytes": output_bytes,
+                              "components": components}))
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return the aggregated measurements, as a JSON-compatible
+        dictionary."""
+        return {"stats": [{"stage": stage, "function": function,
+                           "component": component, "calls": stat.calls,
+                           "seconds": stat.seconds,
+                           "output_bytes": stat.output_bytes,
+                           "components": stat.components}
+                          for (stage, function, component), stat
+                          in self.stats.items()]}
+
+    def to_trace(self) -> Dict[str, Any]:
+        """Return the recorded regions in the Chrome trace event format."""
+        pid = os.getpid()
+        return {"traceEvents": [{"name": label, "ph": "X", "pid": pid,
+                                 "tid": 0, "ts": start * 1e6,
+                                 "dur": duration * 1e6, "args": args}
+                                for label, start, duration, args
+                                in self._events],
+                "displayTimeUnit": "ms"}
+
+    def to_collapsed(self) -> str:
+        """Return the recorded regions as collapsed stacks, one per line, each
+        followed by its exclusive time in microseconds."""
+        return "".join(f"{stack} {round(seconds * 1e6)}\n"
+                       for stack, seconds in self._collapsed.items())
+
+
+def enable() -> Recorder:
+    """Enable instrumentation with a new Recorder, and return it."""
+    global ENABLED, _recorder
+    _recorder = Recorder()
+    ENABLED = True
+    return _recorder
+
+
+def disable() -> Optional[Recorder]:
+    """Disable instrumentation, and return the Recorder that was in use."""
+    global ENABLED
+    ENABLED = False
+    return _recorder
+
+
+def begin(label: str) -> float:
+    """Open a region named <label> in the current Recorder, and return its
+    start time. Only call this while ENABLED is True."""
+    return _recorder.begin(label)
+
+
+def end(start: float, stage: str, function: str = "", component: str = "",
+        output_bytes: int = 0, components: int = 0) -> None:
+    """Close the innermost region of the current Recorder, which started at
+    <start>, and record its measurements. Does nothing if <start> is 0."""
+    if start and _recorder is not None:
+        _recorder.end(start, stage, function, component, output_bytes,
+                      components)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Generate a proof with instrumentation enabled, and export the
+    measurements."""
+    # Run as a script, this module is __main__, not the src.instrument module
+    # that the hooks check
+    from src import instrument
+    from src.program_loader import generate_proof
+
+    parser = argparse.ArgumentParser(
+        description="Generate a proof and measure each stage, function and "
+                    "component.")
+    parser.add_argument("input", help="the input file")
+    parser.add_argument("output", help="the output file")
+    parser.add_argument("--json", help="write the aggregated measurements to "
+                                       "this file")
+    parser.add_argument("--trace", help="write a Chrome trace to this file")
+    parser.add_argument("--collapsed", help="write collapsed stacks to this "
+                                            "file")
+    args = parser.parse_args(argv)
+
+    recorder = instrument.enable()
+    try:
+        generate_proof(args.input, args.output)
+    finally:
+        instrument.disable()
+    for file_name, data in [(args.json, recorder.to_json()),
+                            (args.trace, recorder.to_trace())]:
+        if file_name:
+            with open(file_name, "w") as f:
+                json.dump(data, f, indent=2)
+    if args.collapsed:
+        with open(args.collapsed, "w") as f:
+            f.write(recorder.to_collapsed())
+    if not (args.json or args.trace or args.collapsed):
+        json.dump(recorder.to_json(), sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Generate the proofs of several input files that share aux functions.
+
+Usage:
+    python -m src.linker <directory> [--common <file>] [--pattern <input name>]
+                         [--output-name <output name>] [--predicates]
+                         [--opaque] [--lifting nested|flat]
+
+Every file named <pattern> below <directory> is an input file, and its proof
+is written to <output name> in the same directory, as in src.batch. The input
+files are linked together: a function needed by the proofs of more than one
+input file, whether it is imported from a shared input file with (import ...)
+or defined identically in each file, is rendered once, into the common file
+(by default, <directory>/common.dfy). Each output that needs a shared function
+includes the common file instead of repeating its proof, so the proofs of
+shared functions are generated, and verified, once.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import List, Dict, Callable, Optional, Tuple
+
+from src.batch import INPUT_NAME, OUTPUT_NAME, find_inputs, make_jobs
+from src.dafny import Function, NESTED, LIFTINGS
+from src.parser import ParseError
+from src.program_loader import LoadedFile, load_file, imported_closure
+from src.proof_print import get_components, get_preamble, render_all, \
+    write_if_changed
+
+COMMON_NAME = "common.dfy"
+
+
+class LinkError(Exception):
+    """Two different functions with the same name would be rendered into the
+    same proof."""
+
+
+class Link:
+    """The result of linking input files.
+
+    === Public Attributes ===
+    shared:
+        The functions needed by more than one input file, each once, in the
+        order in which they are first needed.
+    local:
+        A dictionary mapping the name of each input file to the functions only
+        its proof needs.
+    uses_shared:
+        The names of the input files whose proofs need a shared function.
+    """
+    shared: List[Function]
+    local: Dict[str, List[Function]]
+    uses_shared: List[str]
+
+    def __init__(self, shared: List[Function],
+                 local: Dict[str, List[Function]],
+                 uses_shared: List[str]) -> None:
+        """Initialize this Link with the given information."""
+        self.shared = shared
+        self.local = local
+        self.uses_shared = uses_shared
+
+
+def needed_functions(loaded: LoadedFile) -> List[Function]:
+    """Return the functions the proof of <loaded> needs: its imported
+    functions with their aux functions, followed by its own functions."""
+    return imported_closure(loaded) + loaded.functions
+
+
+def link(input_names: List[str], lifting: str = NESTED) -> Link:
+    """Load the input files <input_names>, with the files they import, and
+    return which functions are shared between their proofs. Functions are
+    identified by their digest, so identical definitions in different files
+    are the same function. Raise a ParseError if an input file is not valid,
+    and a LinkError if a proof would contain two different functions with
+    the same name."""
+    files = {}
+    needed = {name: needed_functions(load_file(name, lifting, files))
+              for name in input_names}
+
+    # The first Function seen with each digest stands for all of them
+    canonical: Dict[str, Function] = {}
+    users: Dict[str, List[str]] = {}
+    for input_name, funcs in needed.items():
+        for func in funcs:
+            canonical.setdefault(func.digest(), func)
+            file_users = users.setdefault(func.digest(), [])
+            if input_name not in file_users:
+                file_users.append(input_name)
+
+    shared = [func for digest, func in canonical.items()
+              if len(users[digest]) > 1]
+    shared_digests = {func.digest() for func in shared}
+    _check_names(shared, "the common proof")
+    local = {}
+    uses_shared = []
+    for input_name, funcs in needed.items():
+        local[input_name] = [canonical[func.digest()] for func in funcs
+                             if func.digest() not in shared_digests]
+        if len(local[input_name]) < len(funcs):
+            uses_shared.append(input_name)
+            _check_names(shared + local[input_name], input_name)
+    return Link(shared, local, uses_shared)
+
+
+def _check_names(funcs: List[Function], where: str) -> None:
+    """Raise a LinkError if two different functions in <funcs>, which are
+    rendered into <where>, have the same name."""
+    names: Dict[str, str] = {}
+    for func in funcs:
+        if names.setdefault(func.name, func.digest()) != func.digest():
+            raise LinkError(f"{where} would contain two different definitions "
+                            f"of {func.name}")
+
+
+def write_linked(jobs: List[Tuple[str, str]], common_name: str,
+                 lifting: str = NESTED,
+                 components: Optional[List[Callable]] = None,
+                 preamble: str = "") -> List[str]:
+    """Link the input files of <jobs>, a list of (input name, output name)
+    pairs, and write the proof of each to its output file, and the proofs of
+    the shared functions to <common_name>. Return the names of the files that
+    were written because their contents changed. The proofs are rendered by
+    <components>, and <preamble> is written once, to the common file if there
+    is one, and to each output file otherwise."""
+    result = link([input_name for input_name, _ in jobs], lifting)
+    written = []
+    if result.shared:
+        if write_if_changed(common_name, "".join(render_all(
+                result.shared, None, components, preamble))):
+            written.append(common_name)
+    for input_name, output_name in jobs:
+        pieces = []
+        own_preamble = preamble
+        if input_name in result.uses_shared:
+            common = os.path.relpath(common_name,
+                                     os.path.dirname(output_name) or ".")
+            pieces.append(f'include "{common}"\n\n')
+            own_preamble = ""
+        pieces.extend(render_all(result.local[input_name], None, components,
+                                 own_preamble))
+        if write_if_changed(output_name, "".join(pieces)):
+            written.append(output_name)
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Link and generate the proofs of the input files below a directory from
+    the command line, and return the exit status."""
+    parser = argparse.ArgumentParser(
+        description="Generate the homomorphism proofs of several input "
+                    "files, rendering shared functions once.")
+    parser.add_argument("directory", help="the directory of the input files")
+    parser.add_argument("--common",
+                        help=f"the file the shared proofs are written to "
+                             f"(default: <directory>/{COMMON_NAME})")
+    parser.add_argument("--pattern", default=INPUT_NAME,
+                        help=f"the name of the input files "
+                             f"(default: {INPUT_NAME})")
+    parser.add_argument("--output-name", default=OUTPUT_NAME,
+                        help=f"the name of the output files "
+                             f"(default: {OUTPUT_NAME})")
+    parser.add_argument("--predicates", action="store_true",
+                        help="require a predicate in associativity lemmas")
+    parser.add_argument("--opaque", action="store_true",
+                        help="make lifted functions and joins opaque")
+    parser.add_argument("--lifting", choices=LIFTINGS, default=NESTED,
+                        help="the lifting strategy")
+    args = parser.parse_args(argv)
+
+    jobs = make_jobs(find_inputs(args.directory, args.pattern),
+                     args.output_name)
+    common_name = args.common or os.path.join(args.directory, COMMON_NAME)
+    try:
+        written = write_linked(jobs, common_name, args.lifting,
+                               get_components(args.predicates, args.opaque),
+                               get_preamble(args.opaque))
+    except (ParseError, LinkError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"{len(jobs)} input files linked, {len(written)} changed files "
+          f"written")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,420 @@
+"""
+Parse the S-expression format of input files.
+
+An input file contains a list of the functions it defines, followed by their
+definitions:
+
+    (functions <name> ...)
+    (definition <name>
+        (type (<param_types>) <return_type>)
+        (body (function (<param_names>) {<body>}))
+        (join (function (<join_param_names>) {<join_body>}))
+        (decreases ({<decreases>} ...))
+        (requires ({<requires>} ...))
+        (ensures ({<ensures>} ...))
+        (aux (<aux> ...)))
+
+Text between braces is Dafny code, and is kept verbatim (it may contain nested
+braces). The decreases, requires, ensures and aux sections may be omitted.
+
+Definitions may also be imported from other input files, and then used as aux
+functions, with
+
+    (import <path> <name> ...)
+
+where <path> is relative to the directory of the importing file. If no names
+are given, every function defined in the imported file is imported.
+
+The file is tokenized line by line, and each top-level form is returned as
+soon as it has been read, so the memory used does not grow with the number of
+definitions in the file.
+"""
+from __future__ import annotations
+
+import re
+from typing import Iterator, List, Optional, TextIO, Union, Dict, Tuple
+
+from src.dafny import Dafny
+
+# The types that may appear in a "type" section
+TYPES = {
+    "Dafny.SEQ2D": Dafny.SEQ2D,
+    "Dafny.SEQ": Dafny.SEQ,
+    "Dafny.INT": Dafny.INT,
+    Dafny.SEQ2D: Dafny.SEQ2D,
+    Dafny.SEQ: Dafny.SEQ,
+    Dafny.INT: Dafny.INT,
+}
+
+# Sections of a definition that may be omitted, and hold lists of code
+OPTIONAL_SECTIONS = ["decreases", "requires", "ensures", "aux"]
+
+OPEN = "("
+CLOSE = ")"
+SYMBOL = "symbol"
+CODE = "code"
+
+# A token, where code without nested braces that ends on the same line is
+# matched as a whole
+_TOKEN = re.compile(r"\s*(?:([()])|\{([^{}\n]*)}|(\{)|(})|([^\s(){}]+))")
+_BRACE = re.compile(r"[{}]")
+
+
+class ParseError(Exception):
+    """An error in the format of an input file, at a given position."""
+
+    def __init__(self, message: str, file_name: str, line: int,
+                 column: int) -> None:
+        """Initialize this ParseError with the given information."""
+        super().__init__(f"{file_name}:{line}:{column}: {message}")
+        self.file_name = file_name
+        self.line = line
+        self.column = column
+
+
+class Token:
+    """A token of an input file.
+
+    === Public Attributes ===
+    kind:
+        One of OPEN, CLOSE, SYMBOL or CODE (text between braces).
+    value:
+        The text of the token, without the braces around code.
+    line:
+        The line the token starts on, starting from 1.
+    column:
+        The column the token starts at, starting from 1.
+    """
+    kind: str
+    value: str
+    line: int
+    column: int
+
+    def __init__(self, kind: str, value: str, line: int, column: int) -> None:
+        """Initialize this Token with the given information."""
+        self.kind = kind
+        self.value = value
+        self.line = line
+        self.column = column
+
+
+class Group:
+    """A parenthesized list of tokens and groups.
+
+    === Public Attributes ===
+    items:
+        The elements of the list.
+    line:
+        The line of the opening parenthesis.
+    column:
+        The column of the opening parenthesis.
+    """
+    items: List[Union[Token, Group]]
+    line: int
+    column: int
+
+    def __init__(self, line: int, column: int) -> None:
+        """Initialize this Group with no items."""
+        self.items = []
+        self.line = line
+        self.column = column
+
+
+class Header:
+    """The list of functions defined in an input file.
+
+    === Public Attributes ===
+    names:
+        The names of the functions.
+    line:
+        The line the list starts on.
+    column:
+        The column the list starts at.
+    """
+    names: List[str]
+    line: int
+    column: int
+
+    def __init__(self, names: List[str], line: int, column: int) -> None:
+        """Initialize this Header with the given information."""
+        self.names = names
+        self.line = line
+        self.column = column
+
+
+class Import:
+    """The functions imported from another input file.
+
+    === Public Attributes ===
+    path:
+        The path of the imported file, relative to the directory of the
+        importing file.
+    names:
+        The names of the imported functions, or an empty list to import every
+        function defined in the file.
+    line:
+        The line the import starts on.
+    column:
+        The column the import starts at.
+    """
+    path: str
+    names: List[str]
+    line: int
+    column: int
+
+    def __init__(self, path: str, names: List[str], line: int,
+                 column: int) -> None:
+        """Initialize this Import with the given information."""
+        self.path = path
+        self.names = names
+        self.line = line
+        self.column = column
+
+
+class Definition:
+    """The definition of a function in an input file.
+
+    === Public Attributes ===
+    name:
+        The name of the function.
+    param_types:
+        The types of the parameters of the function.
+    return_type:
+        The (unlifted) return type of the function.
+    param_names:
+        The names of the parameters of the function.
+    body:
+        The body of the function.
+    join_param_names:
+        The names of the join parameters.
+    join_body:
+        The body of the join.
+    decreases:
+        Decrease measure for the function definition.
+    requires:
+        The "requires" statements of the function.
+    ensures:
+        The "ensures" statements of the function.
+    aux:
+        The names of the aux functions of the function.
+    line:
+        The line the definition starts on.
+    column:
+        The column the definition starts at.
+    """
+    name: str
+    param_types: List[str]
+    return_type: str
+    param_names: List[str]
+    body: str
+    join_param_names: List[str]
+    join_body: str
+    decreases: List[str]
+    requires: List[str]
+    ensures: List[str]
+    aux: List[str]
+    line: int
+    column: int
+
+    def __init__(self, name: str, param_types: List[str], return_type: str,
+                 param_names: List[str], body: str,
+                 join_param_names: List[str], join_body: str,
+                 decreases: List[str], requires: List[str],
+                 ensures: List[str], aux: List[str], line: int,
+                 column: int) -> None:
+        """Initialize this Definition with the given information."""
+        self.name = name
+        self.param_types = param_types
+        self.return_type = return_type
+        self.param_names = param_names
+        self.body = body
+        self.join_param_names = join_param_names
+        self.join_body = join_body
+        self.decreases = decreases
+        self.requires = requires
+        self.ensures = ensures
+        self.aux = aux
+        self.line = line
+        self.column = column
+
+
+def tokenize(f: TextIO, file_name: str = "<input>") -> Iterator[Token]:
+    """Yield the tokens of the input file <f>, reading it line by line."""
+    code = None
+    depth = line_no = start_line = start_column = 0
+    for line_no, line in enumerate(f, start=1):
+        pos = 0
+        while pos < len(line):
+            # Inside code: look for the matching closing brace
+            if code is not None:
+                match = _BRACE.search(line, pos)
+                if not match:
+                    code.append(line[pos:])
+                    break
+                depth += 1 if match.group() == "{" else -1
+                if depth:
+                    code.append(line[pos:match.end()])
+                else:
+                    code.append(line[pos:match.start()])
+                    yield Token(CODE, "".join(code), start_line, start_column)
+                    code = None
+                pos = match.end()
+                continue
+            match = _TOKEN.match(line, pos)
+            if not match or match.end() == pos:
+                break
+            column = match.start(match.lastindex) + 1
+            paren, short_code, open_brace, close_brace, symbol = match.groups()
+            if paren:
+                yield Token(paren, paren, line_no, column)
+            elif short_code is not None:
+                yield Token(CODE, short_code, line_no, column)
+            elif open_brace:
+                code, depth = [], 1
+                start_line, start_column = line_no, column
+            elif close_brace:
+                raise ParseError("unmatched '}'", file_name, line_no, column)
+            else:
+                yield Token(SYMBOL, symbol, line_no, column)
+            pos = match.end()
+    if code is not None:
+        raise ParseError("unterminated '{'", file_name, start_line,
+                         start_column)
+
+
+def read_groups(f: TextIO, file_name: str = "<input>") -> Iterator[Group]:
+    """Yield each top-level group of the input file <f> as soon as it has been
+    read."""
+    stack = []
+    for token in tokenize(f, file_name):
+        if token.kind == OPEN:
+            stack.append(Group(token.line, token.column))
+        elif token.kind == CLOSE:
+            if not stack:
+                raise ParseError("unmatched ')'", file_name, token.line,
+                                 token.column)
+            group = stack.pop()
+            if stack:
+                stack[-1].items.append(group)
+            else:
+                yield group
+        elif stack:
+            stack[-1].items.append(token)
+        else:
+            raise ParseError("expected '('", file_name, token.line,
+                             token.column)
+    if stack:
+        raise ParseError("unmatched '('", file_name, stack[-1].line,
+                         stack[-1].column)
+
+
+def parse_spec(f: TextIO, file_name: str = "<input>") \
+        -> Iterator[Union[Header, Import, Definition]]:
+    """Yield the function list, each import and each definition of the input
+    file <f>, in the order in which they appear."""
+    for group in read_groups(f, file_name):
+        keyword = _symbol(_item(group, 0, file_name), file_name)
+        if keyword == "functions":
+            names = [_symbol(item, file_name) for item in group.items[1:]]
+            yield Header(names, group.line, group.column)
+        elif keyword == "import":
+            path = _symbol(_item(group, 1, file_name), file_name).strip('"')
+            names = [_symbol(item, file_name) for item in group.items[2:]]
+            yield Import(path, names, group.line, group.column)
+        elif keyword == "definition":
+            yield _read_definition(group, file_name)
+        else:
+            raise _error(f"unknown form '{keyword}'", group.items[0],
+                         file_name)
+
+
+def _read_definition(group: Group, file_name: str) -> Definition:
+    """Return the Definition represented by <group>."""
+    name = _symbol(_item(group, 1, file_name), file_name)
+    sections: Dict[str, Group] = {}
+    for item in group.items[2:]:
+        if not isinstance(item, Group):
+            raise _error("expected a section", item, file_name)
+        section = _symbol(_item(item, 0, file_name), file_name)
+        if section in sections:
+            raise _error(f"duplicate section '{section}'", item, file_name)
+        sections[section] = item
+
+    for section in sections:
+        if section not in ["type", "body", "join"] + OPTIONAL_SECTIONS:
+            raise _error(f"unknown section '{section}'", sections[section],
+                         file_name)
+    for section in ["type", "body", "join"]:
+        if section not in sections:
+            raise _error(f"missing section '{section}'", group, file_name)
+
+    _type = sections["type"]
+    param_types = [_lookup_type(item, file_name) for item in
+                   _group(_item(_type, 1, file_name), file_name).items]
+    return_type = _lookup_type(_item(_type, 2, file_name), file_name)
+    param_names, body = _read_lambda(sections["body"], file_name)
+    join_param_names, join_body = _read_lambda(sections["join"], file_name)
+    optional = {}
+    for section in OPTIONAL_SECTIONS:
+        optional[section] = []
+        if section in sections:
+            items = _group(_item(sections[section], 1, file_name), file_name)
+            optional[section] = [_text(item, file_name)
+                                 for item in items.items]
+    return Definition(name, param_types, return_type, param_names, body,
+                      join_param_names, join_body, optional["decreases"],
+                      optional["requires"], optional["ensures"],
+                      optional["aux"], group.line, group.column)
+
+
+def _read_lambda(section: Group, file_name: str) -> Tuple[List[str], str]:
+    """Return the parameter names and the body of the section <section>,
+    which has the form (<name> (function (<params>) <body>))."""
+    func = _group(_item(section, 1, file_name), file_name)
+    if _symbol(_item(func, 0, file_name), file_name) != Dafny.FUNCTION:
+        raise _error("expected 'function'", func.items[0], file_name)
+    params = [_symbol(item, file_name)
+              for item in _group(_item(func, 1, file_name), file_name).items]
+    return params, _text(_item(func, 2, file_name), file_name)
+
+
+def _item(group: Group, index: int, file_name: str) -> Union[Token, Group]:
+    """Return the item at <index> in <group>."""
+    if index >= len(group.items):
+        raise _error("too few elements", group, file_name)
+    return group.items[index]
+
+
+def _group(item: Union[Token, Group], file_name: str) -> Group:
+    """Return <item>, which must be a Group."""
+    if not isinstance(item, Group):
+        raise _error("expected '('", item, file_name)
+    return item
+
+
+def _symbol(item: Union[Token, Group], file_name: str) -> str:
+    """Return the value of <item>, which must be a symbol."""
+    if not isinstance(item, Token) or item.kind != SYMBOL:
+        raise _error("expected a name", item, file_name)
+    return item.value
+
+
+def _text(item: Union[Token, Group], file_name: str) -> str:
+    """Return the value of <item>, which must be code or a symbol."""
+    if not isinstance(item, Token):
+        raise _error("expected code", item, file_name)
+    return item.value
+
+
+def _lookup_type(item: Union[Token, Group], file_name: str) -> str:
+    """Return the Dafny type named by <item>."""
+    name = _symbol(item, file_name)
+    if name not in TYPES:
+        raise _error(f"unknown type '{name}'", item, file_name)
+    return TYPES[name]
+
+
+def _error(message: str, item: Optional[Union[Token, Group]],
+           file_name: str) -> ParseError:
+    """Return a ParseError with <message>, at the position of <item>."""
+    return ParseError(message, file_name, item.line, item.column)
@@ -0,0 +1,336 @@
+"""
+Report which generated lemmas take longest to verify, and where they come
+from.
+
+Usage:
+    python -m src.profiler <output file> [--input <input file>]
+                           [--log <csv file>] [--prelude <file>]
+                           [--command <command>] [--workers <n>]
+                           [--timeout <seconds>] [--history <file>]
+                           [--top <n>] [--json <file>] [--compare <file>]
+
+The verification time of each declaration of the output file is taken from
+either
+    - a CSV verification log written by Dafny for the whole output file
+      (dafny verify --log-format "csv;LogFileName=<csv file>" <output file>),
+      given with --log, which also records the resources used by each
+      declaration; or
+    - verifying each declaration separately with src/scheduler.py, with the
+      given verifier command.
+
+Each declaration is mapped back to the definition it was generated for (with
+its location in <input file> or the files it imports, if given) and to the
+component of src/format.py that rendered it: Function (pp_lifted_function),
+Join (pp_lifted_join), JoinAssoc (pp_assoc_proof), Hom (pp_hom_proof),
+WellFormed (pp_well_formed) or Helpers (pp_hom_helpers). The declarations are
+ranked by time, with the total of each component and of each definition.
+
+The report is written as JSON with --json, in a stable order, so that the
+reports of two runs can be diffed, or compared with --compare, which ranks the
+declarations by their change in time.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import re
+import shlex
+import sys
+from typing import List, Dict, Optional, Any, Tuple
+
+from src.declarations import Declaration, split_declarations
+from src.parser import Definition, Import, parse_spec
+from src.proof_print import OTHER, component_kind
+from src.scheduler import DurationHistory, schedule
+from src.verifier import DEFAULT_COMMAND, VERIFIED
+
+# Dafny display names, e.g. "HomMts (correctness)" or
+# "Impl$$_module.__default.HomMts"
+_DISPLAY_SUFFIX = re.compile(r"\s*\([^)]*\)\s*$")
+_DISPLAY_PREFIX = re.compile(r"^\w+\$\$")
+_DURATION = re.compile(r"^(?:(\d+)\.)?(\d+):(\d+):(\d+(?:\.\d*)?)$")
+
+
+class LemmaTiming:
+    """The verification time of a declaration.
+
+    === Public Attributes ===
+    name:
+        The name of the declaration.
+    seconds:
+        The time taken to verify the declaration, in seconds.
+    status:
+        The outcome of verifying the declaration.
+    resources:
+        The resources used by the verifier, or None if they are not known.
+    function:
+        The name of the definition the declaration was generated for, or the
+        empty string.
+    kind:
+        The proof component that generated the declaration, as in
+        src.proof_print.KINDS, or OTHER.
+    source:
+        The location of the definition, as "<file>:<line>", or the empty
+        string if it is not known.
+    """
+    name: str
+    seconds: float
+    status: str
+    resources: Optional[int]
+    function: str
+    kind: str
+    source: str
+
+    def __init__(self, name: str, seconds: float, status: str,
+                 resources: Optional[int] = None, function: str = "",
+                 kind: str = OTHER, source: str = "") -> None:
+        """Initialize this LemmaTiming with the given information."""
+        self.name = name
+        self.seconds = seconds
+        self.status = status
+        self.resources = resources
+        self.function = function
+        self.kind = kind
+        self.source = source
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return this LemmaTiming as a JSON object."""
+        return {"name": self.name, "seconds": round(self.seconds, 3),
+                "status": self.status, "resources": self.resources,
+                "function": self.function, "kind": self.kind,
+                "source": self.source}
+
+
+def definition_sources(input_name: str) -> Dict[str, str]:
+    """Return a dictionary mapping each function defined in the input file
+    <input_name>, or in a file it imports, to its location."""
+    sources = {}
+    visited = set()
+    stack = [input_name]
+    while stack:
+        file_name = stack.pop()
+        if os.path.abspath(file_name) in visited or \
+                not os.path.exists(file_name):
+            continue
+        visited.add(os.path.abspath(file_name))
+        with open(file_name, "r") as f:
+            for item in parse_spec(f, file_name):
+                if isinstance(item, Definition):
+                    sources.setdefault(item.name, f"{file_name}:{item.line}")
+                elif isinstance(item, Import):
+                    stack.append(os.path.join(os.path.dirname(file_name),
+                                              item.path))
+    return sources
+
+
+def parse_duration(text: str) -> float:
+    """Return the duration <text>, written as [days.]hours:minutes:seconds
+    (as in Dafny's logs) or as a number of seconds, in seconds."""
+    match = _DURATION.match(text.strip())
+    if match is None:
+        return float(text)
+    days, hours, minutes, seconds = match.groups()
+    return ((int(days or 0) * 24 + int(hours)) * 60 + int(minutes)) * 60 \
+        + float(seconds)
+
+
+def display_name(text: str) -> str:
+    """Return the name of the declaration a Dafny log entry named <text>
+    refers to."""
+    text = _DISPLAY_PREFIX.sub("", _DISPLAY_SUFFIX.sub("", text.strip()))
+    return text.rsplit(".", 1)[-1]
+
+
+def read_log(log_name: str) -> List[LemmaTiming]:
+    """Return the timing of each declaration in the CSV verification log
+    <log_name>. The entries of a declaration (e.g. its well-formedness and
+    correctness checks, or its assertion batches) are added together, and
+    its status is the first outcome that is not "Passed", if any."""
+    timings: Dict[str, LemmaTiming] = {}
+    with open(log_name, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            name = display_name(row["TestResult.DisplayName"])
+            outcome = row.get("TestResult.Outcome", "Passed")
+            status = VERIFIED if outcome == "Passed" else outcome.lower()
+            resources = row.get("TestResult.ResourceCount")
+            timing = timings.setdefault(name, LemmaTiming(name, 0.0,
+                                                          VERIFIED))
+            timing.seconds += parse_duration(row["TestResult.Duration"])
+            if resources:
+                timing.resources = (timing.resources or 0) + int(resources)
+            if timing.status == VERIFIED:
+                timing.status = status
+    return list(timings.values())
+
+
+def time_declarations(decls: List[Declaration], prelude: str = "",
+                      command: Optional[List[str]] = None,
+                      workers: Optional[int] = None,
+                      timeout: Optional[float] = None,
+                      history: Optional[DurationHistory] = None) \
+        -> List[LemmaTiming]:
+    """Return the timing of each generated declaration in <decls>, verified
+    separately by the scheduler (without its cache) with <command>. The
+    declarations are started longest first according to <history>, which is
+    updated with the new timings; by default, a history kept in memory, so
+    that no file of the working directory is read or written."""
+    if history is None:
+        history = DurationHistory(None)
+    verdicts = schedule(decls, prelude, command, workers, timeout, timeout,
+                        history=history)
+    return [LemmaTiming(name, verdict.elapsed, verdict.status)
+            for name, verdict in verdicts.items()]
+
+
+def attribute(timings: List[LemmaTiming], decls: List[Declaration],
+              sources: Dict[str, str]) -> None:
+    """Set the function, kind and source of each timing in <timings> from the
+    declaration of the same name in <decls>, and the locations of the
+    definitions in <sources>."""
+    by_name = {decl.name: decl for decl in decls}
+    for timing in timings:
+        decl = by_name.get(timing.name)
+        if decl is not None and decl.component:
+            timing.function = decl.function
+            timing.kind = component_kind(decl.component)
+            timing.source = sources.get(decl.function, "")
+
+
+def _totals(timings: List[LemmaTiming], key: str) -> Dict[str, float]:
+    """Return the total time of <timings> by the attribute <key>, largest
+    first."""
+    totals: Dict[str, float] = {}
+    for timing in timings:
+        group = getattr(timing, key) or OTHER
+        totals[group] = totals.get(group, 0.0) + timing.seconds
+    return {group: round(seconds, 3) for group, seconds in
+            sorted(totals.items(), key=lambda item: (-item[1], item[0]))}
+
+
+def make_report(output_name: str,
+                timings: List[LemmaTiming]) -> Dict[str, Any]:
+    """Return the report of <timings> for the output file <output_name>, with
+    the declarations ranked by time (and then by name)."""
+    ranked = sorted(timings, key=lambda t: (-t.seconds, t.name))
+    return {"output": output_name,
+            "seconds": round(sum(t.seconds for t in timings), 3),
+            "lemmas": [timing.to_json() for timing in ranked],
+            "kinds": _totals(timings, "kind"),
+            "functions": _totals(timings, "function")}
+
+
+def format_report(report: Dict[str, Any], top: Optional[int] = None) -> str:
+    """Return <report> as a table of its <top> slowest declarations (by
+    default, all of them), followed by the totals of each component and
+    definition."""
+    total = report["seconds"] or 1.0
+    lines = [f"{'rank':>4} {'seconds':>9} {'share':>6} {'resources':>11}  "
+             f"{'declaration':<28} {'kind':<10} {'status':<9} source"]
+    for rank, lemma in enumerate(report["lemmas"][:top], 1):
+        resources = lemma["resources"] if lemma["resources"] is not None \
+            else "-"
+        source = lemma["source"] or lemma["function"]
+        lines.append(f"{rank:>4} {lemma['seconds']:>9.3f} "
+                     f"{lemma['seconds'] / total:>6.1%} {resources:>11}  "
+                     f"{lemma['name']:<28} {lemma['kind']:<10} "
+                     f"{lemma['status']:<9} {source}")
+    for title, key in (("component", "kinds"), ("definition", "functions")):
+        lines.append("")
+        lines.append(f"by {title}:")
+        for group, seconds in report[key].items():
+            lines.append(f"  {group:<28} {seconds:>9.3f} "
+                         f"{seconds / total:>6.1%}")
+    return "\n".join(lines)
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Return a line for each declaration in <old> or <new>, ranked by the
+    change in its time from <old> to <new>, largest first."""
+    old_times = {lemma["name"]: lemma["seconds"] for lemma in old["lemmas"]}
+    new_times = {lemma["name"]: lemma["seconds"] for lemma in new["lemmas"]}
+    changes: List[Tuple[float, str, str]] = []
+    for name in set(old_times) | set(new_times):
+        before, after = old_times.get(name), new_times.get(name)
+        if before is None:
+            changes.append((after, name, f"new {after:.3f}s"))
+        elif after is None:
+            changes.append((before, name, f"removed ({before:.3f}s)"))
+        else:
+            ratio = f" {after / before:.2f}x" if before > 0 else ""
+            changes.append((abs(after - before), name,
+                            f"{before:.3f}s -> {after:.3f}s "
+                            f"({after - before:+.3f}s{ratio})"))
+    changes.sort(key=lambda change: (-change[0], change[1]))
+    lines = [f"{name:<28} {text}" for _, name, text in changes]
+    lines.append(f"{'total':<28} {old['seconds']:.3f}s -> "
+                 f"{new['seconds']:.3f}s")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the profiler from the command line, and return the exit
+    status."""
+    parser = argparse.ArgumentParser(
+        description="Rank the declarations of a generated proof by their "
+                    "verification time, and map them to the definitions and "
+                    "proof components that generated them.")
+    parser.add_argument("output", help="the generated Dafny file")
+    parser.add_argument("--input", help="the input file the proof was "
+                                        "generated from, to locate "
+                                        "definitions")
+    parser.add_argument("--log", help="a CSV verification log of the output "
+                                      "file written by Dafny; if omitted, "
+                                      "each declaration is verified")
+    parser.add_argument("--prelude", help="a Dafny file with the definitions "
+                                          "the generated code relies on")
+    parser.add_argument("--command", default=" ".join(DEFAULT_COMMAND),
+                        help="the verifier command; {file} is replaced by the "
+                             "file to verify and {timeout} by the time limit")
+    parser.add_argument("--workers", type=int,
+                        help="the number of concurrent verifier processes")
+    parser.add_argument("--timeout", type=float,
+                        help="time limit per declaration, in seconds")
+    parser.add_argument("--history",
+                        help="a file of recorded durations, read to start the "
+                             "longest declarations first and updated")
+    parser.add_argument("--top", type=int,
+                        help="the number of declarations shown")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="compare the report with a report "
+                                          "of a previous run")
+    args = parser.parse_args(argv)
+
+    with open(args.output, "r") as f:
+        decls = split_declarations(f.read())
+    if args.log:
+        timings = read_log(args.log)
+    else:
+        prelude = ""
+        if args.prelude:
+            with open(args.prelude, "r") as f:
+                prelude = f.read()
+        history = DurationHistory(args.history)
+        timings = time_declarations(decls, prelude, shlex.split(args.command),
+                                    args.workers, args.timeout, history)
+        history.save()
+    sources = definition_sources(args.input) if args.input else {}
+    attribute(timings, decls, sources)
+    report = make_report(args.output, timings)
+
+    print(format_report(report, args.top))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            old = json.load(f)
+        print()
+        print("\n".join(compare(old, report)))
+    return 0 if all(t.status == VERIFIED for t in timings) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,85 +1,287 @@
 """
 Load a Dafny program from S-expressions representing the program.
 """
-from typing import List, Union, Any, Dict
+from __future__ import annotations
 
-from sexpdata import Symbol, loads
+import os
+from typing import List, Dict, Optional, Iterable, Union, TYPE_CHECKING
 
-from src.dafny import Function, Type, Dafny
-from src.proof_print import print_all
+from src import instrument
+from src.dafny import Function, Type, NESTED
+from src.function_cache import file_digest, read_function_cache, \
+    write_function_cache
+from src.graph import order_definitions, resolve_calls
+from src.incremental import FragmentCache
+from src.parser import Definition, Header, Import, ParseError, parse_spec
+from src.proof_print import print_all, render_all, write_if_changed, \
+    get_components, get_preamble, render_parallel
 
+if TYPE_CHECKING:
+    from src.cost import CostLimits
 
-def generate_proof(input_name: str, output_name: str) -> None:
+
+def generate_proof(input_name: str, output_name: str,
+                   incremental: bool = False,
+                   cache_name: Optional[str] = None,
+                   predicates: bool = False, lifting: str = NESTED,
+                   opaque: bool = False, workers: int = 0,
+                   cached: bool = False, check_joins: bool = False,
+                   cost_limits: Optional[CostLimits] = None) -> None:
     """Given a file <input_name> with a valid S-expression representation of
     Dafny functions, write the homomorphism proof for each function in the file
-    <output_name>."""
-    f = open(input_name, "r")
-    contents = f"({f.read()})".replace('{', '"').replace('}', '"')
-    parsed = loads(contents)
-    aux_dict = _read_functions(parsed[0])
-    funcs = []
-    for definition in parsed[1:]:
-        cur_func = _load_function(definition, avail_aux=funcs, indices=aux_dict)
-        funcs.append(cur_func)
-
-    for name in aux_dict:
-        if name not in aux_dict:
-            print(f"Function {name} was not defined.")
+    <output_name>. Raise a ParseError if the input is not valid.
+    If <incremental> is True, the proof components of functions that have not
+    changed since the previous run are read from the cache <cache_name>
+    (by default, <output_name> followed by ".cache"), and <output_name> is only
+    rewritten if its contents change.
+    If <predicates> is True, the equalities required by each associativity
+    lemma are stated once, in a predicate named WellFormed<function name>.
+    <lifting> is the lifting strategy of the functions, NESTED or FLAT.
+    If <opaque> is True, the lifted functions and joins are opaque, each lemma
+    reveals only the definitions it needs, and the facts about sequence
+    concatenation are proved by shared helper lemmas.
+    If <workers> is greater than 1 (and <incremental> is False), the functions
+    are rendered concurrently on <workers> processes.
+    If <cached> is True, the functions are loaded from the binary cache of
+    <input_name> while it is up to date (see load_functions).
+    If <check_joins> is True, the joins are first checked on random inputs
+    (see src.checker), and a JoinCheckError with a counterexample is raised,
+    before any proof is written, if one of them is wrong or cannot be
+    checked.
+    If <cost_limits> is given, a ProofCostError is raised, before any proof is
+    written, if the estimated cost of a proof exceeds one of the limits (see
+    src.cost)."""
+    start = instrument.begin(f"generate_proof {input_name}") \
+        if instrument.ENABLED else 0.0
+    funcs = load_functions(input_name, lifting, cached)
+    if check_joins:
+        # NumPy is only needed when checking
+        from src.checker import require_valid_joins
+        require_valid_joins(funcs)
+    if cost_limits is not None:
+        from src.cost import require_within_limits
+        require_within_limits(funcs, cost_limits, predicates, opaque)
+    components = get_components(predicates, opaque)
+    preamble = get_preamble(opaque)
+    if incremental:
+        cache = FragmentCache(cache_name or f"{output_name}.cache")
+        write_if_changed(output_name, "".join(
+            render_all(funcs, cache, components, preamble)))
+        cache.save()
+    elif workers > 1:
+        write_if_changed(output_name, "".join(
+            render_parallel(funcs, workers, components, preamble)))
+    else:
+        print_all(output_name, funcs, components, preamble)
+    if start:
+        instrument.end(start, "generate_proof",
+                       output_bytes=os.path.getsize(output_name))
 
-    print_all(output_name, funcs)
 
+def load_functions(input_name: str, lifting: str = NESTED,
+                   cached: bool = False) -> List[Function]:
+    """Return the functions defined in the file <input_name>, in the order in
+    which they are defined, lifted with the strategy <lifting>. Raise a
+    ParseError if the input is not valid. The functions imported by the file,
+    and their aux functions, come first, so that the proof of the returned
+    functions is self-contained.
+    If <cached> is True, the functions are read from the binary cache written
+    next to <input_name> if it was built from the current contents of the
+    file and of the files it imports, skipping parsing entirely; otherwise the
+    cache is rewritten."""
+    digest = file_digest(input_name) if cached else None
+    if cached:
+        funcs = read_function_cache(input_name, lifting, digest)
+        if funcs is not None:
+            return funcs
+    files = {}
+    loaded = load_file(input_name, lifting, files)
+    funcs = imported_closure(loaded) + loaded.functions
+    if cached:
+        dependencies = [name for name in files
+                        if name != os.path.abspath(input_name)]
+        write_function_cache(input_name, funcs, lifting, digest, dependencies)
+    return funcs
 
-def _read_functions(func_list: List[Union[List[Any], Symbol, str]]) \
-        -> Dict[str, int]:
-    """Construct a dictionary of (name, index) pairs from the parsed
-    S-expression <func_list> representing a list of functions.
-    Format of <func_list>:
-    ["functions", <functions>]
-    """
-    return {name.value(): i for (i, name) in enumerate(func_list[1:])}
-
-
-def _get_strings(lst: List[Symbol]) -> List[str]:
-    """Given a list of Symbols, return a list of corresponding strings."""
-    return [symbol.value() for symbol in lst]
-
-
-def _load_function(func_exp: List[Union[List[Any], Symbol, str]],
-                   avail_aux: List[Function], indices: Dict[str, int]) \
-        -> Function:
-    """Construct a Dafny Function from the parsed S-expression <func_exp>
-    representing the function definition. <avail_aux> is a list of functions
-    that have already been defined, and <indices> is a dictionary of
-    (name, index) pairs, where the indices are into <avail_aux>.
-    Format of <func_exp>:
-    ["definition", <name>,
-        ["type", [<param_types>], <return_type>],
-        ["body", ["function", [<param_names>], <body>]],
-        ["join", ["function", [<join_param_names>], <join_body>]],
-        ["decreases", [<decreases>]],
-        ["requires", [<requires>]],
-        ["ensures", [<ensures>]],
-        ["aux", [<aux>]]
-    ]
+
+class LoadedFile:
+    """The functions of an input file, once its imports are resolved.
+
+    === Public Attributes ===
+    input_name:
+        The name of the input file.
+    functions:
+        The functions defined in the file, in the order in which they are
+        defined.
+    imported:
+        The functions imported by the file, by name, in the order in which
+        they are imported.
     """
-    try:
-        name = func_exp[1].value()
-        param_types = [eval(symbol.value()) for symbol in func_exp[2][1]]
-        param_names = _get_strings(func_exp[3][1][1])
-        return_type = Type([Type([], eval(func_exp[2][2].value()))])
-        decreases = func_exp[5][1]
-        requires = func_exp[6][1]
-        ensures = func_exp[7][1]
-        aux_names = _get_strings(func_exp[8][1])
-        body = func_exp[3][1][2]
-        join_param_names = _get_strings(func_exp[4][1][1])
-        join_body = func_exp[4][1][2]
-        aux = []
-        for cur in aux_names:
-            aux.append(avail_aux[indices[cur]])
-    except IndexError:
-        print(f"Unrecognized input format.")
-    else:
-        return Function(name, param_names, param_types, return_type,
-                        decreases, requires, ensures, aux, body,
-                        join_param_names, join_body)
+    input_name: str
+    functions: List[Function]
+    imported: Dict[str, Function]
+
+    def __init__(self, input_name: str, functions: List[Function],
+                 imported: Dict[str, Function]) -> None:
+        """Initialize this LoadedFile with the given information."""
+        self.input_name = input_name
+        self.functions = functions
+        self.imported = imported
+
+
+def load_file(input_name: str, lifting: str,
+              files: Dict[str, LoadedFile],
+              loading: Optional[List[str]] = None) -> LoadedFile:
+    """Return the loaded input file <input_name>, loading the files it
+    imports first. <files> maps the absolute path of each file loaded so far
+    to its LoadedFile, and is updated, so that a file imported by several
+    files is loaded once and its Functions are shared. <loading> is the list
+    of the absolute paths of the files whose imports are being loaded. Raise a
+    ParseError if an imported file or function does not exist, if the
+    imports form a cycle, or if a function of the file has the name of a
+    function it imports, directly or not."""
+    path = os.path.abspath(input_name)
+    if path in files:
+        return files[path]
+    loading = (loading or []) + [path]
+    with open(input_name, "r") as f:
+        items = list(parse_spec(f, input_name))
+
+    imported = {}
+    for item in items:
+        if not isinstance(item, Import):
+            continue
+        target = os.path.abspath(os.path.join(os.path.dirname(input_name),
+                                              item.path))
+        if target in loading:
+            cycle = loading[loading.index(target):] + [target]
+            raise ParseError(f"cyclic imports: "
+                             f"{' -> '.join(map(os.path.relpath, cycle))}",
+                             input_name, item.line, item.column)
+        if not os.path.isfile(target):
+            raise ParseError(f"imported file {item.path} does not exist",
+                             input_name, item.line, item.column)
+        library = load_file(target, lifting, files, loading)
+        defined = {func.name: func for func in library.functions}
+        for name in item.names or list(defined):
+            if name not in defined:
+                raise ParseError(f"{item.path} does not define {name}",
+                                 input_name, item.line, item.column)
+            if imported.get(name, defined[name]) is not defined[name]:
+                raise ParseError(f"function {name} is imported twice",
+                                 input_name, item.line, item.column)
+            imported[name] = defined[name]
+
+    loaded = LoadedFile(input_name, build_functions(
+        items, input_name, lifting, imported), imported)
+    _check_collisions(loaded, items, files)
+    files[path] = loaded
+    return loaded
+
+
+def _check_collisions(loaded: LoadedFile,
+                      items: List[Union[Header, Import, Definition]],
+                      files: Dict[str, LoadedFile]) -> None:
+    """Raise a ParseError if a function defined by the parsed <items> of
+    <loaded> has the name of a function it imports, directly or through the
+    aux functions and calls of an imported function, since both would be
+    printed in the proof. <files> are the files loaded so far, as in
+    load_file."""
+    definitions = {item.name: item for item in items
+                   if isinstance(item, Definition)}
+    for func in imported_closure(loaded):
+        definition = definitions.get(func.name)
+        if definition is None:
+            continue
+        library = next(other.input_name for other in files.values()
+                       if any(func is each for each in other.functions))
+        raise ParseError(f"function {func.name} is also defined in "
+                         f"{os.path.relpath(library)}, which is imported",
+                         loaded.input_name, definition.line,
+                         definition.column)
+
+
+def imported_closure(loaded: LoadedFile) -> List[Function]:
+    """Return the functions imported by <loaded> and the functions they
+    refer to through aux functions and calls, directly or not, each once,
+    with aux functions before the functions that use them."""
+    result = []
+    seen = set()
+    for root in loaded.imported.values():
+        stack = [(root, False)]
+        while stack:
+            func, expanded = stack.pop()
+            if expanded:
+                result.append(func)
+            elif id(func) not in seen:
+                seen.add(id(func))
+                stack.append((func, True))
+                stack.extend((ref, False)
+                             for ref in reversed(func.references()))
+    return result
+
+
+def build_functions(items: Iterable[Union[Header, Import, Definition]],
+                    file_name: str, lifting: str = NESTED,
+                    imported: Optional[Dict[str, Function]] = None) \
+        -> List[Function]:
+    """Return the functions defined by the parsed <items> of the file named
+    <file_name>, in the order in which they are defined, lifted with the
+    strategy <lifting>. Aux functions may be defined in any order, or be
+    among the already constructed functions <imported>, by name; raise a
+    ParseError if one is not defined, or if they form a cycle. Imports are
+    resolved by load_file, so a ParseError is raised if <items> contain an
+    import and <imported> is not given."""
+    names = []
+    definitions = []
+    for item in items:
+        if isinstance(item, Header):
+            names.extend(item.names)
+        elif isinstance(item, Import):
+            if imported is None:
+                raise ParseError("imports are only resolved when loading "
+                                 "an input file", file_name, item.line,
+                                 item.column)
+        else:
+            definitions.append(item)
+
+    defined = dict(imported or {})
+    for level in order_definitions(definitions, file_name, defined):
+        for definition in level:
+            defined[definition.name] = _load_function(definition, defined,
+                                                      file_name, lifting)
+
+    for name in names:
+        if name not in defined:
+            print(f"Function {name} was not defined.")
+    funcs = [defined[definition.name] for definition in definitions]
+    resolve_calls(funcs, defined)
+    return funcs
+
+
+def _load_function(definition: Definition, avail_aux: Dict[str, Function],
+                   file_name: str, lifting: str = NESTED) -> Function:
+    """Construct a Dafny Function from the parsed <definition>. <avail_aux>
+    is a dictionary of (name, function) pairs of the functions that have
+    already been constructed from the file named <file_name>, which must
+    include every aux function of <definition>. <lifting> is the lifting
+    strategy of the Function."""
+    start = instrument.begin(f"load_function {definition.name}") \
+        if instrument.ENABLED else 0.0
+    aux = []
+    for cur in definition.aux:
+        if cur not in avail_aux:
+            raise ParseError(f"aux function {cur} of {definition.name} is "
+                             f"not defined", file_name,
+                             definition.line, definition.column)
+        aux.append(avail_aux[cur])
+    return_type = Type([Type([], definition.return_type)])
+    func = Function(definition.name, definition.param_names,
+                    definition.param_types, return_type, definition.decreases,
+                    definition.requires, definition.ensures, aux,
+                    definition.body, definition.join_param_names,
+                    definition.join_body, lifting)
+    if start:
+        instrument.end(start, "load_function", func.name,
+                       components=len(func.flatten_data([])))
+    return func
@@ -1,31 +1,241 @@
 """Functions to print the proofs for the given Dafny functions."""
 from __future__ import annotations
 
-from typing import List, Callable
+import filecmp
+import inspect
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Callable, Iterator, Union, IO, Generator, Optional, \
+    Tuple, Dict, TYPE_CHECKING
 
+from src import instrument
 from src.dafny import Function
 from src.format import pp_lifted_function, pp_lifted_join, pp_assoc_proof, \
-    pp_hom_proof
+    pp_hom_proof, pp_well_formed, pp_hom_helpers
 
-all_components = [pp_lifted_function, pp_lifted_join, pp_assoc_proof,
-                  pp_hom_proof]
+if TYPE_CHECKING:
+    from src.incremental import FragmentCache
 
 
-def print_result(file_name: str, funcs: List[Function],
-                 to_call: Callable) -> None:
-    """Print the result of calling <to_call> on each function in <funcs>,
-    to the file named <file_name>."""
-    f = open(file_name, "a")
+class Component:
+    """A proof component: a function of src/format.py that renders one
+    declaration of the proof of a Function, called with the rendering options
+    it accepts.
+
+    === Public Attributes ===
+    render:
+        The function of src/format.py.
+    options:
+        The keyword arguments <render> is called with, such as opaque=True.
+    __name__:
+        The name of <render>.
+    key:
+        A string identifying the output of this Component, which differs for
+        different options.
+    """
+    render: Callable[..., str]
+    options: Dict[str, bool]
+    __name__: str
+    key: str
+
+    def __init__(self, render: Callable[..., str], **options: bool) -> None:
+        """Initialize this Component, which calls <render> with
+        <options>."""
+        self.render = render
+        self.options = options
+        self.__name__ = render.__name__
+        self.key = self.__name__ + "".join(
+            f" {name}" for name, value in sorted(options.items()) if value)
+
+    def __call__(self, func: Function) -> str:
+        """Return the declaration rendered for <func>."""
+        return self.render(func, **self.options)
+
+    def __repr__(self) -> str:
+        return f"Component({self.key})"
+
+
+def get_components(predicates: bool = False,
+                   opaque: bool = False) -> List[Component]:
+    """Return the proof components, in the order in which they are printed.
+    If <predicates> is True, the associativity lemmas require a predicate for
+    each function (rendered by pp_well_formed) instead of inlining its
+    equalities. If <opaque> is True, the lifted functions and joins are
+    opaque, and the lemmas reveal them."""
+    components = [Component(pp_lifted_function, opaque=opaque),
+                  Component(pp_lifted_join, opaque=opaque)]
+    if predicates:
+        components.append(Component(pp_well_formed))
+    components.append(Component(pp_assoc_proof, predicates=predicates,
+                                opaque=opaque))
+    components.append(Component(pp_hom_proof, opaque=opaque))
+    return components
+
+
+all_components = get_components()
+
+# The name reported for each proof component of src/format.py
+KINDS = {
+    "pp_lifted_function": "Function",
+    "pp_lifted_join": "Join",
+    "pp_assoc_proof": "JoinAssoc",
+    "pp_hom_proof": "Hom",
+    "pp_well_formed": "WellFormed",
+    "pp_hom_helpers": "Helpers",
+}
+
+# The kind of declarations that were not generated, such as those of a prelude
+OTHER = "Other"
+
+
+def component_kind(component: str) -> str:
+    """Return the name in KINDS of the proof component named <component>."""
+    return KINDS.get(component, OTHER)
+
+
+# Size of the buffer used when writing an output file
+BUFFER_SIZE = 1 << 16
+
+# A sink is either a file-like object, or a generator that receives each piece
+# of output through send()
+Sink = Union[IO[str], Generator[None, str, None]]
+
+
+def render_result(funcs: List[Function], to_call: Callable,
+                  cache: Optional[FragmentCache] = None) -> Iterator[str]:
+    """Yield the result of calling <to_call> on each function in <funcs>,
+    followed by a blank line. Empty results are skipped. If <cache> is given,
+    results are looked up in it instead of being rendered again."""
     for func in funcs:
-        result = to_call(func)
+        start = instrument.begin(f"{to_call.__name__} {func.name}") \
+            if instrument.ENABLED else 0.0
+        result = cache.render(func, to_call) if cache else to_call(func)
+        if start:
+            instrument.end(start, "render", func.name, to_call.__name__,
+                           len(result.encode()),
+                           len(func.flatten_data([])))
         if result:
-            f.write(to_call(func) + "\n\n")
+            yield result + "\n\n"
+
+
+def get_preamble(opaque: bool = False) -> str:
+    """Return the declarations printed once before the proofs, which are
+    needed if <opaque> is True."""
+    return pp_hom_helpers() if opaque else ""
+
+
+def render_all(funcs: List[Function],
+               cache: Optional[FragmentCache] = None,
+               components: Optional[List[Callable]] = None,
+               preamble: str = "") -> Iterator[str]:
+    """Yield <preamble>, followed by the result of calling all proof
+    components (or the components in <components>) on each function in
+    <funcs>, in the order in which they are printed. Each component is called
+    at most once per function."""
+    if preamble:
+        yield preamble + "\n\n"
+    for component in components or all_components:
+        yield from render_result(funcs, component, cache)
+
+
+def render_parallel(funcs: List[Function], workers: Optional[int] = None,
+                    components: Optional[List[Callable]] = None,
+                    preamble: str = "") -> Iterator[str]:
+    """Yield the same pieces of output as render_all, rendering the functions
+    of <funcs> concurrently, on a pool of <workers> processes (by default, one
+    per CPU). Rendering a function does not depend on the output of any
+    other, so every function is submitted at once. <funcs> and the components
+    are sent once to each process, and each job only names a function and a
+    component by index."""
+    components = components or all_components
+    workers = workers or os.cpu_count() or 1
+    jobs = [(i, j) for i in range(len(components)) for j in range(len(funcs))]
+    # A few chunks per process balance the load without a round trip per job
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(funcs, components)) as executor:
+        results = list(executor.map(_render_job, jobs, chunksize=chunksize))
+    if preamble:
+        yield preamble + "\n\n"
+    for result in results:
+        if result:
+            yield result + "\n\n"
+
+
+# The functions and components of the render_parallel call a worker process
+# renders, set by _init_worker
+_worker_state: Tuple[List[Function], List[Callable]] = ([], [])
+
+
+def _init_worker(funcs: List[Function], components: List[Callable]) -> None:
+    """Store the <funcs> and <components> of render_parallel in this worker
+    process."""
+    global _worker_state
+    _worker_state = funcs, components
+
+
+def _render_job(job: Tuple[int, int]) -> str:
+    """Return the result of calling the component at the first index of <job>
+    on the function at its second index. This is run in a worker process by
+    render_parallel."""
+    funcs, components = _worker_state
+    component, func = job
+    return components[component](funcs[func])
+
+
+def write_all(sink: Sink, funcs: List[Function],
+              components: Optional[List[Callable]] = None,
+              preamble: str = "") -> None:
+    """Write <preamble>, followed by the result of calling all proof
+    components (or the components in <components>) on each function in
+    <funcs>, to <sink>."""
+    if hasattr(sink, "write"):
+        write = sink.write
+    else:
+        # Start the generator if it has not been started yet
+        if inspect.getgeneratorstate(sink) == inspect.GEN_CREATED:
+            next(sink)
+        write = sink.send
+    for text in render_all(funcs, components=components, preamble=preamble):
+        write(text)
+
+
+def print_all(file_name: str, funcs: List[Function],
+              components: Optional[List[Callable]] = None,
+              preamble: str = "") -> None:
+    """Print <preamble>, followed by the result of calling all proof
+    components (or the components in <components>) on each function in
+    <funcs>, to the file named <file_name>.
+    The output is written to a temporary file first, which then replaces
+    <file_name>, so that <file_name> never contains a partial proof. If the
+    output is unchanged, <file_name> is left untouched."""
+    temp_name = f"{file_name}.{os.getpid()}.tmp"
+    try:
+        with open(temp_name, "w", buffering=BUFFER_SIZE) as f:
+            write_all(f, funcs, components, preamble)
+        if not (os.path.isfile(file_name) and
+                filecmp.cmp(temp_name, file_name, shallow=False)):
+            os.replace(temp_name, file_name)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
 
 
-def print_all(file_name: str, funcs: List[Function]) -> None:
-    """Print the result of calling all proof components on each function in
-    <funcs>, to the file named <file_name>."""
-    # Clear the previous output
-    open(file_name, "w")
-    for component in all_components:
-        print_result(file_name, funcs, component)
+def write_if_changed(file_name: str, text: str) -> bool:
+    """Write <text> to the file named <file_name>, unless the file already
+    contains exactly <text>. Return whether the file was written."""
+    try:
+        with open(file_name, "r", newline="") as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    temp_name = f"{file_name}.{os.getpid()}.tmp"
+    try:
+        with open(temp_name, "w", newline="") as f:
+            f.write(text)
+        os.replace(temp_name, file_name)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+    return True
@@ -0,0 +1,394 @@
+"""
+Verify the declarations of a generated proof concurrently, longest first.
+
+Usage:
+    python -m src.scheduler <output file> [--prelude <file>]
+                            [--command <command>] [--workers <n>]
+                            [--timeout <seconds>] [--max-timeout <seconds>]
+                            [--factor <n>] [--cache <file>]
+                            [--history <file>]
+
+Each generated declaration is verified in a job file of its own, as by
+src/verifier.py, on a pool of <workers> concurrent verifier processes. A job
+is started once the jobs of the declarations it depends on have finished, and
+is skipped if one of them did not verify. Among the jobs that can be started,
+the one expected to take longest is started first: the duration of each
+declaration is recorded in the history file, and declarations without a
+recorded duration are assumed to take as long as the slowest one.
+
+A job that exceeds its time limit is retried with a limit <factor> times
+larger, until the limit exceeds <max-timeout>. A declaration that took long in
+a previous run starts with a larger limit, so that it is not first run with a
+limit it is known to exceed. "{timeout}" in the verifier command is replaced by
+the time limit in whole seconds (e.g. for Dafny's --verification-time-limit),
+and a failure whose output reports "timed out" counts as a timeout.
+
+The verifier command can be any program that exits with status 0 if and only
+if the file passed to it verifies, so the scheduler can be tried with a stub.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import shlex
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait, \
+    FIRST_COMPLETED
+from typing import List, Dict, Optional, Callable
+
+from src.declarations import Declaration, split_declarations
+from src.verifier import DEFAULT_COMMAND, DEFAULT_CACHE, VERIFIED, FAILED, \
+    TIMEOUT, ERROR, Verdict, VerificationCache, fingerprint, make_job, \
+    run_verifier
+
+DEFAULT_HISTORY = ".verification_history.json"
+DEFAULT_FACTOR = 4.0
+
+# The status of a declaration that was not verified because a declaration it
+# depends on did not verify
+SKIPPED = "skipped"
+
+# The time the verifier process is given beyond a limit passed to the verifier
+# itself, to report the timeout
+_GRACE = 10.0
+_TIMED_OUT = "timed out"
+
+
+class DurationHistory:
+    """The verification time of each declaration in previous runs, keyed by
+    declaration name, so that it survives changes to the declarations.
+
+    === Public Attributes ===
+    file_name:
+        The name of the file the history is stored in, or None if it is only
+        kept in memory.
+
+    === Private Attributes ===
+    _seconds:
+        A dictionary mapping the name of each declaration to its last
+        verification time, or to the largest time limit it exceeded.
+    _lock:
+        A lock held while <_seconds> is changed.
+    """
+    file_name: Optional[str]
+    _seconds: Dict[str, float]
+    _lock: threading.Lock
+
+    def __init__(self, file_name: Optional[str] = DEFAULT_HISTORY) -> None:
+        """Initialize this DurationHistory, loading the durations stored in
+        <file_name> if it exists. If <file_name> is None, the history starts
+        empty and is never written."""
+        self.file_name = file_name
+        self._seconds = {}
+        self._lock = threading.Lock()
+        if file_name is not None and os.path.exists(file_name):
+            try:
+                with open(file_name, "r") as f:
+                    self._seconds = json.load(f)
+            except (OSError, ValueError):
+                self._seconds = {}
+
+    def get(self, name: str) -> Optional[float]:
+        """Return the recorded duration of the declaration <name>, or None."""
+        return self._seconds.get(name)
+
+    def longest(self) -> float:
+        """Return the longest recorded duration, or 0 if there is none."""
+        return max(self._seconds.values(), default=0.0)
+
+    def record(self, name: str, verdict: Verdict,
+               limit: Optional[float] = None) -> None:
+        """Record the duration of the declaration <name> from <verdict>. A
+        timeout with the time limit <limit> is recorded as <limit>, unless a
+        larger duration is already recorded."""
+        with self._lock:
+            if verdict.status == TIMEOUT:
+                seconds = max(limit or verdict.elapsed, verdict.elapsed)
+                self._seconds[name] = max(self._seconds.get(name, 0.0),
+                                          seconds)
+            elif verdict.status in (VERIFIED, FAILED):
+                self._seconds[name] = verdict.elapsed
+
+    def save(self) -> None:
+        """Write the durations to <file_name>, if there is one."""
+        if self.file_name is None:
+            return
+        temp_name = f"{self.file_name}.{os.getpid()}.tmp"
+        with open(temp_name, "w") as f:
+            json.dump(self._seconds, f, indent=1, sort_keys=True)
+        os.replace(temp_name, self.file_name)
+
+
+class VerificationJob:
+    """The verification of a single declaration.
+
+    === Public Attributes ===
+    decl:
+        The declaration to verify.
+    key:
+        The fingerprint of <decl>, by which its verdict is cached.
+    program:
+        The Dafny program that verifies <decl>.
+    dependencies:
+        The names of the declarations whose jobs must finish before this one
+        is started.
+    estimate:
+        The expected duration of this job, in seconds.
+    limit:
+        The time limit of the next attempt, in seconds, or None for no limit.
+    attempts:
+        The verdict of each attempt so far.
+    """
+    decl: Declaration
+    key: str
+    program: str
+    dependencies: List[str]
+    estimate: float
+    limit: Optional[float]
+    attempts: List[Verdict]
+
+    def __init__(self, decl: Declaration, key: str, program: str,
+                 dependencies: List[str], estimate: float,
+                 limit: Optional[float]) -> None:
+        """Initialize this VerificationJob with the given information."""
+        self.decl = decl
+        self.key = key
+        self.program = program
+        self.dependencies = dependencies
+        self.estimate = estimate
+        self.limit = limit
+        self.attempts = []
+
+    @property
+    def name(self) -> str:
+        """Return the name of the declaration of this job."""
+        return self.decl.name
+
+    def verdict(self) -> Verdict:
+        """Return the verdict of the last attempt, with the total time taken
+        by every attempt."""
+        last = self.attempts[-1]
+        return Verdict(last.status, sum(v.elapsed for v in self.attempts),
+                       last.output, last.cached)
+
+
+def limit_command(command: List[str], limit: Optional[float]) -> List[str]:
+    """Return <command> with every "{timeout}" replaced by <limit>, in whole
+    seconds."""
+    seconds = str(math.ceil(limit)) if limit is not None else "0"
+    return [arg.replace("{timeout}", seconds) for arg in command]
+
+
+def run_attempt(job: VerificationJob, directory: str,
+                command: List[str]) -> Verdict:
+    """Run one attempt of <job>, with its job file in <directory>, and return
+    its verdict."""
+    job_name = os.path.join(directory, f"{job.name}.{len(job.attempts)}.dfy")
+    with open(job_name, "w") as f:
+        f.write(job.program)
+    limited = any("{timeout}" in arg for arg in command)
+    timeout = job.limit
+    if limited and timeout is not None:
+        timeout += _GRACE
+    verdict = run_verifier(job_name, limit_command(command, job.limit),
+                           timeout)
+    if verdict.status == FAILED and limited and _TIMED_OUT in verdict.output:
+        verdict.status = TIMEOUT
+    return verdict
+
+
+def first_limit(timeout: Optional[float], max_timeout: Optional[float],
+                factor: float, recorded: Optional[float]) -> Optional[float]:
+    """Return the time limit of the first attempt of a declaration that took
+    <recorded> seconds in a previous run (None if it was never verified): the
+    first limit in the sequence <timeout>, <timeout> * <factor>, ... that
+    exceeds <recorded>, at most <max_timeout>."""
+    if timeout is None:
+        return None
+    limit = timeout
+    while recorded is not None and limit <= recorded and \
+            (max_timeout is None or limit * factor <= max_timeout):
+        limit *= factor
+    return limit
+
+
+def make_jobs(decls: List[Declaration], prelude: str, command: List[str],
+              history: DurationHistory, timeout: Optional[float],
+              max_timeout: Optional[float],
+              factor: float) -> List[VerificationJob]:
+    """Return a job for each generated declaration in <decls>."""
+    by_name = {decl.name: decl for decl in decls}
+    order = [decl.name for decl in decls]
+    generated = {decl.name for decl in decls if decl.component}
+    unknown = history.longest()
+    jobs = []
+    for decl in decls:
+        if not decl.component:
+            continue
+        recorded = history.get(decl.name)
+        jobs.append(VerificationJob(
+            decl, fingerprint(decl, by_name, prelude, command),
+            make_job(decl, by_name, order, prelude),
+            [name for name in decl.dependencies if name in generated],
+            recorded if recorded is not None else unknown,
+            first_limit(timeout, max_timeout, factor, recorded)))
+    return jobs
+
+
+def schedule(decls: List[Declaration], prelude: str = "",
+             command: Optional[List[str]] = None,
+             workers: Optional[int] = None,
+             timeout: Optional[float] = None,
+             max_timeout: Optional[float] = None,
+             factor: float = DEFAULT_FACTOR,
+             cache: Optional[VerificationCache] = None,
+             history: Optional[DurationHistory] = None,
+             on_verdict: Optional[Callable[[str, Verdict], None]] = None) \
+        -> Dict[str, Verdict]:
+    """Verify each generated declaration in <decls> separately, on <workers>
+    concurrent verifier processes (by default, one per CPU), and return a
+    dictionary mapping the name of each declaration to its verdict, in the
+    order of <decls>.
+
+    Jobs are started in dependency order, longest first according to
+    <history>, which is updated with the new durations. An attempt that
+    exceeds its time limit (initially <timeout>, or None for no limit) is
+    retried with a limit <factor> times larger, up to <max_timeout>.
+    Declarations with a VERIFIED verdict in <cache> are not verified again,
+    and new verdicts are recorded in <cache>. <on_verdict> is called with the
+    name and verdict of each declaration as soon as it is known."""
+    command = command or DEFAULT_COMMAND
+    history = history if history is not None else DurationHistory()
+    jobs = {job.name: job
+            for job in make_jobs(decls, prelude, command, history, timeout,
+                                 max_timeout, factor)}
+    verdicts: Dict[str, Verdict] = {}
+
+    def finish(job: VerificationJob, verdict: Verdict) -> None:
+        verdicts[job.name] = verdict
+        if on_verdict is not None:
+            on_verdict(job.name, verdict)
+
+    waiting = []
+    for job in jobs.values():
+        verdict = cache.get(job.key) if cache is not None else None
+        if verdict is not None and verdict.status == VERIFIED:
+            finish(job, verdict)
+        else:
+            waiting.append(job)
+
+    running: Dict[Future, VerificationJob] = {}
+    with tempfile.TemporaryDirectory() as directory, \
+            ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        while waiting or running:
+            ready = []
+            for job in waiting:
+                statuses = [verdicts[name].status for name in job.dependencies
+                            if name in verdicts]
+                if any(status != VERIFIED for status in statuses):
+                    blocked = next(name for name in job.dependencies
+                                   if name in verdicts and
+                                   verdicts[name].status != VERIFIED)
+                    finish(job, Verdict(SKIPPED, 0.0,
+                                        f"{blocked} did not verify"))
+                elif len(statuses) == len(job.dependencies):
+                    ready.append(job)
+            if not ready and not running:
+                # The remaining jobs depend on each other
+                ready = [job for job in waiting if job.name not in verdicts]
+            waiting = [job for job in waiting
+                       if job not in ready and job.name not in verdicts]
+            ready.sort(key=lambda j: (j.estimate, len(j.program)),
+                       reverse=True)
+            for job in ready:
+                running[pool.submit(run_attempt, job, directory,
+                                    command)] = job
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                verdict = future.result()
+                job.attempts.append(verdict)
+                history.record(job.name, verdict, job.limit)
+                if verdict.status == TIMEOUT and job.limit is not None and \
+                        (max_timeout is None or
+                         job.limit * factor <= max_timeout):
+                    job.limit *= factor
+                    job.estimate = job.limit
+                    waiting.append(job)
+                    continue
+                verdict = job.verdict()
+                if cache is not None and verdict.status != ERROR:
+                    cache.put(job.key, verdict)
+                finish(job, verdict)
+    return {name: verdicts[name] for name in jobs}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the scheduler from the command line, and return the exit
+    status."""
+    parser = argparse.ArgumentParser(
+        description="Verify the declarations of a generated proof "
+                    "concurrently, longest first, retrying timeouts with "
+                    "larger time limits.")
+    parser.add_argument("output", help="the generated Dafny file")
+    parser.add_argument("--prelude", help="a Dafny file with the definitions "
+                                          "the generated code relies on")
+    parser.add_argument("--command", default=" ".join(DEFAULT_COMMAND),
+                        help="the verifier command; {file} is replaced by the "
+                             "file to verify and {timeout} by the time limit")
+    parser.add_argument("--workers", type=int,
+                        help="the number of concurrent verifier processes "
+                             "(default: one per CPU)")
+    parser.add_argument("--timeout", type=float,
+                        help="the time limit of the first attempt, in seconds")
+    parser.add_argument("--max-timeout", type=float,
+                        help="the largest time limit, in seconds")
+    parser.add_argument("--factor", type=float, default=DEFAULT_FACTOR,
+                        help="the factor by which the time limit grows after "
+                             f"a timeout (default: {DEFAULT_FACTOR:g})")
+    parser.add_argument("--cache", default=DEFAULT_CACHE,
+                        help=f"the cache file (default: {DEFAULT_CACHE})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="verify every declaration again")
+    parser.add_argument("--history", default=DEFAULT_HISTORY,
+                        help="the file of recorded durations "
+                             f"(default: {DEFAULT_HISTORY})")
+    args = parser.parse_args(argv)
+    if args.factor <= 1:
+        parser.error("--factor must be greater than 1")
+
+    with open(args.output, "r") as f:
+        decls = split_declarations(f.read())
+    prelude = ""
+    if args.prelude:
+        with open(args.prelude, "r") as f:
+            prelude = f.read()
+    cache = None if args.no_cache else VerificationCache(args.cache)
+    history = DurationHistory(args.history)
+
+    start = time.perf_counter()
+    verdicts = schedule(decls, prelude, shlex.split(args.command),
+                        args.workers, args.timeout, args.max_timeout,
+                        args.factor, cache, history,
+                        lambda name, verdict: print(f"{name}: {verdict}",
+                                                    flush=True))
+    wall = time.perf_counter() - start
+    history.save()
+    if cache is not None:
+        cache.save()
+    total = sum(v.elapsed for v in verdicts.values() if not v.cached)
+    verified = sum(v.status == VERIFIED for v in verdicts.values())
+    print(f"{verified}/{len(verdicts)} verified in {wall:.2f}s "
+          f"({total:.2f}s of verifier time)")
+    return 0 if verified == len(verdicts) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
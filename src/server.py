@@ -0,0 +1,366 @@
+"""
+Serve proof generation over HTTP, on a TCP port or a Unix socket.
+
+Usage:
+    python -m src.server [--host <host>] [--port <port>] [--unix <path>]
+                         [--workers <n>] [--cache-size <n>]
+
+Endpoints:
+    POST /generate  The body is a JSON object with the text of an input file
+                    as "spec", and optionally "predicates", "opaque" (booleans)
+                    and "lifting" ("nested" or "flat"). The response is the
+                    proof, as text, or a JSON object with an "error".
+    GET /metrics    Request, cache, queue depth and latency metrics, as JSON.
+    GET /health     "ok".
+
+Proofs are rendered on a pool of worker processes, so that the server keeps
+accepting requests while proofs are rendered. The workers are not forked from
+the server, so they never hold copies of its sockets. Responses are cached by a hash
+of the request, and identical requests that arrive while a proof is being
+rendered share its result.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple, Any, Deque
+
+from src.api import generate_text
+from src.dafny import NESTED, LIFTINGS
+from src.parser import ParseError
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 256
+# The number of recent latencies the latency metrics are computed from
+LATENCY_WINDOW = 1024
+# The largest request body accepted, in bytes
+MAX_BODY = 16 << 20
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large",
+            500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """An invalid request, answered with the HTTP status <status>."""
+
+    def __init__(self, status: int, message: str) -> None:
+        """Initialize this RequestError with the given information."""
+        super().__init__(message)
+        self.status = status
+
+
+def render_request(spec: str, predicates: bool, opaque: bool,
+                   lifting: str) -> Tuple[bool, str]:
+    """Return (True, <proof>) for the input file text <spec>, or (False,
+    <error message>) if <spec> is not valid. This is run in a worker
+    process."""
+    try:
+        return True, generate_text(spec, predicates=predicates, opaque=opaque,
+                                   lifting=lifting)
+    except ParseError as e:
+        return False, str(e)
+
+
+class ProofServer:
+    """A proof generation server.
+
+    === Public Attributes ===
+    requests:
+        The number of generation requests received.
+    hits:
+        The number of generation requests answered from the cache, including
+        those that shared the result of an identical pending request.
+    errors:
+        The number of generation requests for invalid input files.
+
+    === Private Attributes ===
+    _executor:
+        The pool of worker processes proofs are rendered on.
+    _cache_size:
+        The maximum number of responses kept in <_cache>.
+    _cache:
+        The most recent responses, by request hash, least recent first.
+    _pending:
+        The responses being rendered, by request hash.
+    _queued:
+        The number of requests submitted to the workers and not yet finished.
+    _latencies:
+        The wall times of the most recent generation requests, in seconds.
+    _server:
+        The asyncio server, once started.
+    """
+    requests: int
+    hits: int
+    errors: int
+    _executor: ProcessPoolExecutor
+    _cache_size: int
+    _cache: OrderedDict
+    _pending: Dict[str, asyncio.Future]
+    _queued: int
+    _latencies: Deque[float]
+    _server: Optional[asyncio.AbstractServer]
+
+    def __init__(self, workers: Optional[int] = None,
+                 cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """Initialize this ProofServer, with a pool of <workers> processes (by
+        default, one per CPU), caching up to <cache_size> responses."""
+        self.requests = 0
+        self.hits = 0
+        self.errors = 0
+        self._executor = ProcessPoolExecutor(workers,
+                                             mp_context=_worker_context())
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._queued = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._server = None
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                    unix_path: Optional[str] = None) -> asyncio.AbstractServer:
+        """Start listening on <host>:<port> (port 0 picks a free port), or on
+        the Unix socket <unix_path> if it is given, and return the server."""
+        if unix_path:
+            self._server = await asyncio.start_unix_server(self._handle,
+                                                           unix_path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host,
+                                                      port)
+        return self._server
+
+    def port(self) -> int:
+        """Return the TCP port this server listens on."""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        """Stop listening, and shut down the worker processes."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown()
+
+    async def generate(self, spec: str, predicates: bool = False,
+                       opaque: bool = False,
+                       lifting: str = NESTED) -> Tuple[bool, str]:
+        """Return the result of render_request for the given request, from
+        the cache if possible."""
+        start = time.perf_counter()
+        self.requests += 1
+        key = request_key(spec, predicates, opaque, lifting)
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            result = self._cache[key]
+        elif key in self._pending:
+            self.hits += 1
+            result = await asyncio.shield(self._pending[key])
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, render_request,
+                                          spec, predicates, opaque, lifting)
+            self._pending[key] = future
+            self._queued += 1
+            try:
+                result = await future
+            finally:
+                self._queued -= 1
+                del self._pending[key]
+            self._cache[key] = result
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        if not result[0]:
+            self.errors += 1
+        self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return the metrics of this server, as a JSON-compatible
+        dictionary."""
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1,
+                                 int(fraction * len(latencies)))]
+
+        return {"requests": self.requests, "cache_hits": self.hits,
+                "errors": self.errors, "cached_responses": len(self._cache),
+                "queue_depth": self._queued,
+                "latency_seconds": {
+                    "count": len(latencies),
+                    "mean": sum(latencies) / len(latencies)
+                    if latencies else 0.0,
+                    "p50": percentile(0.5), "p95": percentile(0.95),
+                    "max": latencies[-1] if latencies else 0.0}}
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        """Answer the HTTP requests of a connection, until it is closed."""
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                try:
+                    status, content_type, content = \
+                        await self._dispatch(method, path, body)
+                except RequestError as e:
+                    status, content_type, content = \
+                        e.status, "application/json", \
+                        json.dumps({"error": str(e)})
+                except Exception as e:
+                    status, content_type, content = \
+                        500, "application/json", \
+                        json.dumps({"error": f"{type(e).__name__}: {e}"})
+                _write_response(writer, status, content_type, content,
+                                keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except RequestError as e:
+            _write_response(writer, e.status, "application/json",
+                            json.dumps({"error": str(e)}), False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str,
+                        body: bytes) -> Tuple[int, str, str]:
+        """Return the (status, content type, content) of the response to a
+        request."""
+        if path == "/health":
+            return 200, "text/plain", "ok"
+        if path == "/metrics":
+            return 200, "application/json", json.dumps(self.metrics())
+        if path != "/generate":
+            raise RequestError(404, f"no such endpoint: {path}")
+        if method != "POST":
+            raise RequestError(405, "use POST")
+        try:
+            options = json.loads(body)
+            spec = options["spec"]
+        except (ValueError, KeyError, TypeError):
+            raise RequestError(400, "expected a JSON object with a \"spec\"")
+        lifting = options.get("lifting", NESTED)
+        if not isinstance(spec, str) or lifting not in LIFTINGS:
+            raise RequestError(400, "invalid \"spec\" or \"lifting\"")
+        ok, text = await self.generate(spec, bool(options.get("predicates")),
+                                       bool(options.get("opaque")), lifting)
+        if not ok:
+            return 400, "application/json", json.dumps({"error": text})
+        return 200, "text/plain", text
+
+
+def _worker_context() -> multiprocessing.context.BaseContext:
+    """Return the context the worker processes are started with. Forked
+    workers would inherit the listening socket and the socket of the request
+    that started them, which would then never be seen as closed by the
+    client, so the workers are started by a fork server, or spawned where
+    there is none."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def request_key(spec: str, predicates: bool, opaque: bool,
+                lifting: str) -> str:
+    """Return a hash of a generation request."""
+    h = hashlib.sha256()
+    for part in [spec, str(predicates), str(opaque), lifting]:
+        encoded = part.encode()
+        h.update(f"{len(encoded)}:".encode() + encoded)
+    return h.hexdigest()
+
+
+async def _read_request(reader: asyncio.StreamReader) \
+        -> Optional[Tuple[str, str, bytes, bool]]:
+    """Read an HTTP request, and return its method, path, body and whether
+    the connection should be kept open, or None if the connection was
+    closed."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, version = line.decode("latin-1").split()
+    except ValueError:
+        raise RequestError(400, "malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise RequestError(400, "invalid Content-Length")
+    if length > MAX_BODY:
+        raise RequestError(413, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection == "keep-alive" if version == "HTTP/1.0" \
+        else connection != "close"
+    return method, path.split("?", 1)[0], body, keep_alive
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int,
+                    content_type: str, content: str,
+                    keep_alive: bool) -> None:
+    """Write an HTTP response to <writer>."""
+    body = content.encode()
+    head = f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n" \
+           f"Content-Type: {content_type}; charset=utf-8\r\n" \
+           f"Content-Length: {len(body)}\r\n" \
+           f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    writer.write(head.encode() + body)
+
+
+async def serve(host: str, port: int, unix_path: Optional[str],
+                workers: Optional[int], cache_size: int) -> None:
+    """Run a ProofServer until it is interrupted."""
+    server = ProofServer(workers, cache_size)
+    listener = await server.start(host, port, unix_path)
+    where = unix_path or f"http://{host}:{server.port()}"
+    print(f"Serving proofs on {where}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the server from the command line, and return the exit status."""
+    parser = argparse.ArgumentParser(
+        description="Serve homomorphism proof generation over HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket instead")
+    parser.add_argument("--workers", type=int,
+                        help="number of processes (default: one per core)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help="number of responses cached")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers,
+                          args.cache_size))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
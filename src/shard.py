@@ -0,0 +1,207 @@
+"""
+Write the proof of each function to a Dafny module file of its own.
+
+Usage:
+    python -m src.shard <input file> <directory> [--prelude <file>]
+                        [--prelude-module <name>] [--predicates] [--opaque]
+                        [--lifting nested|flat]
+
+The lifted function, join and lemmas of each function are written to
+<directory>/<function name>.dfy, in a module that includes and imports the
+modules of the functions it refers to (its aux functions and the functions
+called from its body and join), directly or not. An aggregator file, <directory>/proof.dfy,
+includes every module. Files whose contents do not change are not rewritten,
+so they keep their modification times, and the verifier only needs to check
+the modules that changed.
+
+The generated code relies on definitions such as seq2D and vAdd. Since a
+module cannot refer to the top-level declarations of another file, these must
+be placed in a module of the prelude file, named with --prelude-module.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import List, Callable, Optional, Dict
+
+from src.dafny import Function, NESTED, LIFTINGS, reachable
+from src.graph import referenced_names
+from src.program_loader import load_functions
+from src.proof_print import get_components, get_preamble, write_if_changed
+from src.syntax import Writer
+
+AGGREGATOR_NAME = "proof.dfy"
+# The module holding the declarations of the preamble, if there is one
+HELPERS_NAME = "ProofHelpers"
+
+
+def shard_name(func: Function) -> str:
+    """Return the name of the file holding the proof of <func>."""
+    return f"{func.name}.dfy"
+
+
+def module_name(func: Function) -> str:
+    """Return the name of the module holding the proof of <func>."""
+    return f"{func.name}Module"
+
+
+class ShardError(Exception):
+    """A module file would refer to a declaration that it cannot resolve."""
+
+
+def render_module(name: str, includes: List[str], imports: List[str],
+                  declarations: List[str]) -> str:
+    """Return the text of a file that includes the files in <includes>, and
+    declares the module <name>, which imports the modules in <imports> and
+    contains <declarations>."""
+    out = Writer()
+    for include in includes:
+        out.write(f'include "{include}"')
+    if includes:
+        out.write("")
+    out.write(f"module {name} {{")
+    out.indent()
+    for module in imports:
+        out.write(f"import opened {module}")
+    for declaration in declarations:
+        out.write("")
+        out.write(declaration)
+    out.dedent()
+    out.write("}")
+    return out.getvalue() + "\n"
+
+
+def render_shard(func: Function, components: List[Callable],
+                 prelude_includes: List[str],
+                 prelude_imports: List[str]) -> str:
+    """Return the text of the module file of <func>, with the declarations
+    rendered by <components>. The module also includes the files in
+    <prelude_includes> and imports the modules in <prelude_imports>."""
+    declarations = [text for text in (component(func)
+                                      for component in components) if text]
+    includes = prelude_includes + [shard_name(ref)
+                                   for ref in func.references()]
+    imports = prelude_imports + [module_name(ref)
+                                 for ref in dependencies(func)]
+    return render_module(module_name(func), includes, imports, declarations)
+
+
+def dependencies(func: Function) -> List[Function]:
+    """Return the functions whose modules the module of <func> imports: the
+    functions it refers to, directly or not."""
+    return reachable(func.references(), Function.references, {func.name})
+
+
+def check_shard(func: Function, text: str,
+                funcs: Dict[str, Function]) -> List[str]:
+    """Return a description of each reason why the module file <text> of
+    <func> does not resolve, given the functions <funcs> that have a module,
+    by name: a function it imports has no module, a function or join of
+    <funcs> is named in <text> but its module is not imported, or the module
+    imports itself, directly or not."""
+    problems = []
+    imported = {}
+    for cur in dependencies(func):
+        imported[cur.name] = cur
+        if cur.name not in funcs:
+            problems.append(f"{shard_name(func)}: {cur.name} has no module")
+    if any(func.name == ref.name for cur in [func] + list(imported.values())
+           for ref in cur.references()):
+        problems.append(f"{shard_name(func)}: {module_name(func)} imports "
+                        f"itself")
+    owners = {}
+    for cur in funcs.values():
+        owners[cur.name] = cur
+        owners[f"{cur.name}Join"] = cur
+    for name in referenced_names([text], owners):
+        owner = owners[name]
+        if owner.name != func.name and owner.name not in imported:
+            problems.append(f"{shard_name(func)}: {name} is used, but "
+                            f"{module_name(owner)} is not imported")
+    return problems
+
+
+def write_shards(funcs: List[Function], directory: str,
+                 components: Optional[List[Callable]] = None,
+                 preamble: str = "", prelude: Optional[str] = None,
+                 prelude_module: Optional[str] = None) -> List[str]:
+    """Write the module file of each function in <funcs> to <directory>,
+    followed by the aggregator file, and return the names of the files that
+    were written because their contents changed.
+    The declarations of each module are rendered by <components>, and
+    <preamble> is placed in a module of its own, imported by every module.
+    If given, the file <prelude> is included in every module, and the module
+    <prelude_module> is imported by every module.
+    Raise a ShardError, before any file is written, if a module file does
+    not resolve (see check_shard)."""
+    components = components or get_components()
+    os.makedirs(directory, exist_ok=True)
+    includes = []
+    imports = []
+    if prelude:
+        includes.append(os.path.relpath(prelude, directory))
+    if prelude_module:
+        imports.append(prelude_module)
+
+    files = []
+    if preamble:
+        files.append((f"{HELPERS_NAME}.dfy",
+                      render_module(HELPERS_NAME, includes, [],
+                                    preamble.split("\n\n"))))
+        includes = includes + [f"{HELPERS_NAME}.dfy"]
+        imports = imports + [HELPERS_NAME]
+    available = {func.name: func for func in funcs}
+    problems = []
+    for func in funcs:
+        text = render_shard(func, components, includes, imports)
+        problems.extend(check_shard(func, text, available))
+        files.append((shard_name(func), text))
+    if problems:
+        raise ShardError("\n".join(problems))
+    aggregator = "".join(f'include "{name}"\n' for name, _ in files)
+    files.append((AGGREGATOR_NAME, aggregator))
+
+    written = []
+    for name, text in files:
+        path = os.path.join(directory, name)
+        if write_if_changed(path, text):
+            written.append(path)
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Write the sharded proof of an input file from the command line, and
+    return the exit status."""
+    parser = argparse.ArgumentParser(
+        description="Write the homomorphism proof of each function to a "
+                    "module file of its own.")
+    parser.add_argument("input", help="the input file")
+    parser.add_argument("directory", help="the directory of the module files")
+    parser.add_argument("--prelude", help="a file included by every module")
+    parser.add_argument("--prelude-module",
+                        help="a module of the prelude, imported by every "
+                             "module")
+    parser.add_argument("--predicates", action="store_true",
+                        help="require a predicate in associativity lemmas")
+    parser.add_argument("--opaque", action="store_true",
+                        help="make lifted functions and joins opaque")
+    parser.add_argument("--lifting", choices=LIFTINGS, default=NESTED,
+                        help="the lifting strategy")
+    args = parser.parse_args(argv)
+
+    funcs = load_functions(args.input, args.lifting)
+    try:
+        written = write_shards(funcs, args.directory,
+                               get_components(args.predicates, args.opaque),
+                               get_preamble(args.opaque), args.prelude,
+                               args.prelude_module)
+    except ShardError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"{len(written)} changed files written to {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
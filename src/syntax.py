@@ -0,0 +1,258 @@
+"""
+A small syntax tree for the Dafny code generated in format.py.
+
+A tree is rendered into a single buffer in one walk, with the indentation of
+nested blocks applied as the walk enters and leaves them.
+"""
+from __future__ import annotations
+
+from typing import List, Optional, Tuple
+
+from src.dafny import Dafny
+
+INDENT_AMOUNT = 4
+
+
+class Writer:
+    """A buffer of rendered lines.
+
+    === Private Attributes ===
+    _lines:
+        The lines written so far.
+    _prefix:
+        The indentation of the current line.
+    """
+    _lines: List[str]
+    _prefix: str
+
+    def __init__(self) -> None:
+        """Initialize this Writer with an empty buffer."""
+        self._lines = []
+        self._prefix = ""
+
+    def write(self, text: str) -> None:
+        """Write each line of <text> at the current indentation. Lines that
+        consist only of whitespace are not indented."""
+        for line in text.split("\n"):
+            self._lines.append(self._prefix + line if line.strip() else line)
+
+    def indent(self) -> None:
+        """Increase the indentation of the following lines."""
+        self._prefix += INDENT_AMOUNT * " "
+
+    def dedent(self) -> None:
+        """Decrease the indentation of the following lines."""
+        self._prefix = self._prefix[:-INDENT_AMOUNT]
+
+    def getvalue(self) -> str:
+        """Return the lines written so far, joined by newlines."""
+        return "\n".join(self._lines)
+
+
+class Node:
+    """A node of a Dafny syntax tree."""
+
+    def render(self, out: Writer) -> None:
+        """Write this Node to <out>."""
+        raise NotImplementedError
+
+
+class Line(Node):
+    """Text written as is (one or more lines).
+
+    === Public Attributes ===
+    text:
+        The text of this Line.
+    """
+    text: str
+
+    def __init__(self, text: str) -> None:
+        """Initialize this Line with the given text."""
+        self.text = text
+
+    def render(self, out: Writer) -> None:
+        out.write(self.text)
+
+
+class Blank(Node):
+    """An empty line."""
+
+    def render(self, out: Writer) -> None:
+        out.write("")
+
+
+class VarDecl(Node):
+    """A variable declaration.
+
+    === Public Attributes ===
+    name:
+        The name of the variable.
+    value:
+        The expression assigned to the variable.
+    """
+    name: str
+    value: str
+
+    def __init__(self, name: str, value: str) -> None:
+        """Initialize this VarDecl with the given information."""
+        self.name = name
+        self.value = value
+
+    def render(self, out: Writer) -> None:
+        out.write(f"{Dafny.VAR} {self.name} := {self.value};")
+
+
+class Assert(Node):
+    """An assert statement.
+
+    === Public Attributes ===
+    expr:
+        The asserted expression.
+    """
+    expr: str
+
+    def __init__(self, expr: str) -> None:
+        """Initialize this Assert with the given expression."""
+        self.expr = expr
+
+    def render(self, out: Writer) -> None:
+        out.write(f"{Dafny.ASRT} {self.expr};")
+
+
+class Call(Node):
+    """A call statement, such as a call to a lemma.
+
+    === Public Attributes ===
+    name:
+        The name of the callee.
+    args:
+        The arguments of the call.
+    """
+    name: str
+    args: List[str]
+
+    def __init__(self, name: str, args: List[str]) -> None:
+        """Initialize this Call with the given information."""
+        self.name = name
+        self.args = args
+
+    def render(self, out: Writer) -> None:
+        out.write(f"{self.name}({', '.join(self.args)});")
+
+
+class Reveal(Node):
+    """A reveal statement, which makes the definitions of opaque functions
+    visible to the verifier.
+
+    === Public Attributes ===
+    names:
+        The names of the revealed functions.
+    """
+    names: List[str]
+
+    def __init__(self, names: List[str]) -> None:
+        """Initialize this Reveal with the given function names."""
+        self.names = names
+
+    def render(self, out: Writer) -> None:
+        revealed = ", ".join(f"{name}()" for name in self.names)
+        out.write(f"{Dafny.REVEAL} {revealed};")
+
+
+class Block(Node):
+    """A block of statements between braces.
+
+    === Public Attributes ===
+    statements:
+        The statements in this Block.
+    inline:
+        Whether this Block is written as "{}" at the end of the line that
+        precedes it. Only empty Blocks are written inline.
+    """
+    statements: List[Node]
+    inline: bool
+
+    def __init__(self, statements: List[Node], inline: bool = False) -> None:
+        """Initialize this Block with the given information."""
+        self.statements = statements
+        self.inline = inline and not statements
+
+    def render(self, out: Writer) -> None:
+        out.write("{")
+        out.indent()
+        for statement in self.statements:
+            statement.render(out)
+        out.dedent()
+        out.write("}")
+
+
+class If(Node):
+    """An if statement, with any number of "else if" branches and an optional
+    "else" branch.
+
+    === Public Attributes ===
+    branches:
+        A list of (<condition>, <block>) pairs, one for the "if" branch and one
+        for each "else if" branch.
+    otherwise:
+        The block of the "else" branch, or None if there is none.
+    """
+    branches: List[Tuple[str, Block]]
+    otherwise: Optional[Block]
+
+    def __init__(self, branches: List[Tuple[str, Block]],
+                 otherwise: Optional[Block] = None) -> None:
+        """Initialize this If with the given information."""
+        self.branches = branches
+        self.otherwise = otherwise
+
+    def render(self, out: Writer) -> None:
+        for i, (condition, block) in enumerate(self.branches):
+            keyword = Dafny.IF if i == 0 else Dafny.ELSEIF
+            if block.inline:
+                out.write(f"{keyword} {condition} {{}}")
+            else:
+                out.write(f"{keyword} {condition} ")
+                block.render(out)
+        if self.otherwise is not None:
+            out.write(Dafny.ELSE)
+            self.otherwise.render(out)
+
+
+class Declaration(Node):
+    """A top-level declaration: a function or a lemma.
+
+    === Public Attributes ===
+    signature:
+        The signature of the declaration.
+    clauses:
+        The specification clauses ("decreases", "requires", "ensures") of the
+        declaration, in order.
+    body:
+        The body of the declaration.
+    """
+    signature: str
+    clauses: List[str]
+    body: Block
+
+    def __init__(self, signature: str, clauses: List[str],
+                 body: Block) -> None:
+        """Initialize this Declaration with the given information."""
+        self.signature = signature
+        self.clauses = clauses
+        self.body = body
+
+    def render(self, out: Writer) -> None:
+        out.write(self.signature)
+        out.indent()
+        for clause in self.clauses:
+            out.write(clause)
+        out.dedent()
+        self.body.render(out)
+
+
+def render(node: Node) -> str:
+    """Return the Dafny code represented by <node>."""
+    out = Writer()
+    node.render(out)
+    return out.getvalue()
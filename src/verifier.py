@@ -0,0 +1,279 @@
+"""
+Verify generated declarations one at a time, caching the verdicts.
+
+Usage:
+    python -m src.verifier <output file> [--prelude <file>]
+                           [--command <command>] [--cache <file>]
+                           [--timeout <seconds>] [--max-entries <n>]
+                           [--max-age <seconds>]
+
+Each declaration of the output file is verified in a job file of its own,
+which contains the prelude (the definitions the generated code relies on, such
+as seq2D and vAdd), the declarations it depends on (marked {:verify false}) and
+the declaration itself. Declarations whose text, dependencies and prelude have
+already been verified are skipped.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Dict, Optional
+
+from src.declarations import Declaration, dependency_closure, \
+    split_declarations
+
+# The verifier command. "{file}" is replaced by the name of the file to verify
+DEFAULT_COMMAND = ["dafny", "verify", "{file}"]
+DEFAULT_CACHE = ".verification_cache.json"
+
+VERIFIED = "verified"
+FAILED = "failed"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+_UNVERIFIED_HEADER = re.compile(r"^(\w+)\s")
+
+
+class Verdict:
+    """The result of verifying a declaration.
+
+    === Public Attributes ===
+    status:
+        One of VERIFIED, FAILED, TIMEOUT or ERROR (if the verifier could not be
+        run).
+    elapsed:
+        The wall time taken by the verifier, in seconds.
+    output:
+        The output of the verifier.
+    cached:
+        Whether this Verdict was read from a cache instead of being computed.
+    """
+    status: str
+    elapsed: float
+    output: str
+    cached: bool
+
+    def __init__(self, status: str, elapsed: float, output: str = "",
+                 cached: bool = False) -> None:
+        """Initialize this Verdict with the given information."""
+        self.status = status
+        self.elapsed = elapsed
+        self.output = output
+        self.cached = cached
+
+    def __str__(self) -> str:
+        """Return a short description of this Verdict."""
+        source = "cached" if self.cached else f"{self.elapsed:.2f}s"
+        return f"{self.status} ({source})"
+
+
+def run_verifier(file_name: str, command: Optional[List[str]] = None,
+                 timeout: Optional[float] = None) -> Verdict:
+    """Run the verifier <command> on the file named <file_name>, and return
+    its verdict. Every "{file}" in <command> is replaced by <file_name>; if
+    there is none, <file_name> is appended to <command>. The verifier is
+    assumed to exit with status 0 if and only if verification succeeded."""
+    command = command or DEFAULT_COMMAND
+    if any("{file}" in arg for arg in command):
+        args = [arg.replace("{file}", file_name) for arg in command]
+    else:
+        args = command + [file_name]
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(args, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, text=True,
+                              timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout or ""
+        if isinstance(output, bytes):
+            output = output.decode(errors="replace")
+        return Verdict(TIMEOUT, time.perf_counter() - start, output)
+    except OSError as e:
+        return Verdict(ERROR, time.perf_counter() - start, str(e))
+    status = VERIFIED if proc.returncode == 0 else FAILED
+    return Verdict(status, time.perf_counter() - start, proc.stdout)
+
+
+def make_job(decl: Declaration, by_name: Dict[str, Declaration],
+             order: List[str], prelude: str = "") -> str:
+    """Return a Dafny program that verifies only <decl>. The program contains
+    <prelude>, every declaration <decl> depends on (in the order given by
+    <order>), with verification turned off, and <decl> itself.
+    <by_name> maps the name of each declaration to it."""
+    closure = dependency_closure(decl, by_name)
+    parts = [prelude.rstrip("\n")] if prelude.strip() else []
+    for name in order:
+        if name in closure:
+            parts.append(_UNVERIFIED_HEADER.sub(r"\1 {:verify false} ",
+                                                by_name[name].text, count=1))
+    parts.append(decl.text)
+    return "\n\n".join(parts) + "\n"
+
+
+def fingerprint(decl: Declaration, by_name: Dict[str, Declaration],
+                prelude: str = "", command: Optional[List[str]] = None) -> str:
+    """Return a fingerprint of <decl>, which changes whenever the text of
+    <decl> or of any declaration it depends on, <prelude> or the verifier
+    <command> changes."""
+    h = hashlib.sha256()
+    texts = [decl.text] + sorted(by_name[name].text
+                                 for name in dependency_closure(decl, by_name))
+    for part in texts + [prelude, " ".join(command or DEFAULT_COMMAND)]:
+        encoded = part.encode()
+        h.update(f"{len(encoded)}:".encode() + encoded)
+    return h.hexdigest()
+
+
+class VerificationCache:
+    """A cache of verdicts, keyed by declaration fingerprint.
+
+    === Public Attributes ===
+    file_name:
+        The name of the file the cache is stored in.
+    max_entries:
+        The maximum number of verdicts kept, or None for no limit.
+    max_age:
+        The maximum time in seconds a verdict is kept after it was last used,
+        or None for no limit.
+
+    === Private Attributes ===
+    _entries:
+        A dictionary mapping each fingerprint to a dictionary with the keys
+        "status", "elapsed" and "used" (the time the verdict was last used).
+    """
+    file_name: str
+    max_entries: Optional[int]
+    max_age: Optional[float]
+    _entries: Dict[str, Dict]
+
+    def __init__(self, file_name: str = DEFAULT_CACHE,
+                 max_entries: Optional[int] = None,
+                 max_age: Optional[float] = None) -> None:
+        """Initialize this VerificationCache, loading the verdicts stored in
+        <file_name> if it exists."""
+        self.file_name = file_name
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = {}
+        if os.path.exists(file_name):
+            try:
+                with open(file_name, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def __len__(self) -> int:
+        """Return the number of verdicts in this cache."""
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Verdict]:
+        """Return the verdict cached for the fingerprint <key>, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entry["used"] = time.time()
+        return Verdict(entry["status"], entry["elapsed"], cached=True)
+
+    def put(self, key: str, verdict: Verdict) -> None:
+        """Record <verdict> for the fingerprint <key>."""
+        self._entries[key] = {"status": verdict.status,
+                              "elapsed": verdict.elapsed, "used": time.time()}
+
+    def evict(self) -> None:
+        """Remove verdicts older than <max_age>, then the least recently used
+        verdicts until at most <max_entries> remain."""
+        if self.max_age is not None:
+            oldest = time.time() - self.max_age
+            self._entries = {key: entry for key, entry in self._entries.items()
+                             if entry["used"] >= oldest}
+        if self.max_entries is not None and \
+                len(self._entries) > self.max_entries:
+            keep = sorted(self._entries, key=lambda k: self._entries[k]["used"],
+                          reverse=True)[:self.max_entries]
+            self._entries = {key: self._entries[key] for key in keep}
+
+    def save(self) -> None:
+        """Evict old verdicts, and write the rest to <file_name>."""
+        self.evict()
+        temp_name = f"{self.file_name}.{os.getpid()}.tmp"
+        with open(temp_name, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(temp_name, self.file_name)
+
+
+def verify_declarations(decls: List[Declaration],
+                        cache: Optional[VerificationCache] = None,
+                        command: Optional[List[str]] = None,
+                        prelude: str = "",
+                        timeout: Optional[float] = None) -> Dict[str, Verdict]:
+    """Verify each generated declaration in <decls> separately, and return a
+    dictionary mapping the name of each declaration to its verdict.
+    Declarations with a VERIFIED verdict in <cache> are not verified again,
+    and new verdicts are recorded in <cache>."""
+    by_name = {decl.name: decl for decl in decls}
+    order = [decl.name for decl in decls]
+    verdicts = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for decl in decls:
+            if not decl.component:
+                continue
+            key = fingerprint(decl, by_name, prelude, command)
+            verdict = cache.get(key) if cache is not None else None
+            if verdict is None or verdict.status != VERIFIED:
+                job_name = os.path.join(directory, f"{decl.name}.dfy")
+                with open(job_name, "w") as f:
+                    f.write(make_job(decl, by_name, order, prelude))
+                verdict = run_verifier(job_name, command, timeout)
+                if cache is not None and verdict.status != ERROR:
+                    cache.put(key, verdict)
+            verdicts[decl.name] = verdict
+    return verdicts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the caching verifier from the command line, and return the exit
+    status."""
+    parser = argparse.ArgumentParser(
+        description="Verify the declarations of a generated proof one at a "
+                    "time, skipping those that were already verified.")
+    parser.add_argument("output", help="the generated Dafny file")
+    parser.add_argument("--prelude", help="a Dafny file with the definitions "
+                                          "the generated code relies on")
+    parser.add_argument("--command", default=" ".join(DEFAULT_COMMAND),
+                        help="the verifier command; {file} is replaced by the "
+                             "file to verify")
+    parser.add_argument("--cache", default=DEFAULT_CACHE,
+                        help=f"the cache file (default: {DEFAULT_CACHE})")
+    parser.add_argument("--timeout", type=float,
+                        help="time limit per declaration, in seconds")
+    parser.add_argument("--max-entries", type=int,
+                        help="the maximum number of cached verdicts")
+    parser.add_argument("--max-age", type=float,
+                        help="the maximum age of a cached verdict, in seconds")
+    args = parser.parse_args(argv)
+
+    with open(args.output, "r") as f:
+        decls = split_declarations(f.read())
+    prelude = ""
+    if args.prelude:
+        with open(args.prelude, "r") as f:
+            prelude = f.read()
+    cache = VerificationCache(args.cache, args.max_entries, args.max_age)
+    verdicts = verify_declarations(decls, cache, shlex.split(args.command),
+                                   prelude, args.timeout)
+    cache.save()
+    for name, verdict in verdicts.items():
+        print(f"{name}: {verdict}")
+    return 0 if all(v.status == VERIFIED for v in verdicts.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Regenerate proofs whenever their input files change.
+
+Usage:
+    python -m src.watch <directory or input file> ... [--output-name <name>]
+                        [--interval <seconds>] [--debounce <seconds>]
+
+Input files, and the files they import, are polled for changes. Once they
+have stopped changing for the debounce period, the input file is parsed again
+and its proof is regenerated, reusing the rendered proof components of every
+function that did not change. The output file is only rewritten if its
+contents change.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from typing import List, Optional, Dict, Tuple
+
+from src.batch import INPUT_NAME, OUTPUT_NAME, find_inputs, make_jobs
+from src.dafny import Function, NESTED
+from src.incremental import FragmentCache
+from src.program_loader import load_file, imported_closure
+from src.proof_print import render_all, write_if_changed
+
+DEFAULT_INTERVAL = 0.02
+DEFAULT_DEBOUNCE = 0.05
+
+
+class WatchedInput:
+    """An input file watched for changes.
+
+    === Public Attributes ===
+    input_name:
+        The name of the input file.
+    output_name:
+        The name of the output file.
+    cache:
+        The rendered proof components of the functions of the input file,
+        kept in memory.
+    stamps:
+        A dictionary mapping the input file and each file it imports
+        (directly or not) when it was last loaded to its (modification time,
+        size) when it was last polled, or None if it could not be read.
+    digest:
+        A hash of the contents of the files in <stamps> when the input file
+        was last loaded.
+    changed_at:
+        The time at which a change to one of the files was last seen, or None
+        if the proof is up to date.
+    """
+    input_name: str
+    output_name: str
+    cache: FragmentCache
+    stamps: Dict[str, Optional[Tuple[int, int]]]
+    digest: str
+    changed_at: Optional[float]
+
+    def __init__(self, input_name: str, output_name: str) -> None:
+        """Initialize this WatchedInput. The input file has not been loaded
+        yet."""
+        self.input_name = input_name
+        self.output_name = output_name
+        self.cache = FragmentCache()
+        self.stamps = {input_name: None}
+        self.digest = ""
+        self.changed_at = None
+
+
+class Watcher:
+    """Regenerates the proofs of a set of input files whenever they change.
+
+    === Public Attributes ===
+    interval:
+        The time between two polls of the input files, in seconds.
+    debounce:
+        The time an input file must stop changing for before its proof is
+        regenerated, in seconds.
+
+    === Private Attributes ===
+    _inputs:
+        A dictionary mapping the name of each watched input file to it.
+    """
+    interval: float
+    debounce: float
+    _inputs: Dict[str, WatchedInput]
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL,
+                 debounce: float = DEFAULT_DEBOUNCE) -> None:
+        """Initialize this Watcher with no input files."""
+        self.interval = interval
+        self.debounce = debounce
+        self._inputs = {}
+
+    def add(self, input_name: str, output_name: str) -> None:
+        """Watch the input file <input_name>, writing its proof to
+        <output_name>. The proof is generated immediately."""
+        watched = WatchedInput(input_name, output_name)
+        self._inputs[input_name] = watched
+        watched.stamps = {input_name: _stamp(input_name)}
+        self.regenerate(watched)
+
+    def inputs(self) -> List[WatchedInput]:
+        """Return the watched input files."""
+        return list(self._inputs.values())
+
+    def poll(self) -> List[WatchedInput]:
+        """Check every input file, and the files it imports, for changes
+        once, regenerate the proofs of those that stopped changing for the
+        debounce period, and return them."""
+        now = time.monotonic()
+        regenerated = []
+        for watched in self._inputs.values():
+            stamps = {name: _stamp(name) for name in watched.stamps}
+            if stamps != watched.stamps:
+                watched.stamps = stamps
+                watched.changed_at = now
+            elif watched.changed_at is not None and \
+                    now - watched.changed_at >= self.debounce:
+                watched.changed_at = None
+                if stamps[watched.input_name] is not None and \
+                        self.regenerate(watched):
+                    regenerated.append(watched)
+        return regenerated
+
+    def regenerate(self, watched: WatchedInput) -> bool:
+        """Load the input file of <watched> again and regenerate its proof, if
+        the contents of the input file or of a file it imports changed.
+        Return whether one of them changed. Errors in the input files are
+        printed, and the previous proof is kept."""
+        start = time.perf_counter()
+        try:
+            funcs, file_names = _load(watched.input_name)
+            digest = _digest(file_names)
+        except Exception as e:
+            print(f"{watched.input_name}: {e}")
+            return False
+        watched.stamps = {name: watched.stamps.get(name, _stamp(name))
+                          for name in file_names}
+        if digest == watched.digest:
+            return False
+        watched.digest = digest
+        text = "".join(render_all(funcs, watched.cache))
+        # Forget the components of functions that no longer exist
+        watched.cache.save()
+        written = write_if_changed(watched.output_name, text)
+        elapsed = (time.perf_counter() - start) * 1000
+        status = "regenerated" if written else "unchanged"
+        print(f"{watched.input_name}: {status} {watched.output_name} "
+              f"({elapsed:.1f} ms)")
+        return True
+
+    def run(self, max_polls: Optional[int] = None) -> None:
+        """Poll the input files until interrupted, or <max_polls> times."""
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            self.poll()
+            polls += 1
+            time.sleep(self.interval)
+
+
+def _load(input_name: str) -> Tuple[List[Function], List[str]]:
+    """Return the functions of the input file <input_name>, as returned by
+    load_functions, and the names of the input file and of every file it
+    imports, directly or not."""
+    files = {}
+    loaded = load_file(input_name, NESTED, files)
+    names = [input_name] + [name for name in files
+                            if name != os.path.abspath(input_name)]
+    return imported_closure(loaded) + loaded.functions, names
+
+
+def _digest(file_names: List[str]) -> str:
+    """Return a hash of the contents of the files <file_names>."""
+    h = hashlib.sha256()
+    for name in file_names:
+        with open(name, "rb") as f:
+            data = f.read()
+        h.update(f"{name}:{len(data)}:".encode() + data)
+    return h.hexdigest()
+
+
+def _stamp(file_name: str) -> Optional[Tuple[int, int]]:
+    """Return the (modification time, size) of the file <file_name>, or None
+    if it does not exist."""
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the watcher from the command line, and return the exit status."""
+    parser = argparse.ArgumentParser(
+        description="Regenerate homomorphism proofs whenever their input "
+                    "files change.")
+    parser.add_argument("paths", nargs="+",
+                        help=f"input files, or directories in which every "
+                             f"{INPUT_NAME} file is watched")
+    parser.add_argument("--output-name", default=OUTPUT_NAME,
+                        help=f"name of the output files, written beside the "
+                             f"input files (default: {OUTPUT_NAME})")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help="time between polls, in seconds")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE,
+                        help="time an input file must stop changing for "
+                             "before it is regenerated, in seconds")
+    args = parser.parse_args(argv)
+
+    inputs = []
+    for path in args.paths:
+        inputs.extend(find_inputs(path) if os.path.isdir(path) else [path])
+    watcher = Watcher(args.interval, args.debounce)
+    for input_name, output_name in make_jobs(inputs, args.output_name):
+        watcher.add(input_name, output_name)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
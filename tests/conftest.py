@@ -0,0 +1,75 @@
+"""
+Fixtures shared by the tests: the declarations of an example proof, and a stub
+verifier (tests/stub_verifier.py) to verify them with.
+"""
+import json
+import os
+import sys
+from typing import List, Dict, Any, Tuple
+
+import pytest
+
+from src.declarations import Declaration, get_declarations
+from src.program_loader import load_functions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB = os.path.join(ROOT, "tests", "stub_verifier.py")
+# The input file of each example, by name
+EXAMPLE_INPUTS = {name: os.path.join(ROOT, "examples", f"{name}_example",
+                                     "example_input.txt")
+                  for name in ["mts", "mtlr", "ml"]}
+MTS_INPUT = EXAMPLE_INPUTS["mts"]
+
+
+class StubVerifier:
+    """A stub verifier whose behaviour is set for each declaration.
+
+    === Public Attributes ===
+    spec_name:
+        The name of the file describing the behaviour of each declaration.
+    log_name:
+        The name of the file each run of the stub is logged to.
+    """
+    spec_name: str
+    log_name: str
+
+    def __init__(self, directory: str) -> None:
+        """Initialize this StubVerifier, with its files in <directory>. Every
+        declaration verifies at once."""
+        self.spec_name = os.path.join(directory, "spec.json")
+        self.log_name = os.path.join(directory, "log.txt")
+        self.set({})
+
+    def set(self, spec: Dict[str, Dict[str, Any]]) -> None:
+        """Set the behaviour of each declaration in <spec>, as described in
+        tests/stub_verifier.py."""
+        with open(self.spec_name, "w") as f:
+            json.dump(spec, f)
+
+    def command(self, limited: bool = False) -> List[str]:
+        """Return the verifier command, which passes the time limit to the
+        stub if <limited> is True."""
+        command = [sys.executable, STUB, self.spec_name, self.log_name,
+                   "{file}"]
+        return command + ["{timeout}"] if limited else command
+
+    def runs(self) -> List[Tuple[str, float]]:
+        """Return the name of the declaration and the time limit of each run
+        so far, in order."""
+        if not os.path.exists(self.log_name):
+            return []
+        with open(self.log_name, "r") as f:
+            return [(name, float(limit))
+                    for name, limit in (line.split() for line in f)]
+
+
+@pytest.fixture
+def stub(tmp_path) -> StubVerifier:
+    """Return a stub verifier, with its files in a temporary directory."""
+    return StubVerifier(str(tmp_path))
+
+
+@pytest.fixture
+def mts_declarations() -> List[Declaration]:
+    """Return the declarations of the proof of the Mts example."""
+    return get_declarations(load_functions(MTS_INPUT))
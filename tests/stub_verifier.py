@@ -0,0 +1,51 @@
+"""
+A stand-in for the Dafny verifier, for testing src.verifier and src.scheduler
+without Dafny.
+
+Usage:
+    python tests/stub_verifier.py <spec file> <log file> <job file> [<limit>]
+
+The declaration verified by the job file is the last one that is not marked
+{:verify false}. The spec file is a JSON object that maps the name of a
+declaration to its behaviour, with the optional keys:
+    "seconds": the time taken to verify it (default: 0);
+    "needs":   the smallest time limit, in seconds, with which it verifies;
+               with a smaller <limit> (other than 0, for no limit), the stub
+               reports "timed out" at once;
+    "fail":    whether it fails to verify.
+Each run appends the name of the declaration and <limit> to the log file.
+"""
+import json
+import re
+import sys
+import time
+
+_HEADER = re.compile(r"^\w+ (\{:verify false\} )?([\w']+)", re.MULTILINE)
+
+
+def main() -> int:
+    """Verify the job file, as described by the spec file, and return the
+    exit status."""
+    spec_name, log_name, job_name = sys.argv[1:4]
+    limit = float(sys.argv[4]) if len(sys.argv) > 4 else 0.0
+    with open(job_name, "r") as f:
+        headers = _HEADER.findall(f.read())
+    name = [name for unverified, name in headers if not unverified][-1]
+    with open(spec_name, "r") as f:
+        behaviour = json.load(f).get(name, {})
+    with open(log_name, "a") as f:
+        f.write(f"{name} {limit:g}\n")
+
+    if limit and behaviour.get("needs", 0) > limit:
+        print(f"{name}: verification timed out")
+        return 4
+    time.sleep(behaviour.get("seconds", 0))
+    if behaviour.get("fail"):
+        print(f"{name}: assertion might not hold")
+        return 1
+    print(f"{name}: verified")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
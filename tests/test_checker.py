@@ -0,0 +1,92 @@
+"""Tests of src/evaluate.py and src/checker.py."""
+import os
+
+import numpy as np
+import pytest
+
+from src.checker import HOM, JoinCheckError, check_functions
+from src.evaluate import EvalError, Evaluator, to_text
+from src.program_loader import generate_proof, load_functions
+
+from tests.conftest import EXAMPLE_INPUTS, MTS_INPUT
+
+# A join of Mts that forgets the sum of the left part
+WRONG_JOIN = "{Max(h.0, j.0)}"
+
+
+def _wrong_mts(tmp_path) -> str:
+    """Return the name of a copy of the Mts example with a wrong join."""
+    with open(MTS_INPUT, "r") as f:
+        text = f.read()
+    assert "{Max(j.0, h.0 + j.1)}" in text
+    name = str(tmp_path / "example_input.txt")
+    with open(name, "w") as f:
+        f.write(text.replace("{Max(j.0, h.0 + j.1)}", WRONG_JOIN))
+    return name
+
+
+def test_evaluates_mts():
+    funcs = load_functions(MTS_INPUT)
+    evaluator = Evaluator(funcs)
+    mts = next(func for func in funcs if func.name == "Mts")
+    rows = np.array([[1, -2, 3, -1], [-1, -1, -1, -1], [2, 0, -3, 1]])
+    value, total = evaluator.lifted(mts, rows)
+    # The maximum tail sum, and the sum
+    expected = [max(sum(row[i:]) for i in range(len(row) + 1))
+                for row in rows.tolist()]
+    assert value.tolist() == expected
+    assert total.tolist() == rows.sum(axis=1).tolist()
+    assert to_text((value, total), 0) == "(2, 1)"
+
+
+@pytest.mark.parametrize("example", sorted(EXAMPLE_INPUTS))
+def test_lifted_matches_prefix_evaluation(example):
+    funcs = load_functions(EXAMPLE_INPUTS[example])
+    evaluator = Evaluator(funcs)
+    rng = np.random.default_rng(1)
+    for func in funcs:
+        shape = (5, 4, 3) if func.param_types[0] == "seq2D" else (5, 4)
+        data = rng.integers(-3, 4, size=shape)
+        assert to_text(evaluator.lifted(func, data), 3) == \
+            to_text(evaluator.lifted_by_prefix(func, data), 3)
+
+
+def test_unsupported_syntax():
+    funcs = load_functions(MTS_INPUT)
+    funcs[0].body = funcs[0].body.replace("s[|s|-1]", "s[|s|-1] % 7")
+    with pytest.raises(EvalError):
+        Evaluator(funcs).compiled(funcs[0])
+
+
+@pytest.mark.parametrize("example", sorted(EXAMPLE_INPUTS))
+def test_accepts_example_joins(example):
+    results = check_functions(load_functions(EXAMPLE_INPUTS[example]),
+                              trials=200)
+    assert [str(result) for result in results if result.failed()] == []
+    assert all(result.cases > 0 for result in results)
+
+
+def test_rejects_wrong_join_with_minimal_counterexample(tmp_path):
+    results = check_functions(load_functions(_wrong_mts(tmp_path)))
+    by_name = {result.name: result for result in results}
+    assert not by_name["Sum"].failed()
+    assert by_name["Mts"].failed()
+    counterexample = by_name["Mts"].counterexamples[0]
+    assert counterexample.prop == HOM
+    assert counterexample.inputs == [("s", "[1]"), ("t", "[-1]")]
+    assert counterexample.left == ("Mts(s + t)", "(0, 0)")
+    assert counterexample.right == ("MtsJoin(Mts(s), Mts(t))", "(1, 0)")
+
+
+def test_generate_proof_rejects_wrong_join(tmp_path):
+    output_name = str(tmp_path / "output.dfy")
+    with pytest.raises(JoinCheckError) as info:
+        generate_proof(_wrong_mts(tmp_path), output_name, check_joins=True)
+    assert "s = [1], t = [-1]" in str(info.value)
+    assert not os.path.exists(output_name)
+
+
+def test_generate_proof_accepts_valid_joins(tmp_path):
+    output_name = str(tmp_path / "output.dfy")
+    generate_proof(MTS_INPUT, output_name, check_joins=True)
+    assert os.path.getsize(output_name) > 0
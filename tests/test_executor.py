@@ -0,0 +1,47 @@
+"""Tests of src/executor.py."""
+import numpy as np
+import pytest
+
+from src.evaluate import Value
+from src.executor import compile_functions, evaluate_sequential
+from src.program_loader import load_functions
+
+from tests.conftest import EXAMPLE_INPUTS
+
+# Row counts: empty, a single row, fewer rows than a chunk, and odd counts
+# that are not multiples of the chunk size
+SIZES = [0, 1, 3, 7, 13]
+CHUNK_ROWS = 4
+WIDTH = 3
+
+
+def _plain(value: Value):
+    """Return <value> as nested tuples and lists, to compare values."""
+    if isinstance(value, tuple):
+        return tuple(_plain(element) for element in value)
+    return np.asarray(value).tolist()
+
+
+@pytest.mark.parametrize("example", sorted(EXAMPLE_INPUTS))
+def test_parallel_matches_sequential(example):
+    funcs = load_functions(EXAMPLE_INPUTS[example])
+    rng = np.random.default_rng(2)
+    with compile_functions(funcs, workers=2,
+                           chunk_rows=CHUNK_ROWS) as compiled:
+        for func in funcs:
+            for rows in SIZES:
+                shape = (rows, WIDTH) if func.param_types[0] == "seq2D" \
+                    else (rows,)
+                data = rng.integers(-3, 4, size=shape)
+                expected = evaluate_sequential(func, data, funcs)
+                assert _plain(compiled[func.name].lifted(data)) == \
+                    _plain(expected), (func.name, rows)
+
+
+def test_value_is_the_function_result():
+    funcs = load_functions(EXAMPLE_INPUTS["mts"])
+    data = np.array([1, -2, 3, -1, 2, -5, 4])
+    with compile_functions(funcs, workers=2, chunk_rows=2) as compiled:
+        assert compiled["Sum"](data) == data.sum()
+        assert compiled["Mts"](data) == max(data[i:].sum()
+                                            for i in range(len(data) + 1))
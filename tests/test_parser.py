@@ -0,0 +1,95 @@
+"""Tests of src/parser.py, and of the functions loaded from its output."""
+import io
+import json
+import os
+
+import pytest
+
+from src.dafny import Function
+from src.parser import ParseError, parse_spec, Definition
+from src.program_loader import load_functions
+
+from tests.conftest import ROOT, EXAMPLE_INPUTS, MTS_INPUT
+
+# The fields of each function of the examples, as loaded by the S-expression
+# reader the parser replaced
+EXPECTED = os.path.join(ROOT, "tests", "example_functions.json")
+
+
+def _fields(func: Function) -> dict:
+    """Return the fields of <func> that are read from the input file."""
+    return {"name": func.name, "param_names": func.param_names,
+            "param_types": func.param_types,
+            "return_type": func.return_type.tuple_type[0].simple_type,
+            "decreases": func.decreases, "requires": func.requires,
+            "ensures": func.ensures, "aux": [aux.name for aux in func.aux],
+            "body": func.body, "join_param_names": func.join_param_names,
+            "join_body": func.join_body}
+
+
+def _error(tmp_path, old: str, new: str) -> str:
+    """Return the message of the ParseError raised when loading a copy of the
+    Mts example in which <old> is replaced by <new>, with the name of the copy
+    replaced by "input"."""
+    with open(MTS_INPUT, "r") as f:
+        text = f.read()
+    assert old in text
+    name = str(tmp_path / "example_input.txt")
+    with open(name, "w") as f:
+        f.write(text.replace(old, new))
+    with pytest.raises(ParseError) as info:
+        load_functions(name)
+    assert info.value.file_name == name
+    return str(info.value).replace(name, "input")
+
+
+@pytest.mark.parametrize("example", sorted(EXAMPLE_INPUTS))
+def test_examples_load_as_before(example):
+    with open(EXPECTED, "r") as f:
+        expected = json.load(f)[example]
+    funcs = load_functions(EXAMPLE_INPUTS[example])
+    assert [_fields(func) for func in funcs] == expected
+
+
+def test_definition_positions():
+    with open(MTS_INPUT, "r") as f:
+        items = list(parse_spec(f, MTS_INPUT))
+    definitions = [item for item in items if isinstance(item, Definition)]
+    assert [(item.name, item.line, item.column) for item in definitions] == \
+        [("Sum", 2, 1), ("Mts", 10, 1)]
+
+
+def test_code_spans_lines():
+    spec = "(definition F\n" \
+           "    (type (Dafny.SEQ) Dafny.INT)\n" \
+           "    (body (function (s) {if s == []\n" \
+           "        then 0 else F(s[..|s|-1])}))\n" \
+           "    (join (function (a b) {a}))\n" \
+           "    (decreases ()) (requires ()) (ensures ()) (aux ()))"
+    definition, = parse_spec(io.StringIO(spec))
+    assert definition.body == "if s == []\n        then 0 else F(s[..|s|-1])"
+    assert definition.join_body == "a"
+
+
+def test_unbalanced_paren(tmp_path):
+    # The definition of Mts is never closed
+    assert _error(tmp_path, "(aux (Sum)))", "(aux (Sum))") == \
+        "input:10:1: unmatched '('"
+
+
+def test_extra_paren(tmp_path):
+    assert _error(tmp_path, "(aux ()))", "(aux ())))") == \
+        "input:9:14: unmatched ')'"
+
+
+def test_unknown_type(tmp_path):
+    # The type of Mts, not of Sum
+    old = "(definition Mts\n    (type (Dafny.SEQ) Dafny.INT)"
+    assert _error(tmp_path, old, old.replace("INT", "FLOAT")) == \
+        "input:11:23: unknown type 'Dafny.FLOAT'"
+
+
+def test_unknown_aux(tmp_path):
+    # At the position of the definition of Mts
+    assert _error(tmp_path, "(aux (Sum))", "(aux (Total))") == \
+        "input:10:1: aux function Total of Mts is not defined"
@@ -0,0 +1,115 @@
+"""Tests of src/scheduler.py and src/profiler.py, with a stub verifier."""
+import os
+
+from src.profiler import time_declarations
+from src.scheduler import SKIPPED, DurationHistory, first_limit, schedule
+from src.verifier import FAILED, TIMEOUT, VERIFIED, VerificationCache
+
+
+def test_verifies_each_declaration(stub, mts_declarations, tmp_path):
+    history = DurationHistory(str(tmp_path / "history.json"))
+    verdicts = schedule(mts_declarations, command=stub.command(), workers=2,
+                        history=history)
+    assert list(verdicts) == [decl.name for decl in mts_declarations]
+    assert all(verdict.status == VERIFIED for verdict in verdicts.values())
+    assert all(history.get(name) is not None for name in verdicts)
+
+
+def test_dependencies_verified_first(stub, mts_declarations):
+    schedule(mts_declarations, command=stub.command(), workers=1,
+             history=DurationHistory(None))
+    order = [name for name, _ in stub.runs()]
+    for decl in mts_declarations:
+        for dependency in decl.dependencies:
+            assert order.index(dependency) < order.index(decl.name)
+
+
+def test_skips_dependents_of_failures(stub, mts_declarations):
+    stub.set({"MtsJoin": {"fail": True}})
+    verdicts = schedule(mts_declarations, command=stub.command(), workers=1,
+                        history=DurationHistory(None))
+    assert verdicts["MtsJoin"].status == FAILED
+    assert verdicts["MtsJoinAssoc"].status == SKIPPED
+    assert verdicts["HomMts"].status == SKIPPED
+    assert "MtsJoin did not verify" in verdicts["MtsJoinAssoc"].output
+    assert verdicts["HomSum"].status == VERIFIED
+    ran = {name for name, _ in stub.runs()}
+    assert "MtsJoinAssoc" not in ran and "HomMts" not in ran
+
+
+def test_longest_first(stub, mts_declarations):
+    history = DurationHistory(None)
+    history._seconds = {"Sum": 1.0, "SumJoin": 5.0}
+    schedule(mts_declarations, command=stub.command(), workers=1,
+             history=history)
+    assert [name for name, _ in stub.runs()][:2] == ["SumJoin", "Sum"]
+
+
+def test_longest_first_reversed(stub, mts_declarations):
+    history = DurationHistory(None)
+    history._seconds = {"Sum": 5.0, "SumJoin": 1.0}
+    schedule(mts_declarations, command=stub.command(), workers=1,
+             history=history)
+    assert [name for name, _ in stub.runs()][:2] == ["Sum", "SumJoin"]
+
+
+def test_timeout_escalation(stub, mts_declarations):
+    stub.set({"HomMts": {"needs": 3}})
+    history = DurationHistory(None)
+    verdicts = schedule(mts_declarations, command=stub.command(limited=True),
+                        workers=1, timeout=1, max_timeout=8, factor=2,
+                        history=history)
+    assert verdicts["HomMts"].status == VERIFIED
+    assert [limit for name, limit in stub.runs() if name == "HomMts"] == \
+        [1, 2, 4]
+    assert all(limit == 1 for name, limit in stub.runs() if name != "HomMts")
+
+
+def test_timeout_beyond_max_timeout(stub, mts_declarations):
+    stub.set({"HomMts": {"needs": 10}})
+    history = DurationHistory(None)
+    verdicts = schedule(mts_declarations, command=stub.command(limited=True),
+                        workers=1, timeout=1, max_timeout=4, factor=2,
+                        history=history)
+    assert verdicts["HomMts"].status == TIMEOUT
+    assert [limit for name, limit in stub.runs() if name == "HomMts"] == \
+        [1, 2, 4]
+    # The next run starts from the largest limit that was exceeded
+    assert first_limit(1, 4, 2, history.get("HomMts")) == 4
+
+
+def test_subprocess_timeout_escalation(stub, mts_declarations):
+    stub.set({"HomSum": {"seconds": 0.5}})
+    verdicts = schedule(mts_declarations, command=stub.command(), workers=1,
+                        timeout=0.2, max_timeout=2, factor=4,
+                        history=DurationHistory(None))
+    assert verdicts["HomSum"].status == VERIFIED
+    assert [name for name, _ in stub.runs()].count("HomSum") == 2
+
+
+def test_cache_hits(stub, mts_declarations, tmp_path):
+    cache = VerificationCache(str(tmp_path / "cache.json"))
+    schedule(mts_declarations, command=stub.command(), cache=cache,
+             history=DurationHistory(None))
+    runs = len(stub.runs())
+    verdicts = schedule(mts_declarations, command=stub.command(), cache=cache,
+                        history=DurationHistory(None))
+    assert all(verdict.cached for verdict in verdicts.values())
+    assert len(stub.runs()) == runs
+
+
+def test_profiler_history_is_explicit(stub, mts_declarations, tmp_path,
+                                      monkeypatch):
+    time_declarations(mts_declarations, command=stub.command(), workers=1)
+    default = [name for name, _ in stub.runs()]
+    os.remove(stub.log_name)
+
+    # A history file in the working directory, which would reverse the order
+    monkeypatch.chdir(tmp_path)
+    history = DurationHistory()
+    history._seconds = {name: float(i) for i, name in enumerate(default)}
+    history.save()
+    timings = time_declarations(mts_declarations, command=stub.command(),
+                                workers=1)
+    assert all(timing.status == VERIFIED for timing in timings)
+    assert [name for name, _ in stub.runs()] == default
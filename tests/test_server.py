@@ -0,0 +1,78 @@
+"""Tests of src/server.py, on localhost."""
+import asyncio
+import json
+from typing import Tuple, Optional
+
+from src.api import generate_text
+from src.server import ProofServer
+
+from tests.conftest import MTS_INPUT
+
+# The time a response may take, in seconds, before the test fails
+RESPONSE_TIMEOUT = 60
+
+
+async def _request(port: int, method: str, path: str,
+                   body: Optional[dict] = None) -> Tuple[int, str]:
+    """Send one request to the server on <port>, with "Connection: close", and
+    return the status and body of the response, read until the server closes
+    the connection."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n"
+                 .encode() + data)
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), RESPONSE_TIMEOUT)
+    writer.close()
+    head, _, content = response.decode().partition("\r\n\r\n")
+    return int(head.split()[1]), content
+
+
+async def _session(spec: str) -> Tuple[list, dict]:
+    """Return the responses to two identical generation requests for <spec>
+    made to a new server, and its metrics afterwards."""
+    server = ProofServer(workers=1)
+    await server.start(port=0)
+    try:
+        port = server.port()
+        responses = [await _request(port, "POST", "/generate",
+                                    {"spec": spec}) for _ in range(2)]
+        status, metrics = await _request(port, "GET", "/metrics")
+        assert status == 200
+    finally:
+        await server.close()
+    return responses, json.loads(metrics)
+
+
+def test_generate_miss_then_hit():
+    with open(MTS_INPUT, "r") as f:
+        spec = f.read()
+    responses, metrics = asyncio.run(_session(spec))
+    expected = generate_text(spec)
+    assert responses == [(200, expected), (200, expected)]
+    assert metrics["requests"] == 2
+    assert metrics["cache_hits"] == 1
+    assert metrics["errors"] == 0
+    assert metrics["cached_responses"] == 1
+    assert metrics["queue_depth"] == 0
+    assert metrics["latency_seconds"]["count"] == 2
+
+
+async def _invalid() -> Tuple[Tuple[int, str], Tuple[int, str]]:
+    """Return the responses of a new server to an invalid input file and to
+    an unknown endpoint."""
+    server = ProofServer(workers=1)
+    await server.start(port=0)
+    try:
+        return (await _request(server.port(), "POST", "/generate",
+                               {"spec": "(definition"}),
+                await _request(server.port(), "GET", "/nothing"))
+    finally:
+        await server.close()
+
+
+def test_errors():
+    invalid, missing = asyncio.run(_invalid())
+    assert invalid[0] == 400 and "error" in json.loads(invalid[1])
+    assert missing[0] == 404
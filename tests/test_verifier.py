@@ -0,0 +1,91 @@
+"""Tests of src/verifier.py, with a stub verifier."""
+import os
+import time
+
+from src.declarations import split_declarations
+from src.verifier import FAILED, VERIFIED, Verdict, VerificationCache, \
+    verify_declarations
+
+
+def test_verifies_each_declaration(stub, mts_declarations):
+    verdicts = verify_declarations(mts_declarations, command=stub.command())
+    assert list(verdicts) == [decl.name for decl in mts_declarations]
+    assert all(verdict.status == VERIFIED for verdict in verdicts.values())
+    assert sorted(name for name, _ in stub.runs()) == sorted(verdicts)
+
+
+def test_failure(stub, mts_declarations):
+    stub.set({"MtsJoin": {"fail": True}})
+    verdicts = verify_declarations(mts_declarations, command=stub.command())
+    assert verdicts["MtsJoin"].status == FAILED
+    assert verdicts["SumJoin"].status == VERIFIED
+
+
+def test_cache_hit(stub, mts_declarations, tmp_path):
+    cache_name = str(tmp_path / "cache.json")
+    cache = VerificationCache(cache_name)
+    verify_declarations(mts_declarations, cache, stub.command())
+    cache.save()
+    runs = len(stub.runs())
+
+    cache = VerificationCache(cache_name)
+    verdicts = verify_declarations(mts_declarations, cache, stub.command())
+    assert all(verdict.cached for verdict in verdicts.values())
+    assert len(stub.runs()) == runs
+
+
+def test_cache_miss_after_change(stub, mts_declarations, tmp_path):
+    cache = VerificationCache(str(tmp_path / "cache.json"))
+    verify_declarations(mts_declarations, cache, stub.command())
+    runs = len(stub.runs())
+
+    # Changing SumJoin changes the fingerprint of the declarations using it
+    text = "\n\n".join(decl.text.replace("a + b", "b + a")
+                       if decl.name == "SumJoin" else decl.text
+                       for decl in mts_declarations)
+    changed = [decl for decl in split_declarations(text) if decl.component]
+    verdicts = verify_declarations(changed, cache, stub.command())
+    rerun = {name for name, _ in stub.runs()[runs:]}
+    assert rerun == {"SumJoin", "MtsJoin", "SumJoinAssoc", "MtsJoinAssoc",
+                     "HomSum", "HomMts"}
+    assert verdicts["Sum"].cached and verdicts["Mts"].cached
+
+
+def test_failures_are_not_cache_hits(stub, mts_declarations, tmp_path):
+    stub.set({"HomMts": {"fail": True}})
+    cache = VerificationCache(str(tmp_path / "cache.json"))
+    verify_declarations(mts_declarations, cache, stub.command())
+    stub.set({})
+    runs = len(stub.runs())
+    verdicts = verify_declarations(mts_declarations, cache, stub.command())
+    assert [name for name, _ in stub.runs()[runs:]] == ["HomMts"]
+    assert verdicts["HomMts"].status == VERIFIED
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache_name = str(tmp_path / "cache.json")
+    cache = VerificationCache(cache_name, max_entries=2)
+    for key in ["a", "b", "c"]:
+        cache.put(key, Verdict(VERIFIED, 1.0))
+        time.sleep(0.01)
+    cache.get("a")
+    cache.save()
+
+    cache = VerificationCache(cache_name)
+    assert len(cache) == 2
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.get("b") is None
+
+
+def test_evicts_old_verdicts(tmp_path):
+    cache_name = str(tmp_path / "cache.json")
+    cache = VerificationCache(cache_name, max_age=60)
+    cache.put("old", Verdict(VERIFIED, 1.0))
+    cache.put("new", Verdict(VERIFIED, 1.0))
+    cache._entries["old"]["used"] -= 120
+    cache.save()
+
+    cache = VerificationCache(cache_name)
+    assert cache.get("old") is None
+    assert cache.get("new") is not None
+    assert os.path.exists(cache_name)